@@ -11,10 +11,28 @@ config = SimpleNamespace()
 # SOAR配置
 config.SOAR_API_URL = os.getenv('SOAR_API_URL', 'https://api.example-soar.com')
 config.SOAR_API_TOKEN = os.getenv('SOAR_API_TOKEN', 'your_soar_api_token')
-config.SOAR_API_TIMEOUT = int(os.getenv('SOAR_API_TIMEOUT', 30))
+config.SOAR_API_TIMEOUT = int(os.getenv('SOAR_API_TIMEOUT', 30))  # 读取超时时间(秒)
+config.SOAR_CONNECT_TIMEOUT = float(os.getenv('SOAR_CONNECT_TIMEOUT', 5))  # 连接超时时间(秒)
+config.SOAR_POOL_CONNECTIONS = int(os.getenv('SOAR_POOL_CONNECTIONS', 4))  # 连接池缓存的主机数
+config.SOAR_POOL_MAXSIZE = int(os.getenv('SOAR_POOL_MAXSIZE', 16))  # 每个主机保持的最大连接数
+config.SOAR_REQUEST_RETRIES = int(os.getenv('SOAR_REQUEST_RETRIES', 2))  # 单个请求失败后的最大重试次数
+config.SOAR_REQUEST_RETRY_BACKOFF = float(os.getenv('SOAR_REQUEST_RETRY_BACKOFF', 0.5))  # 第n次重试前等待 该值*2^n 秒
 config.SOAR_RETRY_COUNT = int(os.getenv('SOAR_RETRY_COUNT', 3))
 config.SOAR_RETRY_DELAY = int(os.getenv('SOAR_RETRY_DELAY', 5))
 config.SOAR_VERIFY_SSL = os.getenv('SOAR_VERIFY_SSL', 'True').lower() == 'true'
+config.SOAR_POLL_MIN_INTERVAL = float(os.getenv('SOAR_POLL_MIN_INTERVAL', 1))  # 剧本状态首次轮询间隔(秒)
+config.SOAR_POLL_MAX_INTERVAL = float(os.getenv('SOAR_POLL_MAX_INTERVAL', 15))  # 剧本状态最长轮询间隔(秒)
+config.SOAR_POLL_BACKOFF = float(os.getenv('SOAR_POLL_BACKOFF', 1.5))  # 每次轮询后间隔的增长倍数
+config.SOAR_ACTIVITY_TIMEOUT = float(os.getenv('SOAR_ACTIVITY_TIMEOUT', 600))  # 等待剧本执行完成的默认超时时间(秒)，只限制仍在执行的活动，SOAR返回失败状态时立即结束
+config.SOAR_PLAYBOOK_TIMEOUTS = os.getenv('SOAR_PLAYBOOK_TIMEOUTS', '')  # 各剧本的超时时间(秒)，格式: 剧本ID:秒数,剧本ID:秒数
+config.SOAR_CALLBACK_ENABLED = os.getenv('SOAR_CALLBACK_ENABLED', 'False').lower() == 'true'  # SOAR是否通过回调接口通知活动执行完成，启用后轮询只作为兜底
+config.SOAR_CALLBACK_TOKEN = os.getenv('SOAR_CALLBACK_TOKEN', '')  # 回调接口的认证令牌，为空时拒绝所有回调
+config.SOAR_CALLBACK_POLL_INTERVAL = float(os.getenv('SOAR_CALLBACK_POLL_INTERVAL', 60))  # 启用回调后兜底轮询的最短间隔(秒)
+config.SOAR_CALLBACK_CHECK_INTERVAL = float(os.getenv('SOAR_CALLBACK_CHECK_INTERVAL', 1))  # _executor检查已由回调记录结果的活动的间隔(秒)
+config.PLAYBOOK_STATS_WINDOW = int(os.getenv('PLAYBOOK_STATS_WINDOW', 50))  # 每个剧本保留最近多少次执行耗时用于计算p50/p90
+config.PLAYBOOK_STATS_MIN_SAMPLES = int(os.getenv('PLAYBOOK_STATS_MIN_SAMPLES', 5))  # 样本数达到多少后按p50决定首次轮询时间
+config.PLAYBOOK_CACHE_ENABLED = os.getenv('PLAYBOOK_CACHE_ENABLED', 'True').lower() == 'true'  # 是否缓存只读查询类剧本的结果（缓存时间见剧本目录中的cache_ttl）
+config.PLAYBOOK_CACHE_MAX_ENTRIES = int(os.getenv('PLAYBOOK_CACHE_MAX_ENTRIES', 1000))  # 剧本结果缓存的最大条目数
 
 # LLM配置
 config.LLM_BASE_URL = os.getenv('LLM_BASE_URL', 'https://dashscope.aliyuncs.com/compatible-mode/v1')
@@ -22,9 +40,60 @@ config.LLM_API_KEY = os.getenv('LLM_API_KEY', 'your_llm_api_key')
 config.LLM_MODEL = os.getenv('LLM_MODEL', 'qwen-plus')
 config.LLM_MODEL_LONG_TEXT = os.getenv('LLM_MODEL_LONG_TEXT', 'qwen-long')
 config.LLM_TEMPERATURE = float(os.getenv('LLM_TEMPERATURE', 0.6))
+config.LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 4))  # 每个进程同时进行的大模型请求数上限
+config.LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', 300))  # 大模型请求的连接和读取超时时间(秒)，避免无响应的请求一直占用并发名额
+
+# Captain配置
+config.CAPTAIN_WORKERS = int(os.getenv('CAPTAIN_WORKERS', 1))  # 并发处理事件的工作线程数，1表示逐个处理
+config.CAPTAIN_POLL_INTERVAL = float(os.getenv('CAPTAIN_POLL_INTERVAL', 5))  # 没有待处理事件时的等待间隔(秒)
+
+# _operator配置
+config.OPERATOR_COMMAND_FIX_ATTEMPTS = int(os.getenv('OPERATOR_COMMAND_FIX_ATTEMPTS', 2))  # 剧本命令未通过校验时要求_operator修正的次数上限，0表示直接失败
 
 # 事件处理配置
 config.EVENT_MAX_ROUND = int(os.getenv('EVENT_MAX_ROUND', 3))
 
+# 调度配置
+config.SCHEDULER_AGING_INTERVAL = float(os.getenv('SCHEDULER_AGING_INTERVAL', 300))  # 等待多久提升一级优先级(秒)，0表示不老化
+# critical,high,medium,low 各优先级在事件间公平调度中的权重
+config.SCHEDULER_PRIORITY_WEIGHTS = [float(w) for w in os.getenv('SCHEDULER_PRIORITY_WEIGHTS', '8,4,2,1').split(',')]
+config.EXECUTOR_MAX_INFLIGHT_PER_EVENT = int(os.getenv('EXECUTOR_MAX_INFLIGHT_PER_EVENT', 4))  # 单个事件同时执行的命令数上限，0表示不限制
+
+# _executor配置
+config.EXECUTOR_MODE = os.getenv('EXECUTOR_MODE', 'thread').lower()  # 剧本命令执行方式: thread(线程池) / async(asyncio事件循环)
+config.EXECUTOR_WORKERS = int(os.getenv('EXECUTOR_WORKERS', 4))  # 启动剧本、记录执行结果的工作线程数
+config.EXECUTOR_MAX_ACTIVITIES = int(os.getenv('EXECUTOR_MAX_ACTIVITIES', 32))  # 同时执行中的剧本命令数上限
+config.EXECUTOR_PLAYBOOK_CONCURRENCY = os.getenv('EXECUTOR_PLAYBOOK_CONCURRENCY', '')  # 各剧本同时执行上限，格式: 剧本ID:上限,剧本ID:上限
+config.EXECUTOR_PLAYBOOK_DEFAULT_CONCURRENCY = int(os.getenv('EXECUTOR_PLAYBOOK_DEFAULT_CONCURRENCY', 0))  # 未单独配置的剧本同时执行上限，0表示不限制
+config.EXECUTOR_DEDUP_ENABLED = os.getenv('EXECUTOR_DEDUP_ENABLED', 'True').lower() == 'true'  # 相同剧本调用是否复用执行中的活动
+config.EXECUTOR_DEDUP_WINDOW = int(os.getenv('EXECUTOR_DEDUP_WINDOW', 300))  # 复用多少秒内执行成功的相同调用的结果，0表示只复用执行中的活动
+config.EXECUTOR_BATCH_ENABLED = os.getenv('EXECUTOR_BATCH_ENABLED', 'False').lower() == 'true'  # 是否把参数兼容的多个命令合并为一次剧本调用（剧本目录中声明batch_param的剧本）
+config.EXECUTOR_BATCH_MAX_TARGETS = int(os.getenv('EXECUTOR_BATCH_MAX_TARGETS', 50))  # 一次剧本调用最多合并的命令数（剧本未声明batch_max时）
+
+# 执行结果存储配置
+config.EXECUTION_RESULT_INLINE_LIMIT = int(os.getenv('EXECUTION_RESULT_INLINE_LIMIT', 16384))  # 超过该字节数的执行结果压缩后存放在execution_blobs表，0表示全部存放在执行记录中
+config.EXECUTION_RESULT_PREVIEW_CHARS = int(os.getenv('EXECUTION_RESULT_PREVIEW_CHARS', 1000))  # 外部存储的执行结果在执行记录中保留的预览字符数
+
+# _expert状态协调器配置
+config.EXPERT_RECONCILE_INTERVAL = float(os.getenv('EXPERT_RECONCILE_INTERVAL', 0.5))  # 空闲时检查变更的间隔(秒)
+config.EXPERT_FULL_SWEEP_INTERVAL = float(os.getenv('EXPERT_FULL_SWEEP_INTERVAL', 30))  # 全量兜底扫描间隔(秒)
+config.EXPERT_COUNTER_REPAIR_INTERVAL = float(os.getenv('EXPERT_COUNTER_REPAIR_INTERVAL', 300))  # 未完成计数器修复间隔(秒)
+config.EXPERT_CHANGE_OVERLAP = float(os.getenv('EXPERT_CHANGE_OVERLAP', 2))  # 增量扫描水位线回溯时间(秒)
+config.EXPERT_SUMMARY_RETRY_DELAY = float(os.getenv('EXPERT_SUMMARY_RETRY_DELAY', 30))  # 事件总结、执行摘要失败后的重试间隔(秒)
+config.EXPERT_SUMMARY_REUSE_ENABLED = os.getenv('EXPERT_SUMMARY_REUSE_ENABLED', 'True').lower() == 'true'  # 相同剧本调用返回相同结果时是否复用已有的执行摘要
+config.EXPERT_TEMPLATE_SUMMARY_ENABLED = os.getenv('EXPERT_TEMPLATE_SUMMARY_ENABLED', 'True').lower() == 'true'  # 结构固定的剧本结果是否用模板生成执行摘要（app/services/summarizers.py）
+config.EXPERT_TEMPLATE_SUMMARY_MAX_CHARS = int(os.getenv('EXPERT_TEMPLATE_SUMMARY_MAX_CHARS', 4000))  # 超过该字符数的执行结果不使用模板，由大模型生成摘要
+config.EXPERT_PRUNE_ENABLED = os.getenv('EXPERT_PRUNE_ENABLED', 'True').lower() == 'true'  # 大模型生成执行摘要前是否精简执行结果
+config.EXPERT_PRUNE_DROP_FIELDS = os.getenv('EXPERT_PRUNE_DROP_FIELDS', 'id,_id,uuid,request_id,requestId,trace_id,traceId,created_at,updated_at,createTime,updateTime,create_time,update_time')  # 精简执行结果时去掉的字段（不区分大小写）
+config.EXPERT_PRUNE_MAX_ITEMS = int(os.getenv('EXPERT_PRUNE_MAX_ITEMS', 20))  # 列表最多保留的条数（前后各一半），0表示不限制
+config.EXPERT_PRUNE_MAX_STRING = int(os.getenv('EXPERT_PRUNE_MAX_STRING', 2000))  # 字符串最多保留的字符数，0表示不限制
+config.EXPERT_SUMMARY_BATCH_ENABLED = os.getenv('EXPERT_SUMMARY_BATCH_ENABLED', 'False').lower() == 'true'  # 是否把同一事件同一轮次的多个执行结果合并为一次大模型请求生成摘要
+config.EXPERT_SUMMARY_BATCH_MAX_TOKENS = int(os.getenv('EXPERT_SUMMARY_BATCH_MAX_TOKENS', 6000))  # 一次批量摘要请求中执行结果的估计token数上限
+config.EXPERT_SUMMARY_BATCH_MAX_SIZE = int(os.getenv('EXPERT_SUMMARY_BATCH_MAX_SIZE', 10))  # 一次批量摘要请求最多包含的执行结果数
+config.EXPERT_SUMMARY_WORKERS = int(os.getenv('EXPERT_SUMMARY_WORKERS', 1))  # 并发生成执行摘要的工作线程数，1表示由协调线程逐个处理
+
+# 指标配置
+config.METRICS_LOG_INTERVAL = float(os.getenv('METRICS_LOG_INTERVAL', 60))  # 指标日志输出间隔(秒)，0表示不输出
+
 # 其他配置
 config.DEBUG = os.getenv('DEBUG', 'False').lower() == 'true' 
\ No newline at end of file
@@ -4,5 +4,6 @@ from flask import Blueprint
 from .event_controller import event_bp
 from .socket_controller import register_socket_events, broadcast_message
 from .auth_controller import auth_bp
+from .soar_controller import soar_bp
 
-__all__ = ['event_bp', 'register_socket_events', 'broadcast_message', 'auth_bp'] 
\ No newline at end of file
+__all__ = ['event_bp', 'register_socket_events', 'broadcast_message', 'auth_bp', 'soar_bp'] 
\ No newline at end of file
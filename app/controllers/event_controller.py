@@ -4,6 +4,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import db, Event
 from app.utils.message_utils import create_standard_message
+from app.services.scheduling import priority_for_severity
 
 event_bp = Blueprint('event', __name__)
 
@@ -31,6 +32,7 @@ def create_event():
         context=data.get('context', ''),
         source=data.get('source', 'manual'),
         severity=data.get('severity', 'medium'),
+        priority=priority_for_severity(data.get('severity', 'medium')),
         status='pending'
     )
     
@@ -248,6 +250,34 @@ def get_event_executions(event_id):
         'data': enhanced_executions
     })
 
+@event_bp.route('/<event_id>/execution/<execution_id>/result', methods=['GET'])
+@jwt_required()
+def get_execution_result(event_id, execution_id):
+    """获取执行任务的完整执行结果（执行任务列表中较大的结果只有预览）"""
+    from app.models import Execution
+    from app.services.result_store import load_result
+    
+    execution = Execution.query.filter_by(
+        execution_id=execution_id,
+        event_id=event_id
+    ).first()
+    
+    if not execution:
+        return jsonify({
+            'status': 'error',
+            'message': '执行任务不存在'
+        }), 404
+    
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'execution_id': execution.execution_id,
+            'result_ref': execution.result_ref,
+            'result_size': execution.result_size,
+            'execution_result': load_result(execution)
+        }
+    })
+
 @event_bp.route('/<event_id>/execution/<execution_id>/complete', methods=['POST'])
 def complete_execution(event_id, execution_id):
     """完成执行任务"""
@@ -275,10 +305,13 @@ def complete_execution(event_id, execution_id):
             'message': '执行任务不存在'
         }), 404
     
-    # 更新执行任务
-    execution.execution_result = data['result']
+    # 更新执行任务，较大的执行结果存放在execution_blobs表
+    from app.services.result_store import result_columns
+    for key, value in result_columns(data['result']).items():
+        setattr(execution, key, value)
     execution.execution_status = data.get('status', 'completed')
     execution.updated_at = datetime.utcnow()
+    execution.finished_at = execution.updated_at
     
     db.session.commit()
     
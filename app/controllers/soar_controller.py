@@ -0,0 +1,31 @@
+from flask import Blueprint, request, jsonify
+from app.services.soar_callback import verify_callback, handle_activity_callback
+
+soar_bp = Blueprint('soar', __name__)
+
+@soar_bp.route('/callback', methods=['POST'])
+def activity_callback():
+    """SOAR活动完成回调，不使用登录认证，按SOAR_CALLBACK_TOKEN校验"""
+    if not verify_callback(request.get_data(), request.headers.get('X-SOAR-Token'),
+                           request.headers.get('X-SOAR-Signature')):
+        return jsonify({
+            'status': 'error',
+            'message': '回调认证失败'
+        }), 401
+    
+    data = request.get_json(silent=True) or {}
+    activity_id = data.get('activityId') or data.get('activity_id')
+    status = data.get('executeStatus') or data.get('status')
+    if not activity_id or not status:
+        return jsonify({
+            'status': 'error',
+            'message': '缺少activityId或executeStatus'
+        }), 400
+    
+    outcome = handle_activity_callback(activity_id, status, data.get('result'))
+    
+    return jsonify({
+        'status': 'success',
+        'message': '回调已处理',
+        'data': outcome
+    })
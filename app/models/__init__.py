@@ -1,3 +1,4 @@
-from app.models.models import db, Event, Task, Action, Command, Execution, Message, Summary
+from app.models.models import db, Event, Task, Action, Command, Execution, Message, Summary, PlaybookStat, ExecutionBlob
+from app.models import counters  # 注册未完成计数器的维护逻辑
 
-__all__ = ['db', 'Event', 'Task', 'Action', 'Command', 'Execution', 'Message', 'Summary'] 
\ No newline at end of file
+__all__ = ['db', 'Event', 'Task', 'Action', 'Command', 'Execution', 'Message', 'Summary', 'PlaybookStat', 'ExecutionBlob'] 
\ No newline at end of file
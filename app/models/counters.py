@@ -0,0 +1,189 @@
+"""未完成子记录计数器
+
+Command.pending_executions、Task.pending_commands、Event.pending_tasks/pending_executions
+记录各父记录下尚未进入终态的子记录数量（Event上的计数只针对当前轮次）。
+
+计数器在每次flush时根据子记录状态的变化自动增减，与状态变更处于同一事务中，
+使用 UPDATE ... SET x = x + :delta 原子更新，多进程并发写入时也不会丢失。
+以Core UPDATE比较并设置子记录状态时不经过flush，需调用record_status_change()。
+repair_outstanding_counters()用于重新计算计数器，修复可能出现的偏差。
+"""
+import logging
+from collections import defaultdict
+from sqlalchemy import event, func, select, inspect
+from sqlalchemy.orm import Session
+from app.models.models import db, Event, Task, Command, Execution
+
+logger = logging.getLogger(__name__)
+
+# 各实体的终态
+EXECUTION_TERMINAL_STATUSES = ['summarized', 'failed']
+# rejected（未通过校验，等待_operator修正）不是终态，修正后的命令生成时变为superseded
+COMMAND_TERMINAL_STATUSES = ['completed', 'failed', 'superseded']
+TASK_TERMINAL_STATUSES = ['completed', 'failed']
+
+# 子记录模型 -> (状态字段, 终态列表)
+_TRACKED = {
+    Execution: ('execution_status', EXECUTION_TERMINAL_STATUSES),
+    Command: ('command_status', COMMAND_TERMINAL_STATUSES),
+    Task: ('task_status', TASK_TERMINAL_STATUSES),
+}
+
+
+def _is_outstanding(status, terminal_statuses):
+    # 未设置状态时使用字段默认值pending，属于未完成
+    return status not in terminal_statuses
+
+
+def _outstanding_delta(obj, state):
+    """计算本次flush中该子记录对父记录计数器的影响：+1、-1或0"""
+    status_field, terminal_statuses = _TRACKED[type(obj)]
+
+    if state == 'new':
+        return 1 if _is_outstanding(getattr(obj, status_field), terminal_statuses) else 0
+
+    history = inspect(obj).attrs[status_field].history
+    if state == 'deleted':
+        old_status = history.deleted[0] if history.deleted else getattr(obj, status_field)
+        return -1 if _is_outstanding(old_status, terminal_statuses) else 0
+
+    if not history.has_changes():
+        return 0
+    old_outstanding = _is_outstanding(history.deleted[0] if history.deleted else None, terminal_statuses)
+    new_outstanding = _is_outstanding(history.added[0] if history.added else None, terminal_statuses)
+    return int(new_outstanding) - int(old_outstanding)
+
+
+class _CounterDeltas:
+    """一次flush（或一次Core UPDATE）中各父记录计数器的增减"""
+
+    def __init__(self):
+        self.commands = defaultdict(int)
+        self.tasks = defaultdict(int)
+        self.round_tasks = defaultdict(int)
+        self.round_executions = defaultdict(int)
+
+    def add(self, obj, delta):
+        if isinstance(obj, Execution):
+            if obj.command_id:
+                self.commands[obj.command_id] += delta
+            if obj.event_id:
+                self.round_executions[(obj.event_id, obj.round_id or 1)] += delta
+        elif isinstance(obj, Command):
+            if obj.task_id:
+                self.tasks[obj.task_id] += delta
+        elif isinstance(obj, Task):
+            if obj.event_id:
+                self.round_tasks[(obj.event_id, obj.round_id or 1)] += delta
+
+    def apply(self, connection):
+        commands = Command.__table__
+        tasks = Task.__table__
+        events = Event.__table__
+
+        for command_id, delta in self.commands.items():
+            if delta:
+                connection.execute(commands.update().where(commands.c.command_id == command_id).values(
+                    pending_executions=commands.c.pending_executions + delta))
+        for task_id, delta in self.tasks.items():
+            if delta:
+                connection.execute(tasks.update().where(tasks.c.task_id == task_id).values(
+                    pending_commands=tasks.c.pending_commands + delta))
+        # 事件上的计数只针对当前轮次
+        for (event_id, round_id), delta in self.round_tasks.items():
+            if delta:
+                connection.execute(events.update().where(
+                    events.c.event_id == event_id,
+                    func.coalesce(events.c.current_round, 1) == round_id
+                ).values(pending_tasks=events.c.pending_tasks + delta))
+        for (event_id, round_id), delta in self.round_executions.items():
+            if delta:
+                connection.execute(events.update().where(
+                    events.c.event_id == event_id,
+                    func.coalesce(events.c.current_round, 1) == round_id
+                ).values(pending_executions=events.c.pending_executions + delta))
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_outstanding_counters(session, flush_context):
+    """flush后根据子记录状态变化更新父记录计数器，与状态变更处于同一事务"""
+    deltas = _CounterDeltas()
+    for state, objects in (('new', session.new), ('dirty', session.dirty), ('deleted', session.deleted)):
+        for obj in objects:
+            if type(obj) not in _TRACKED:
+                continue
+            delta = _outstanding_delta(obj, state)
+            if delta:
+                deltas.add(obj, delta)
+    deltas.apply(session.connection())
+
+
+def record_status_change(obj, old_status, new_status):
+    """以Core UPDATE变更子记录状态时不经过flush，由调用方在同一事务中调用，更新父记录计数器
+
+    Args:
+        obj: 子记录对象，只使用其关联ID
+        old_status: UPDATE前的状态
+        new_status: UPDATE后的状态
+    """
+    _, terminal_statuses = _TRACKED[type(obj)]
+    delta = int(_is_outstanding(new_status, terminal_statuses)) - int(_is_outstanding(old_status, terminal_statuses))
+    if not delta:
+        return
+    deltas = _CounterDeltas()
+    deltas.add(obj, delta)
+    deltas.apply(db.session.connection())
+
+
+def _outstanding_count(child_table, status_column, terminal_statuses, *conditions):
+    return select(func.count()).select_from(child_table).where(
+        func.coalesce(status_column, 'pending').notin_(terminal_statuses), *conditions
+    ).scalar_subquery()
+
+
+def repair_outstanding_counters():
+    """重新计算所有未完成父记录的计数器，修复偏差
+
+    Returns:
+        各计数器被修正的记录数
+    """
+    commands = Command.__table__
+    tasks = Task.__table__
+    events = Event.__table__
+    executions = Execution.__table__
+    current_round = func.coalesce(events.c.current_round, 1)
+
+    statements = {
+        'command.pending_executions': (commands, commands.c.pending_executions, _outstanding_count(
+            executions, executions.c.execution_status, EXECUTION_TERMINAL_STATUSES,
+            executions.c.command_id == commands.c.command_id
+        ), commands.c.command_status.notin_(COMMAND_TERMINAL_STATUSES)),
+        'task.pending_commands': (tasks, tasks.c.pending_commands, _outstanding_count(
+            commands, commands.c.command_status, COMMAND_TERMINAL_STATUSES,
+            commands.c.task_id == tasks.c.task_id
+        ), tasks.c.task_status.notin_(TASK_TERMINAL_STATUSES)),
+        'event.pending_tasks': (events, events.c.pending_tasks, _outstanding_count(
+            tasks, tasks.c.task_status, TASK_TERMINAL_STATUSES,
+            tasks.c.event_id == events.c.event_id,
+            func.coalesce(tasks.c.round_id, 1) == current_round
+        ), None),
+        'event.pending_executions': (events, events.c.pending_executions, _outstanding_count(
+            executions, executions.c.execution_status, EXECUTION_TERMINAL_STATUSES,
+            executions.c.event_id == events.c.event_id,
+            func.coalesce(executions.c.round_id, 1) == current_round
+        ), None),
+    }
+
+    repaired = {}
+    for name, (table, counter, expected, condition) in statements.items():
+        stmt = table.update().where(func.coalesce(counter, -1) != expected)
+        if condition is not None:
+            stmt = stmt.where(condition)
+        result = db.session.execute(stmt.values({counter.name: expected}))
+        repaired[name] = result.rowcount
+    db.session.commit()
+
+    drifted = {name: count for name, count in repaired.items() if count}
+    if drifted:
+        logger.warning(f"计数器存在偏差，已修复: {drifted}")
+    return repaired
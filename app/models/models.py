@@ -2,6 +2,7 @@ from datetime import datetime
 import uuid
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, func
+from sqlalchemy.orm import column_property
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
@@ -49,10 +50,14 @@ class Event(db.Model):
     context = db.Column(db.Text)
     source = db.Column(db.String(64))
     severity = db.Column(db.String(32))
-    status = db.Column(db.String(32), default='pending')
+    priority = db.Column(db.Integer, default=2, server_default='2', nullable=False)  # 调度优先级，由severity确定，数值越小越优先
+    status = db.Column(db.String(32), default='pending', index=True)
     current_round = db.Column(db.Integer, default=1)  # 当前处理轮次，默认为1
+    pending_tasks = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # 当前轮次未完成的任务数
+    pending_executions = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # 当前轮次未完成的执行数
+    version = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # 状态版本号，每次状态转换加1
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def to_dict(self):
         return {
@@ -63,8 +68,12 @@ class Event(db.Model):
             'context': self.context,
             'source': self.source,
             'severity': self.severity,
+            'priority': self.priority,
             'status': self.status,
             'current_round': self.current_round,
+            'pending_tasks': self.pending_tasks,
+            'pending_executions': self.pending_executions,
+            'version': self.version,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -72,6 +81,9 @@ class Event(db.Model):
 class Task(db.Model):
     """任务表"""
     __tablename__ = 'tasks'
+    __table_args__ = (
+        db.Index('ix_tasks_event_round', 'event_id', 'round_id'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     task_id = db.Column(db.String(64), nullable=False, unique=True)
@@ -79,11 +91,14 @@ class Task(db.Model):
     task_name = db.Column(db.String(256))
     task_type = db.Column(db.String(64))  # query, write, notify
     task_assignee = db.Column(db.String(64))
-    task_status = db.Column(db.String(32), default='pending')
+    # active_history: 修改状态时加载原值，用于维护未完成计数器
+    task_status = column_property(db.Column(db.String(32), default='pending', index=True), active_history=True)
+    priority = db.Column(db.Integer, default=2, server_default='2', nullable=False)  # 调度优先级，继承自上级记录
     round_id = db.Column(db.Integer)
+    pending_commands = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # 未完成的命令数
     result = db.Column(db.JSON)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def to_dict(self):
         return {
@@ -94,7 +109,9 @@ class Task(db.Model):
             'task_type': self.task_type,
             'task_assignee': self.task_assignee,
             'task_status': self.task_status,
+            'priority': self.priority,
             'round_id': self.round_id,
+            'pending_commands': self.pending_commands,
             'result': self.result,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
@@ -113,7 +130,10 @@ class Action(db.Model):
     action_type = db.Column(db.String(64))
     action_assignee = db.Column(db.String(64))
     action_status = db.Column(db.String(32), default='pending')
+    priority = db.Column(db.Integer, default=2, server_default='2', nullable=False)  # 调度优先级，继承自上级记录
     action_result = db.Column(db.JSON)
+    fix_attempts = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # 生成的命令未通过校验、要求_operator修正的次数
+    fix_hint = db.Column(db.Text)  # 上次生成的命令未通过校验的原因，_operator修正命令时参考
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -128,7 +148,10 @@ class Action(db.Model):
             'action_type': self.action_type,
             'action_assignee': self.action_assignee,
             'action_status': self.action_status,
+            'priority': self.priority,
             'action_result': self.action_result,
+            'fix_attempts': self.fix_attempts,
+            'fix_hint': self.fix_hint,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -140,7 +163,7 @@ class Command(db.Model):
     id = Column(Integer, primary_key=True, autoincrement=True)
     command_id = db.Column(db.String(64), nullable=False, unique=True)
     action_id = db.Column(db.String(64))  # 关联的动作ID
-    task_id = db.Column(db.String(64))  # 关联的任务ID
+    task_id = db.Column(db.String(64), index=True)  # 关联的任务ID
     event_id = db.Column(db.String(64))  # 关联的事件ID
     round_id = db.Column(db.Integer)
     command_name = db.Column(db.String(256))
@@ -148,10 +171,13 @@ class Command(db.Model):
     command_assignee = db.Column(db.String(64))
     command_entity = db.Column(db.JSON)
     command_params = db.Column(db.JSON)
-    command_status = db.Column(db.String(32), default='pending')
+    # active_history: 修改状态时加载原值，用于维护未完成计数器
+    command_status = column_property(db.Column(db.String(32), default='pending', index=True), active_history=True)
+    priority = db.Column(db.Integer, default=2, server_default='2', nullable=False)  # 调度优先级，继承自上级记录
     command_result = db.Column(db.JSON)
+    pending_executions = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # 未完成的执行数
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def to_dict(self):
         return {
@@ -166,7 +192,9 @@ class Command(db.Model):
             'command_entity': self.command_entity,
             'command_params': self.command_params,
             'command_status': self.command_status,
+            'priority': self.priority,
             'command_result': self.command_result,
+            'pending_executions': self.pending_executions,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -174,10 +202,13 @@ class Command(db.Model):
 class Execution(db.Model):
     """执行表"""
     __tablename__ = 'executions'
+    __table_args__ = (
+        db.Index('ix_executions_event_round', 'event_id', 'round_id'),
+    )
     
     id = db.Column(db.Integer, autoincrement=True, primary_key=True)
     execution_id = db.Column(db.String(48), nullable=False, unique=True)
-    command_id = db.Column(db.String(48))
+    command_id = db.Column(db.String(48), index=True)
     action_id = db.Column(db.String(48))
     task_id = db.Column(db.String(48))
     event_id = db.Column(db.String(48))
@@ -185,9 +216,33 @@ class Execution(db.Model):
     execution_result = db.Column(db.Text)
     execution_summary = db.Column(db.Text)
     ai_summary = db.Column(db.Text)
-    execution_status = db.Column(db.String(50), default='pending')
+    # active_history: 修改状态时加载原值，用于维护未完成计数器
+    execution_status = column_property(db.Column(db.String(50), default='pending', index=True), active_history=True)
+    # SOAR剧本执行跟踪状态，执行器重启后据此继续跟踪执行中的剧本
+    activity_id = db.Column(db.String(64), index=True)  # SOAR活动ID
+    poll_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # 已轮询次数
+    last_polled_at = db.Column(db.DateTime)  # 最近一次轮询时间
+    deadline_at = db.Column(db.DateTime)  # 等待执行完成的截止时间
+    finished_at = db.Column(db.DateTime)  # 剧本执行结束（成功或失败）的时间，生成摘要不会改变
+    # 查询类剧本命中结果缓存时不调用SOAR，记录来源执行记录
+    cached = db.Column(db.Boolean, default=False, server_default='0', nullable=False)  # 是否为缓存结果
+    cached_from = db.Column(db.String(48))  # 缓存结果的来源执行记录ID
+    # 重复命令去重：相同剧本调用共享执行中的活动或复用刚完成的结果
+    command_signature = db.Column(db.String(64), index=True)  # 剧本ID和规范化参数的sha256
+    dedup_of = db.Column(db.String(48))  # 被复用的执行记录ID
+    # 多个命令合并为一次剧本调用时共享activity_id，执行结果按目标拆分
+    batch_target = db.Column(db.String(256))  # 本命令在批量调用中的目标
+    batch_size = db.Column(db.Integer)  # 批量调用合并的命令数
+    # 超过EXECUTION_RESULT_INLINE_LIMIT的执行结果存放在execution_blobs表，execution_result只保留预览
+    result_ref = db.Column(db.String(64))  # 完整执行结果在execution_blobs中的sha256
+    result_size = db.Column(db.Integer)  # 完整执行结果的字节数
+    # 相同剧本调用返回相同结果时复用已有的执行摘要
+    result_hash = db.Column(db.String(64), index=True)  # 命令签名和规范化执行结果的sha256
+    summary_source = db.Column(db.String(20))  # 摘要来源: llm(大模型生成) / llm_batch(大模型批量生成) / template(模板生成) / reused(复用其他执行记录的摘要)
+    summary_ref = db.Column(db.String(48))  # 复用摘要时，生成该摘要的执行记录ID
+    summary_tokens_saved = db.Column(db.Integer)  # 大模型生成摘要时精简执行结果节省的token数（估算）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     def to_dict(self):
         return {
@@ -202,6 +257,23 @@ class Execution(db.Model):
             'execution_summary': self.execution_summary,
             'ai_summary': self.ai_summary,
             'execution_status': self.execution_status,
+            'activity_id': self.activity_id,
+            'poll_count': self.poll_count,
+            'last_polled_at': self.last_polled_at.isoformat() if self.last_polled_at else None,
+            'deadline_at': self.deadline_at.isoformat() if self.deadline_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'cached': self.cached,
+            'cached_from': self.cached_from,
+            'command_signature': self.command_signature,
+            'dedup_of': self.dedup_of,
+            'batch_target': self.batch_target,
+            'batch_size': self.batch_size,
+            'result_ref': self.result_ref,
+            'result_size': self.result_size,
+            'result_hash': self.result_hash,
+            'summary_source': self.summary_source,
+            'summary_ref': self.summary_ref,
+            'summary_tokens_saved': self.summary_tokens_saved,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -291,4 +363,38 @@ class LLMRecord(db.Model):
             'completion_tokens': self.completion_tokens,
             'total_tokens': self.total_tokens,
             'cached_tokens': self.cached_tokens
-        } 
\ No newline at end of file
+        } 
+
+
+class PlaybookStat(db.Model):
+    """剧本执行耗时统计表，用于自适应的剧本状态轮询"""
+    __tablename__ = "playbook_stats"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    playbook_id = db.Column(db.String(64), nullable=False, unique=True)  # 剧本ID
+    sample_count = db.Column(db.Integer, default=0, nullable=False)  # 累计样本数
+    recent_durations = db.Column(db.JSON)  # 最近的执行耗时(秒)列表
+    p50 = db.Column(db.Float)  # 最近执行耗时的中位数(秒)
+    p90 = db.Column(db.Float)  # 最近执行耗时的90分位数(秒)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'playbook_id': self.playbook_id,
+            'sample_count': self.sample_count,
+            'recent_durations': self.recent_durations,
+            'p50': self.p50,
+            'p90': self.p90,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class ExecutionBlob(db.Model):
+    """执行结果存储表，按内容sha256寻址，相同的执行结果只存一份"""
+    __tablename__ = "execution_blobs"
+
+    sha256 = db.Column(db.String(64), primary_key=True)  # 执行结果JSON文本的sha256
+    content = db.Column(db.LargeBinary, nullable=False)  # zlib压缩后的执行结果JSON文本
+    size = db.Column(db.Integer, nullable=False)  # 压缩前的字节数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
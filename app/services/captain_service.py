@@ -1,6 +1,7 @@
 import time
 import uuid
 import json
+import threading
 from datetime import datetime
 from flask import current_app
 from app.models import db, Event, Task, Message, Summary
@@ -8,6 +9,10 @@ from app.services.llm_service import call_llm, parse_yaml_response
 from app.controllers.socket_controller import broadcast_message
 from app.services.prompt_service import PromptService
 from app.utils.message_utils import create_standard_message
+from app.services.event_state import transition_event_status, get_event
+from app.config import config
+from app.utils.metrics import metrics, PeriodicReporter
+from app.services.scheduling import sort_by_priority, record_queue_depth, observe_queue_wait
 import yaml
 
 import logging
@@ -19,8 +24,35 @@ def get_events_to_process():
     
     在新的状态流转设计中，Captain只处理pending状态的事件
     round_finished状态的事件由event_next_round_worker处理并转换为pending
+    按优先级调度，返回有效优先级最高的事件
     """
-    return Event.query.filter_by(status='pending').order_by(Event.created_at.asc()).first()  
+    events = get_pending_events()
+    return events[0] if events else None
+
+def get_pending_events():
+    """获取所有待处理的安全事件，按有效优先级排序
+    
+    事件的等待时间从进入pending状态（updated_at）开始计算
+    """
+    events = Event.query.filter_by(status='pending').all()
+    record_queue_depth('captain', events)
+    return sort_by_priority(events, time_attr='updated_at')
+
+def claim_event_to_process():
+    """认领一个待处理的安全事件
+    
+    通过pending -> processing的比较并设置认领事件，同一事件同一时间只会被一个工作线程处理，
+    事件的下一轮要等本轮回到pending后才能被认领，保证了单个事件内的处理顺序
+    
+    Returns:
+        认领成功的Event对象（状态为processing），没有可认领的事件时返回None
+    """
+    for event in get_pending_events():
+        priority, pending_since = event.priority, event.updated_at
+        if transition_event_status(event.event_id, 'pending', 'processing', expected_version=event.version):
+            observe_queue_wait('captain', priority, pending_since)
+            return get_event(event.event_id)
+    return None
 
 def process_event(event):
     """处理单个安全事件
@@ -34,6 +66,13 @@ def process_event(event):
     is_first_round = (event.current_round == 1)
     round_id = event.current_round
 
+    # 更新事件状态为处理中（通过claim_event_to_process认领的事件已是processing），事件已被其他进程处理时放弃
+    if event.status == 'pending':
+        priority, pending_since = event.priority, event.updated_at
+        if not transition_event_status(event.event_id, 'pending', 'processing', expected_version=event.version):
+            return
+        observe_queue_wait('captain', priority, pending_since)
+
     create_standard_message(
         event_id=event.event_id,
         message_from='system',
@@ -41,10 +80,6 @@ def process_event(event):
         message_type='llm_request',
         content_data="Captain on the bridge! 正在请求大模型AI指挥官。"
     )
-    
-    # 更新事件状态为处理中
-    event.status = 'processing'
-    db.session.commit()
 
     request_data = {
         'type': 'generate_tasks_by_event',
@@ -135,6 +170,7 @@ def process_event(event):
                 task_type=task_data.get('task_type'),
                 task_assignee=task_data.get('task_assignee'),
                 task_status='pending',
+                priority=event.priority,
                 round_id=parsed_response.get('round_id', round_id)
             )
             db.session.add(task)
@@ -147,23 +183,70 @@ def process_event(event):
     
     # 如果是任务完成，更新事件状态
     elif response_type == 'MISSION_COMPLETE':
-        event.status = 'completed'
-        db.session.commit()
+        transition_event_status(event.event_id, 'processing', 'completed')
     elif response_type == 'ROGER':
-        event.status = 'error_from_llm'
+        transition_event_status(event.event_id, 'processing', 'error_from_llm')
         logger.error(f"调用大模型处理事件{event.event_id}失败，原因: {parsed_response.get('response_text', '未知错误')}")
-        db.session.commit()
+
+def captain_worker(app, worker_id):
+    """Captain工作线程：循环认领并处理待处理事件
+    
+    Args:
+        app: Flask应用
+        worker_id: 工作线程编号
+    """
+    # 每个工作线程使用独立的应用上下文和数据库会话
+    with app.app_context():
+        logger.info(f"Captain工作线程 {worker_id} 已启动")
+        while True:
+            try:
+                event = claim_event_to_process()
+                if event:
+                    started = time.monotonic()
+                    process_event(event)
+                    metrics.observe('captain_event_seconds', time.monotonic() - started)
+                else:
+                    time.sleep(config.CAPTAIN_POLL_INTERVAL)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Captain工作线程 {worker_id} 处理事件时出错: {e}")
+                time.sleep(config.CAPTAIN_POLL_INTERVAL)
 
 def run_captain():
-    """运行Captain服务"""
+    """运行Captain服务
+    
+    CAPTAIN_WORKERS大于1时，启动工作线程池并发处理多个事件，
+    所有线程共享进程内的大模型并发限制LLM_MAX_CONCURRENCY
+    """
     logger.info("启动Captain服务...")
     
     # 导入Flask应用
     from main import app
     
+    workers = max(config.CAPTAIN_WORKERS, 1)
+    if workers > 1:
+        if workers > config.LLM_MAX_CONCURRENCY:
+            logger.warning(f"CAPTAIN_WORKERS({workers})大于LLM_MAX_CONCURRENCY({config.LLM_MAX_CONCURRENCY})，"
+                           f"超出的工作线程将等待大模型并发名额")
+        for worker_id in range(workers):
+            t = threading.Thread(target=captain_worker, args=(app, worker_id), name=f"captain-worker-{worker_id}")
+            t.daemon = True
+            t.start()
+        logger.info(f"Captain工作线程池已启动，线程数: {workers}")
+        
+        # 主线程定期输出指标
+        reporter = PeriodicReporter(config.METRICS_LOG_INTERVAL)
+        while True:
+            time.sleep(1)
+            reporter.maybe_report()
+    
+    # 定期输出队列深度、等待时间等指标
+    reporter = PeriodicReporter(config.METRICS_LOG_INTERVAL)
+    
     # 使用应用上下文
     with app.app_context():
         while True:
+            reporter.maybe_report()
             try:
                 # 获取待处理事件
                 event = get_events_to_process()
@@ -171,7 +254,7 @@ def run_captain():
                     process_event(event)
                 else:
                     logger.info("没有待处理事件，等待中...")
-                    time.sleep(5)
+                    time.sleep(config.CAPTAIN_POLL_INTERVAL)
             except Exception as e:
                 logger.error(f"处理事件时出错: {e}")
-                time.sleep(5)
\ No newline at end of file
+                time.sleep(config.CAPTAIN_POLL_INTERVAL)
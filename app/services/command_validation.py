@@ -0,0 +1,134 @@
+"""剧本命令下发前的校验
+
+_operator由大模型生成的剧本ID和参数原来要等SOAR返回错误才能发现，此时动作、命令、执行、
+总结整条链路的大模型调用都已白费。命令创建时（_operator）和下发前（_executor）按剧本目录校验：
+1. 剧本ID不在目录中时按剧本名称纠正，补全可选参数的默认值，去掉目录中未定义的参数
+2. 剧本不存在或缺少必填参数的命令标记为rejected，不会被下发；
+   关联动作回到pending并记录fix_hint，_operator只针对该动作重新生成命令
+3. 动作的修正次数超过OPERATOR_COMMAND_FIX_ATTEMPTS后，命令和动作标记为failed
+4. 修正后的命令创建时，该动作原来rejected的命令变为superseded（终态），
+   rejected不是终态，等待修正期间任务不会提前完成
+5. _operator会重新生成动作的全部命令，因此同一动作的命令一起拒绝；下发前校验失败时，
+   该动作还未下发的其他命令一并拒绝，其他命令已经下发时不再要求修正，只将该命令标记为failed，避免重复执行
+"""
+import logging
+from sqlalchemy import update
+from app.models import db, Action, Command
+from app.config import config
+from app.utils.metrics import metrics
+from app.services.playbook_registry import check_playbook_request
+
+logger = logging.getLogger(__name__)
+
+
+def validate_command(command):
+    """校验剧本命令，校验通过时纠正剧本ID并补全参数默认值（不提交）
+
+    Args:
+        command: 命令对象
+
+    Returns:
+        问题列表，为空表示校验通过；非剧本命令总是返回空列表
+    """
+    if command.command_type != 'playbook':
+        return []
+    entity = command.command_entity if isinstance(command.command_entity, dict) else {}
+    playbook_id, params, problems = check_playbook_request(
+        entity.get('playbook_id'), command.command_params, entity.get('playbook_name') or command.command_name)
+    if problems:
+        return problems
+
+    if playbook_id != entity.get('playbook_id'):
+        command.command_entity = dict(entity, playbook_id=playbook_id)
+    if params != command.command_params:
+        command.command_params = params
+    return []
+
+
+def format_fix_hint(problems):
+    """生成提供给_operator的修正提示"""
+    return "上次生成的命令未通过校验：" + "；".join(problems)
+
+
+def reject_commands(action_id, commands, problems):
+    """拒绝未通过校验的命令，并要求_operator修正关联动作的命令（不提交）
+
+    Args:
+        action_id: 动作ID
+        commands: 该动作下要拒绝的命令
+        problems: 校验问题列表
+
+    Returns:
+        bool: 是否还会重新生成命令；超过修正次数上限时返回False，命令和动作标记为failed
+    """
+    action = Action.query.filter_by(action_id=action_id).first() if action_id else None
+    retry = action is not None and action.fix_attempts < config.OPERATOR_COMMAND_FIX_ATTEMPTS
+    status = 'rejected' if retry else 'failed'
+    for command in commands:
+        command.command_status = status
+        command.command_result = {"error": format_fix_hint(problems), "problems": problems}
+        metrics.inc('command_validation_rejected', command_type=command.command_type)
+
+    if action is None:
+        logger.warning(f"命令未通过校验，动作不存在，无法修正: {action_id}, {problems}")
+        return False
+    if retry:
+        action.fix_attempts += 1
+        action.fix_hint = format_fix_hint(problems)
+        action.action_status = 'pending'
+        logger.warning(f"动作 {action_id} 的命令未通过校验，第 {action.fix_attempts} 次要求修正: {problems}")
+    else:
+        action.action_status = 'failed'
+        logger.error(f"动作 {action_id} 的命令修正 {action.fix_attempts} 次后仍未通过校验: {problems}")
+    return retry
+
+
+def reject_action_commands(command, problems):
+    """下发前校验失败时拒绝命令（不提交）
+
+    _operator会重新生成动作的全部命令，与创建时校验相同，同一动作还未下发的命令一起拒绝；
+    动作的其他命令已经下发或执行完成时，重新生成会重复执行这些命令，只将该命令标记为failed
+
+    Args:
+        command: 未通过校验的pending命令
+        problems: 校验问题列表
+
+    Returns:
+        bool: 是否还会重新生成命令
+    """
+    siblings = Command.query.filter(
+        Command.action_id == command.action_id,
+        Command.command_id != command.command_id
+    ).all() if command.action_id else []
+
+    dispatched = [other.command_id for other in siblings
+                  if other.command_status not in ('pending', 'rejected', 'superseded')]
+    if dispatched:
+        logger.warning(f"动作 {command.action_id} 的命令已经下发 {dispatched}，不再重新生成，"
+                       f"未通过校验的命令 {command.command_id} 标记为失败: {problems}")
+        metrics.inc('command_validation_rejected', command_type=command.command_type)
+        command.command_status = 'failed'
+        command.command_result = {"error": format_fix_hint(problems), "problems": problems}
+        return False
+
+    # 以pending为条件比较并设置，已被其他执行器认领的命令不会被拒绝
+    pending = []
+    for other in siblings:
+        if other.command_status != 'pending':
+            continue
+        claimed = db.session.execute(
+            update(Command).where(Command.command_id == other.command_id, Command.command_status == 'pending')
+            .values(command_status='rejected'),
+            execution_options={'synchronize_session': 'fetch'}
+        ).rowcount == 1
+        if claimed:
+            pending.append(other)
+    return reject_commands(command.action_id, [command] + pending, problems)
+
+
+def supersede_rejected_commands(action_id):
+    """动作的命令已重新生成，原来未通过校验的命令不再处理（不提交）"""
+    rejected = Command.query.filter_by(action_id=action_id, command_status='rejected').all()
+    for command in rejected:
+        command.command_status = 'superseded'
+    return len(rejected)
@@ -0,0 +1,57 @@
+"""事件状态转换
+
+所有对Event.status的修改都通过transition_event_status完成：
+    UPDATE events SET status=:to, version=version+1 WHERE event_id=:id AND status=:from [AND version=:version]
+由数据库保证"检查状态并修改"是原子的，多个进程同时推进同一事件时只有一个会成功，
+失败的一方根据返回值放弃本次转换，无需先expire_all()再重新查询确认状态。
+"""
+import logging
+from sqlalchemy import update
+from app.models import db, Event
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def transition_event_status(event_id, from_status, to_status, expected_version=None, commit=True, **values):
+    """比较并设置事件状态
+
+    Args:
+        event_id: 事件ID
+        from_status: 期望的当前状态，可以是单个状态或状态列表
+        to_status: 目标状态
+        expected_version: 期望的版本号，为None时不校验版本
+        commit: 是否立即提交事务；为False时由调用方与其他修改一起提交
+        **values: 与状态一起更新的其他字段，如current_round、context
+
+    Returns:
+        bool: 转换是否成功；事件不存在或状态/版本已被其他进程修改时返回False
+    """
+    from_statuses = [from_status] if isinstance(from_status, str) else list(from_status)
+
+    stmt = update(Event).where(Event.event_id == event_id, Event.status.in_(from_statuses))
+    if expected_version is not None:
+        stmt = stmt.where(Event.version == expected_version)
+    stmt = stmt.values(status=to_status, version=Event.version + 1, **values)
+
+    # fetch方式只同步数据库中实际被更新的记录，会话中已加载的事件对象不会被错误地修改
+    result = db.session.execute(stmt, execution_options={'synchronize_session': 'fetch'})
+    if commit:
+        db.session.commit()
+
+    transition = f"{'|'.join(from_statuses)}->{to_status}"
+    if result.rowcount != 1:
+        metrics.inc('event_transition_conflicts', transition=transition)
+        logger.info(f"事件 {event_id} 状态转换 {transition} 未生效，状态已被其他进程修改或事件不存在")
+        return False
+
+    metrics.inc('event_transitions', transition=transition)
+    return True
+
+
+def get_event(event_id):
+    """从数据库读取事件的最新数据
+
+    只刷新这一条记录，不会像expire_all()那样让会话中的所有对象失效
+    """
+    return Event.query.filter_by(event_id=event_id).populate_existing().first()
@@ -0,0 +1,312 @@
+"""_executor基于asyncio的剧本命令执行池（EXECUTOR_MODE=async）
+
+ExecutorPool的工作线程在启动剧本时阻塞等待SOAR响应，同时启动的剧本数受线程数限制。
+蠕虫爆发等场景需要同时启动、跟踪数百个处置剧本，AsyncExecutorPool在一个事件循环线程中完成：
+1. 通过AsyncSOARClient启动剧本、查询状态和结果，等待SOAR响应时不占用线程
+2. 读写数据库仍是同步操作，交给EXECUTOR_WORKERS个工作线程执行，每个任务使用独立的应用上下文
+3. 认领、并发限制、执行记录、重启后恢复跟踪与ExecutorPool相同；
+   轮询间隔同样按剧本学习到的执行耗时决定首次查询时间，之后指数退避
+4. 相同签名的命令依次启动，后启动的命令复用先启动的活动；共享同一活动的命令只轮询一次
+5. 批量调用（submit_batch）在工作线程中检查缓存和相同调用，合并参数后在事件循环中启动一次剧本
+6. 启用SOAR回调时，每SOAR_CALLBACK_CHECK_INTERVAL秒检查已由回调记录结果的活动，唤醒并结束对应的轮询
+"""
+import time
+import asyncio
+import threading
+import logging
+from app.config import config
+from app.utils.metrics import metrics
+from app.utils.soar_client_async import AsyncSOARClient
+from app.services.executor_pool import ExecutorPool
+from app.services.playbook_service import get_playbook_timeout
+from app.services.soar_poller import TrackedActivity
+from app.utils.soar_client import get_execute_status, SUCCESS_STATUSES, FAILED_STATUSES, SOARActivityFailed
+from app.services.playbook_registry import command_signature
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncExecutorPool(ExecutorPool):
+    """基于asyncio的剧本命令执行池"""
+
+    def __init__(self, app, workers=None):
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name='executor-async', daemon=True)
+        self._loop_thread.start()
+        self.client = AsyncSOARClient()
+        # 正在启动的剧本调用 {命令签名: Future}，以及正在跟踪的活动 {activity_id: Task}，只在事件循环中访问
+        self._starting = {}
+        self._activity_tasks = {}
+        # 正在轮询的活动 {activity_id: asyncio.Event}，活动已由SOAR回调记录结果时设置
+        self._finished_events = {}
+        super().__init__(app, workers)
+        if config.SOAR_CALLBACK_ENABLED:
+            asyncio.run_coroutine_threadsafe(self._watch_finished(), self._loop)
+
+    def _create_poller(self):
+        # 活动在事件循环中跟踪，不需要轮询线程
+        return None
+
+    def submit(self, command, playbook_id):
+        """认领命令并在事件循环中启动剧本
+
+        Returns:
+            bool: 是否提交成功；命令已被其他执行器认领时返回False
+        """
+        from app.services.executor_service import claim_command
+
+        command_id = command.command_id
+        if not claim_command(command_id):
+            logger.info(f"命令已被其他执行器认领: {command_id}")
+            return False
+
+        self._acquire(playbook_id)
+        logger.info(f"提交剧本命令到异步执行池: {command_id}, 剧本: {playbook_id}")
+        asyncio.run_coroutine_threadsafe(self._run(command_id, playbook_id, time.monotonic()), self._loop)
+        return True
+
+    def submit_batch(self, commands, playbook_id):
+        """认领多个命令，合并为一次剧本调用在事件循环中启动
+
+        Returns:
+            int: 认领成功并提交的命令数
+        """
+        from app.services.executor_service import claim_command
+
+        command_ids = [command.command_id for command in commands if claim_command(command.command_id)]
+        if not command_ids:
+            return 0
+
+        for _ in command_ids:
+            self._acquire(playbook_id)
+        logger.info(f"提交批量剧本命令到异步执行池: {len(command_ids)} 个命令, 剧本: {playbook_id}")
+        asyncio.run_coroutine_threadsafe(self._run_batch(command_ids, playbook_id, time.monotonic()), self._loop)
+        return len(command_ids)
+
+    def _track(self, command_id, playbook_id, activity_id, started, timeout, polls=0, resumed=False):
+        asyncio.run_coroutine_threadsafe(
+            self._wait(command_id, playbook_id, activity_id, started, timeout, polls, resumed), self._loop)
+
+    async def _in_worker(self, func, *args):
+        """在工作线程中执行数据库操作"""
+        return await self._loop.run_in_executor(self._executor, func, *args)
+
+    async def _run(self, command_id, playbook_id, started):
+        """启动剧本，并等待执行完成"""
+        try:
+            dispatched = None
+            while True:
+                prepared = await self._in_worker(self._get_request, command_id)
+                if prepared is None:
+                    break
+                dispatched, request = prepared
+                if dispatched:
+                    break
+                signature = command_signature(*request)
+                pending = self._starting.get(signature)
+                if pending is None:
+                    break
+                # 相同的剧本调用正在启动，等待其启动后重新检查，复用其活动
+                await asyncio.shield(pending)
+
+            if prepared is not None and not dispatched:
+                dispatched = await self._execute(command_id, signature, *request)
+        except Exception as e:
+            logger.error(f"异步执行池启动命令 {command_id} 时出错: {str(e)}")
+            dispatched = None
+        if not dispatched:
+            self._release(playbook_id, started)
+            return
+
+        await self._wait(command_id, playbook_id, dispatched['activity_id'], started, get_playbook_timeout(playbook_id))
+
+    async def _execute(self, command_id, signature, request_playbook_id, params):
+        """调用SOAR启动剧本并记录执行记录"""
+        self._starting[signature] = self._loop.create_future()
+        try:
+            activity_id = None
+            if request_playbook_id:
+                activity_id = await self.client.execute_playbook(request_playbook_id, params)
+            return await self._in_worker(
+                self._start, command_id,
+                lambda service, command: service.record_started(command, request_playbook_id, activity_id))
+        finally:
+            self._starting.pop(signature).set_result(None)
+
+    async def _run_batch(self, command_ids, playbook_id, started):
+        """合并启动多个命令的剧本，并等待执行完成"""
+        dispatched = {}
+        try:
+            dispatched, remaining, params, targets = await self._in_worker(
+                self._get_batch_request, command_ids, playbook_id)
+            if remaining:
+                activity_id = await self.client.execute_playbook(playbook_id, params)
+                dispatched.update(await self._in_worker(
+                    self._start_batch, remaining, playbook_id,
+                    lambda service, commands: service.record_batch_started(commands, playbook_id, activity_id, targets)))
+        except Exception as e:
+            logger.error(f"异步执行池批量启动命令时出错: {str(e)}")
+
+        timeout = get_playbook_timeout(playbook_id)
+        waits = []
+        for command_id in command_ids:
+            if command_id in dispatched:
+                waits.append(self._wait(command_id, playbook_id, dispatched[command_id]['activity_id'], started, timeout))
+            else:
+                self._release(playbook_id, started)
+        await asyncio.gather(*waits)
+
+    def _get_batch_request(self, command_ids, playbook_id):
+        """检查批量命令的结果缓存和相同的剧本调用，合并其余命令的参数
+
+        Returns:
+            (复用执行中活动的启动结果 {command_id: 结果}, 需要调用SOAR的命令ID列表, 合并后的参数, 各命令的目标)；
+            其他已有结果的命令已完成
+        """
+        from app.models import Command
+        from app.services.playbook_service import PlaybookService
+        from app.services.executor_service import complete_command, fail_command
+
+        with self.app.app_context():
+            commands = Command.query.filter(Command.command_id.in_(command_ids)).all()
+            service = PlaybookService()
+            try:
+                results, remaining = service.prepare_batch(commands, playbook_id)
+            except Exception as e:
+                for command in commands:
+                    fail_command(command, e)
+                return {}, [], None, {}
+
+            dispatched = {}
+            for command in commands:
+                result = results.get(command.command_id)
+                if result and result.get('status') == 'dispatched':
+                    dispatched[command.command_id] = result
+                elif result:
+                    complete_command(command, result)
+            if not remaining:
+                return dispatched, [], None, {}
+            params, targets = service.batch_request(playbook_id, remaining)
+            return dispatched, [command.command_id for command in remaining], params, targets
+
+    def _get_request(self, command_id):
+        """读取命令要执行的剧本ID和参数，并检查结果缓存和相同的剧本调用
+
+        Returns:
+            (复用执行中活动的启动结果, None) 或 (None, (剧本ID, 参数))；
+            命令不存在、命中结果缓存或复用了已完成的结果（命令已完成）时返回None
+        """
+        from app.models import Command
+        from app.services.playbook_service import PlaybookService
+        from app.services.executor_service import complete_command, fail_command
+
+        with self.app.app_context():
+            command = Command.query.filter_by(command_id=command_id).first()
+            if not command:
+                return None
+            service = PlaybookService()
+            playbook_id, params = service.get_playbook_request(command)
+            try:
+                done = (service.get_cached_result(command, playbook_id, params) or
+                        service.attach_to_existing(command, playbook_id, params))
+            except Exception as e:
+                fail_command(command, e)
+                return None
+            if done and done.get('status') == 'dispatched':
+                return done, None
+            if done:
+                complete_command(command, done)
+                return None
+            return None, (playbook_id, params)
+
+    async def _wait(self, command_id, playbook_id, activity_id, started, timeout, polls=0, resumed=False):
+        """等待活动执行完成或超时，再交给工作线程记录结果"""
+        task = self._activity_tasks.get(activity_id)
+        if task is None:
+            task = self._loop.create_task(self._poll_activity(playbook_id, activity_id, timeout, polls, resumed))
+            self._activity_tasks[activity_id] = task
+            task.add_done_callback(lambda _: self._activity_tasks.pop(activity_id, None))
+        activity = await asyncio.shield(task)
+        self._executor.submit(self._finish, command_id, playbook_id, activity_id, activity.future, started)
+
+    async def _poll_activity(self, playbook_id, activity_id, timeout, polls, resumed):
+        """轮询活动状态直到执行完成或超时"""
+        first_delay = None if resumed else self.stats.first_poll_delay(playbook_id)
+        activity = TrackedActivity(activity_id, playbook_id, max(timeout, 0), polls,
+                                   first_delay=first_delay, learn=not resumed)
+        finished = self._finished_events[activity_id] = asyncio.Event()
+        result = None
+        error = None
+        try:
+            while True:
+                if await self._wait_finished(finished, max(activity.next_poll_at - time.monotonic(), 0)):
+                    # 执行结果已由SOAR回调记录
+                    metrics.inc('soar_callback_completions')
+                    break
+                activity.polls += 1
+                metrics.inc('soar_status_requests')
+                polled_at = time.monotonic()
+                execute_status = get_execute_status(await self.client.get_playbook_status(activity_id))
+                if execute_status in SUCCESS_STATUSES:
+                    if activity.learn:
+                        self._executor.submit(self._learn, playbook_id, activity.estimate_duration(polled_at))
+                    result = await self.client.get_playbook_result(activity_id)
+                    break
+                if execute_status in FAILED_STATUSES:
+                    # 与SOARActivityPoller相同，失败状态立即结束跟踪
+                    logger.warning(f"剧本执行失败: {activity_id}, 状态: {execute_status}")
+                    metrics.inc('soar_activity_failures', playbook=playbook_id, status=execute_status)
+                    error = SOARActivityFailed(activity_id, execute_status)
+                    break
+
+                self._executor.submit(self._record_poll, activity)
+                now = time.monotonic()
+                if now >= activity.deadline:
+                    logger.warning(f"剧本执行超时: {activity_id}")
+                    metrics.inc('soar_activity_timeouts', playbook=playbook_id)
+                    break
+                activity.schedule_next(polled_at, now)
+        except Exception as e:
+            logger.error(f"跟踪SOAR活动时出错: {activity_id}, {str(e)}")
+        finally:
+            self._finished_events.pop(activity_id, None)
+
+        metrics.observe('soar_activity_seconds', time.monotonic() - activity.started, playbook=playbook_id)
+        metrics.observe('soar_polls_per_activity', activity.polls)
+        if error is not None:
+            activity.future.set_exception(error)
+        else:
+            activity.future.set_result(result)
+        return activity
+
+    @staticmethod
+    async def _wait_finished(finished, timeout):
+        """等待到下一次轮询时间，活动已由SOAR回调记录结果时提前返回True"""
+        try:
+            await asyncio.wait_for(finished.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _watch_finished(self):
+        """定期检查已由SOAR回调记录结果的活动"""
+        while True:
+            await asyncio.sleep(config.SOAR_CALLBACK_CHECK_INTERVAL)
+            activity_ids = list(self._finished_events)
+            if not activity_ids:
+                continue
+            try:
+                finished = await self._in_worker(self._finished_activities, activity_ids)
+            except Exception as e:
+                logger.error(f"检查SOAR回调记录的活动失败: {str(e)}")
+                continue
+            for activity_id in finished:
+                event = self._finished_events.get(activity_id)
+                if event is not None:
+                    event.set()
+
+    def _learn(self, playbook_id, duration):
+        try:
+            self.stats.record(playbook_id, duration)
+        except Exception as e:
+            logger.error(f"记录剧本执行耗时失败: {playbook_id}, {str(e)}")
@@ -0,0 +1,322 @@
+"""_executor剧本命令并行执行池
+
+剧本命令需要等待SOAR执行完成，单线程顺序执行时吞吐量被限制为同一时间一个剧本。
+ExecutorPool并行执行剧本命令：
+1. 调度线程按优先级和事件公平调度选出命令，通过pending -> processing比较并设置认领后提交给线程池
+2. 工作线程启动剧本后把activity_id交给SOARActivityPoller统一轮询，不再阻塞等待；
+   剧本执行完成后再由工作线程记录执行结果、更新命令状态
+3. 每个工作线程使用独立的应用上下文，数据库会话在任务结束时随应用上下文一起释放
+4. 同时执行中的剧本命令数受EXECUTOR_MAX_ACTIVITIES限制，
+   同一剧本同时执行的数量受EXECUTOR_PLAYBOOK_CONCURRENCY限制，避免压垮SOAR
+5. 剧本启动后activity_id、轮询次数和截止时间保存在processing状态的执行记录上，
+   执行器重启时resume()据此继续跟踪执行中的剧本，不会重复启动
+6. 各剧本的执行耗时统计由PlaybookStatsStore持久化，轮询器据此决定首次查询状态的时间
+7. 剧本目录声明了batch_param的剧本，调度线程把参数兼容的多个待处理命令通过submit_batch合并为一次剧本调用，
+   各命令仍分别占用执行名额，共享同一个活动，执行完成后结果按目标拆分到各自的执行记录
+8. 启用SOAR回调时，执行结果可能已由Web进程的回调接口记录，轮询器通过_finished_activities发现后结束跟踪，
+   只释放执行名额，不再重复更新命令状态
+"""
+import time
+import threading
+import logging
+from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import update
+from app.models import db, Command, Execution
+from app.config import config
+from app.utils.metrics import metrics
+from app.services.playbook_service import PlaybookService, parse_playbook_settings, get_playbook_timeout
+from app.services.soar_poller import SOARActivityPoller
+from app.services.playbook_stats import PlaybookStatsStore
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorPool:
+    """剧本命令并行执行池"""
+
+    def __init__(self, app, workers=None, poller=None):
+        self.app = app
+        self.workers = max(workers or config.EXECUTOR_WORKERS, 1)
+        self.max_activities = max(config.EXECUTOR_MAX_ACTIVITIES, 1)
+        self.playbook_limits = parse_playbook_settings(config.EXECUTOR_PLAYBOOK_CONCURRENCY)
+        self.default_playbook_limit = config.EXECUTOR_PLAYBOOK_DEFAULT_CONCURRENCY
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='executor-worker')
+        self._condition = threading.Condition()
+        self._running = 0
+        self._running_playbooks = defaultdict(int)
+
+        self.stats = PlaybookStatsStore(app)
+        self.stats.load()
+        self.poller = poller or self._create_poller()
+
+    def _create_poller(self):
+        """创建并启动SOAR活动轮询器"""
+        poller = SOARActivityPoller(on_poll=self._record_poll, stats=self.stats, finished=self._finished_activities)
+        poller.start()
+        return poller
+
+    def has_capacity(self):
+        """执行中的剧本命令是否未达到上限"""
+        with self._condition:
+            return self._running < self.max_activities
+
+    def playbook_available(self, playbook_id):
+        """剧本是否未达到同时执行上限"""
+        limit = self.playbook_limits.get(str(playbook_id), self.default_playbook_limit)
+        if limit <= 0:
+            return True
+        with self._condition:
+            return self._running_playbooks[str(playbook_id)] < limit
+
+    def available(self):
+        """还可以提交的剧本命令数"""
+        with self._condition:
+            return max(self.max_activities - self._running, 0)
+
+    def wait(self, timeout):
+        """等待有剧本命令执行完成，或超时"""
+        with self._condition:
+            self._condition.wait(timeout)
+
+    def submit(self, command, playbook_id):
+        """认领命令并提交给线程池执行
+
+        Args:
+            command: 待处理的命令对象
+            playbook_id: 剧本ID
+
+        Returns:
+            bool: 是否提交成功；命令已被其他执行器认领时返回False
+        """
+        from app.services.executor_service import claim_command
+
+        command_id = command.command_id
+        if not claim_command(command_id):
+            logger.info(f"命令已被其他执行器认领: {command_id}")
+            return False
+
+        self._acquire(playbook_id)
+        logger.info(f"提交剧本命令到执行池: {command_id}, 剧本: {playbook_id}")
+        self._executor.submit(self._dispatch, command_id, playbook_id, time.monotonic())
+        return True
+
+    def submit_batch(self, commands, playbook_id):
+        """认领多个命令，合并为一次剧本调用提交给线程池
+
+        Args:
+            commands: 可以合并的待处理命令
+            playbook_id: 剧本ID
+
+        Returns:
+            int: 认领成功并提交的命令数
+        """
+        from app.services.executor_service import claim_command
+
+        command_ids = [command.command_id for command in commands if claim_command(command.command_id)]
+        if not command_ids:
+            return 0
+
+        for _ in command_ids:
+            self._acquire(playbook_id)
+        logger.info(f"提交批量剧本命令到执行池: {len(command_ids)} 个命令, 剧本: {playbook_id}")
+        self._executor.submit(self._dispatch_batch, command_ids, playbook_id, time.monotonic())
+        return len(command_ids)
+
+    def resume(self):
+        """执行器启动时恢复跟踪执行中的剧本
+
+        1. processing状态且有activity_id的执行记录：按剩余时间继续轮询，不重新启动剧本
+        2. 处于processing状态但没有执行记录的剧本命令：无法确定剧本是否已启动，为避免重复执行标记为失败
+        """
+        from app.services.executor_service import fail_command, get_command_playbook_id
+
+        with self.app.app_context():
+            now = datetime.utcnow()
+            executions = Execution.query.filter(
+                Execution.execution_status == 'processing',
+                Execution.activity_id.isnot(None)
+            ).all()
+            for execution in executions:
+                command = Command.query.filter_by(command_id=execution.command_id).first()
+                if not command:
+                    continue
+                playbook_id = get_command_playbook_id(command)
+                if execution.deadline_at:
+                    remaining = (execution.deadline_at - now).total_seconds()
+                else:
+                    remaining = get_playbook_timeout(playbook_id)
+                self._acquire(playbook_id)
+                self._track(command.command_id, playbook_id, execution.activity_id, time.monotonic(),
+                            timeout=remaining, polls=execution.poll_count or 0, resumed=True)
+                logger.info(f"恢复跟踪执行中的剧本: 命令 {command.command_id}, 活动 {execution.activity_id}, "
+                            f"剩余时间 {max(remaining, 0):.0f}s")
+
+            orphans = Command.query.filter(
+                Command.command_type == 'playbook',
+                Command.command_status == 'processing',
+                ~Command.command_id.in_(db.session.query(Execution.command_id).filter(Execution.command_id.isnot(None)))
+            ).all()
+            for command in orphans:
+                logger.warning(f"命令 {command.command_id} 处于执行中但没有剧本执行记录，无法确定剧本是否已启动，标记为失败")
+                fail_command(command, Exception("执行器重启，剧本启动状态未知"))
+
+            if executions or orphans:
+                logger.info(f"恢复跟踪 {len(executions)} 个执行中的剧本，{len(orphans)} 个命令标记为失败")
+
+    def _dispatch(self, command_id, playbook_id, started):
+        """工作线程：启动剧本，并把活动交给轮询器跟踪"""
+        try:
+            dispatched = self._start(command_id)
+        except Exception as e:
+            logger.error(f"执行池启动命令 {command_id} 时出错: {str(e)}")
+            dispatched = None
+        if not dispatched:
+            self._release(playbook_id, started)
+            return
+
+        self._track(command_id, playbook_id, dispatched['activity_id'], started, timeout=get_playbook_timeout(playbook_id))
+
+    def _dispatch_batch(self, command_ids, playbook_id, started):
+        """工作线程：合并启动多个命令的剧本，并把活动交给轮询器跟踪"""
+        try:
+            dispatched = self._start_batch(command_ids, playbook_id)
+        except Exception as e:
+            logger.error(f"执行池批量启动命令时出错: {str(e)}")
+            dispatched = {}
+
+        timeout = get_playbook_timeout(playbook_id)
+        for command_id in command_ids:
+            if command_id in dispatched:
+                self._track(command_id, playbook_id, dispatched[command_id]['activity_id'], started, timeout=timeout)
+            else:
+                self._release(playbook_id, started)
+
+    def _track(self, command_id, playbook_id, activity_id, started, timeout, polls=0, resumed=False):
+        """把活动交给轮询器跟踪"""
+        future = self.poller.track(activity_id, playbook_id, timeout=timeout, polls=polls, resumed=resumed)
+        # 轮询器在执行完成时回调，把结果交回线程池处理，不阻塞轮询线程
+        future.add_done_callback(
+            lambda f: self._executor.submit(self._finish, command_id, playbook_id, activity_id, f, started))
+
+    def _record_poll(self, activity):
+        """持久化轮询状态，由轮询线程调用"""
+        with self.app.app_context():
+            db.session.execute(
+                update(Execution).where(
+                    Execution.activity_id == str(activity.activity_id),
+                    Execution.execution_status == 'processing'
+                ).values(poll_count=activity.polls, last_polled_at=datetime.utcnow()),
+                execution_options={'synchronize_session': False}
+            )
+            db.session.commit()
+
+    def _finished_activities(self, activity_ids):
+        """返回其中已没有processing执行记录（已由SOAR回调记录结果）的活动ID"""
+        with self.app.app_context():
+            rows = db.session.query(Execution.activity_id).filter(
+                Execution.activity_id.in_([str(a) for a in activity_ids]),
+                Execution.execution_status == 'processing'
+            ).distinct().all()
+        processing = {row[0] for row in rows}
+        return [a for a in activity_ids if str(a) not in processing]
+
+    def _start(self, command_id, start=None):
+        """启动剧本
+
+        Args:
+            command_id: 命令ID
+            start: 启动函数start(service, command)，返回启动结果；默认调用PlaybookService.start_playbook
+
+        Returns:
+            启动结果；命令不存在或启动失败时返回None，失败结果已更新到命令上
+        """
+        from app.services.executor_service import complete_command, fail_command
+
+        with self.app.app_context():
+            command = Command.query.filter_by(command_id=command_id).first()
+            if not command:
+                return None
+            try:
+                service = PlaybookService()
+                dispatched = start(service, command) if start else service.start_playbook(command)
+            except Exception as e:
+                fail_command(command, e)
+                return None
+            if dispatched.get('status') != 'dispatched':
+                complete_command(command, dispatched)
+                return None
+            return dispatched
+
+    def _start_batch(self, command_ids, playbook_id, start=None):
+        """合并启动多个命令的剧本
+
+        Args:
+            command_ids: 命令ID列表
+            playbook_id: 剧本ID
+            start: 启动函数start(service, commands)，返回 {command_id: 启动结果}；默认调用PlaybookService.start_batch
+
+        Returns:
+            {command_id: 启动结果}，只包含启动成功的命令，其余命令的结果已更新到命令上
+        """
+        from app.services.executor_service import complete_command, fail_command
+
+        with self.app.app_context():
+            commands = Command.query.filter(Command.command_id.in_(command_ids)).all()
+            try:
+                service = PlaybookService()
+                results = start(service, commands) if start else service.start_batch(commands, playbook_id)
+            except Exception as e:
+                for command in commands:
+                    fail_command(command, e)
+                return {}
+            dispatched = {}
+            for command in commands:
+                result = results.get(command.command_id) or {"status": "failed", "message": "剧本未启动"}
+                if result.get('status') == 'dispatched':
+                    dispatched[command.command_id] = result
+                else:
+                    complete_command(command, result)
+            return dispatched
+
+    def _finish(self, command_id, playbook_id, activity_id, future, started):
+        """工作线程：记录剧本执行结果并更新命令状态"""
+        from app.services.executor_service import complete_command, fail_command
+
+        try:
+            with self.app.app_context():
+                command = Command.query.filter_by(command_id=command_id).first()
+                if not command:
+                    return
+                try:
+                    # SOAR返回失败状态时Future为SOARActivityFailed异常，执行记录和命令记为失败
+                    error = future.exception()
+                    result = PlaybookService().finish_playbook(command, playbook_id, activity_id,
+                                                               None if error else future.result(), error=error)
+                    # 执行结果已由SOAR回调等记录时，命令状态也已更新
+                    if not result.get('already_recorded'):
+                        complete_command(command, result)
+                except Exception as e:
+                    fail_command(command, e)
+        except Exception as e:
+            logger.error(f"执行池处理命令 {command_id} 的执行结果时出错: {str(e)}")
+        finally:
+            self._release(playbook_id, started)
+
+    def _acquire(self, playbook_id):
+        """占用执行名额"""
+        with self._condition:
+            self._running += 1
+            self._running_playbooks[str(playbook_id)] += 1
+            metrics.set_gauge('executor_running', self._running)
+
+    def _release(self, playbook_id, started):
+        """剧本命令结束，释放执行名额"""
+        metrics.observe('executor_command_seconds', time.monotonic() - started, playbook=playbook_id)
+        with self._condition:
+            self._running -= 1
+            self._running_playbooks[str(playbook_id)] -= 1
+            metrics.set_gauge('executor_running', self._running)
+            self._condition.notify_all()
@@ -3,11 +3,17 @@ import uuid
 import json
 from datetime import datetime
 from flask import current_app
-from sqlalchemy import func
+from sqlalchemy import func, update
 from app.models import db, Event, Task, Action, Command, Execution, Message
 from app.controllers.socket_controller import broadcast_message
 from app.services.playbook_service import PlaybookService
+from app.services.command_validation import validate_command, reject_action_commands, format_fix_hint
+from app.services.playbook_registry import batch_key, get_batch_spec
 from app.utils.message_utils import create_standard_message
+from app.config import config
+from app.utils.metrics import PeriodicReporter
+from app.services.executor_pool import ExecutorPool
+from app.services.scheduling import sort_by_priority, record_queue_depth, record_queue_wait, FairScheduler
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,11 +22,113 @@ def get_pending_commands():
     """获取待处理的命令
     
     Returns:
-        待处理的命令列表
+        待处理的命令列表，按有效优先级排序
     """
     # 查询所有pending状态的命令
-    pending_commands = Command.query.filter_by(command_status='pending').order_by(Command.created_at.asc()).all()
-    return pending_commands
+    pending_commands = Command.query.filter_by(command_status='pending').all()
+    record_queue_depth('executor', pending_commands)
+    return sort_by_priority(pending_commands)
+
+def get_inflight_commands_by_event():
+    """获取各事件正在执行中的命令数量
+    
+    Returns:
+        字典，键为event_id，值为processing状态的命令数量
+    """
+    rows = db.session.query(Command.event_id, func.count(Command.id)).filter(
+        Command.command_status == 'processing'
+    ).group_by(Command.event_id).all()
+    return {event_id: count for event_id, count in rows}
+
+def get_command_playbook_id(command):
+    """获取剧本命令的剧本ID，非剧本命令返回None"""
+    if command.command_type != 'playbook' or not isinstance(command.command_entity, dict):
+        return None
+    return command.command_entity.get('playbook_id')
+
+def collect_batch(command, candidates, capacity, inflight_by_event):
+    """收集可以与command合并为一次剧本调用的待处理命令
+    
+    剧本目录中声明了batch_param的剧本，除批量参数外参数相同的命令可以合并，
+    按候选命令的优先级顺序选择，受剧本的batch_max、执行池剩余名额和单个事件同时执行上限限制
+    
+    Args:
+        command: 调度选出的命令
+        candidates: 按优先级排序的候选命令
+        capacity: 执行池还可以提交的命令数
+        inflight_by_event: 各事件正在执行中的命令数量
+    
+    Returns:
+        命令列表，第一个为command；不能合并时只包含command
+    """
+    playbook_id = get_command_playbook_id(command)
+    key = batch_key(playbook_id, command.command_params) if config.EXECUTOR_BATCH_ENABLED else None
+    if key is None:
+        return [command]
+    
+    limit = min(get_batch_spec(playbook_id)['max'] or config.EXECUTOR_BATCH_MAX_TARGETS, capacity)
+    max_per_event = config.EXECUTOR_MAX_INFLIGHT_PER_EVENT
+    inflight = dict(inflight_by_event)
+    inflight[command.event_id] = inflight.get(command.event_id, 0) + 1
+    batch = [command]
+    for other in candidates:
+        if len(batch) >= limit:
+            break
+        if other is command or str(get_command_playbook_id(other)) != str(playbook_id):
+            continue
+        if max_per_event > 0 and inflight.get(other.event_id, 0) >= max_per_event:
+            continue
+        if batch_key(playbook_id, other.command_params) != key or not check_command(other):
+            continue
+        batch.append(other)
+        inflight[other.event_id] = inflight.get(other.event_id, 0) + 1
+    return batch
+
+def claim_command(command_id):
+    """认领待处理命令：pending -> processing
+    
+    以比较并设置的方式更新，多个工作线程或进程同时认领同一命令时只有一个会成功
+    
+    Args:
+        command_id: 命令ID
+    
+    Returns:
+        bool: 是否认领成功
+    """
+    result = db.session.execute(
+        update(Command).where(Command.command_id == command_id, Command.command_status == 'pending')
+        .values(command_status='processing'),
+        execution_options={'synchronize_session': 'fetch'}
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def check_command(command):
+    """下发前按剧本目录校验剧本命令，补全参数默认值
+    
+    未通过校验的命令被拒绝，不会调用SOAR；关联动作连同其他未下发的命令交回_operator修正，
+    动作的其他命令已经下发时只将该命令标记为失败
+    
+    Args:
+        command: 命令对象
+    
+    Returns:
+        bool: 是否可以下发
+    """
+    problems = validate_command(command)
+    if not problems:
+        if db.session.is_modified(command):
+            db.session.commit()
+        return True
+    
+    if not reject_action_commands(command, problems):
+        update_action_status(command.action_id, 'failed')
+    db.session.commit()
+    create_command_message(command, {
+        "status": "failed",
+        "message": format_fix_hint(problems)
+    })
+    return False
 
 def process_command(command):
     """处理单个命令
@@ -34,6 +142,14 @@ def process_command(command):
     command.command_status = 'processing'
     db.session.commit()
     
+    run_command(command)
+
+def run_command(command):
+    """执行已处于processing状态的命令，并更新命令和动作状态
+    
+    Args:
+        command: 命令对象
+    """
     result = None
     
     try:
@@ -53,45 +169,64 @@ def process_command(command):
                 "message": error_msg
             }
         
-        # 更新命令状态和结果
-        if result and result.get('status') == 'success':
-            command.command_status = 'completed'
-            command.command_result = result.get('data', {})
-            
-            # 更新关联的动作状态
-            update_action_status(command.action_id, 'completed')
-        else:
-            command.command_status = 'failed'
-            command.command_result = {
-                "error": result.get('message') if result else "未知错误"
-            }
-            
-            # 更新关联的动作状态
-            update_action_status(command.action_id, 'failed')
-        
-        db.session.commit()
-        
-        # 创建消息记录
-        create_command_message(command, result)
+        complete_command(command, result)
         
     except Exception as e:
-        error_msg = f"处理命令时出错: {str(e)}"
-        logger.error(error_msg)
+        fail_command(command, e)
+
+def complete_command(command, result):
+    """根据执行结果更新命令和关联动作的状态，并创建消息记录
+    
+    Args:
+        command: 命令对象
+        result: 执行结果
+    """
+    # 更新命令状态和结果
+    if result and result.get('status') == 'success':
+        command.command_status = 'completed'
+        command.command_result = result.get('data', {})
         
-        # 更新命令状态为失败
+        # 更新关联的动作状态
+        update_action_status(command.action_id, 'completed')
+    else:
         command.command_status = 'failed'
-        command.command_result = {"error": str(e)}
+        command.command_result = {
+            "error": result.get('message') if result else "未知错误"
+        }
         
         # 更新关联的动作状态
         update_action_status(command.action_id, 'failed')
-        
-        db.session.commit()
-        
-        # 创建错误消息记录
-        create_command_message(command, {
-            "status": "failed",
-            "message": error_msg
-        })
+    
+    db.session.commit()
+    
+    # 创建消息记录
+    create_command_message(command, result)
+
+def fail_command(command, e):
+    """处理命令时出现异常，将命令和关联动作标记为失败
+    
+    Args:
+        command: 命令对象
+        e: 异常
+    """
+    error_msg = f"处理命令时出错: {str(e)}"
+    logger.error(error_msg)
+    db.session.rollback()
+    
+    # 更新命令状态为失败
+    command.command_status = 'failed'
+    command.command_result = {"error": str(e)}
+    
+    # 更新关联的动作状态
+    update_action_status(command.action_id, 'failed')
+    
+    db.session.commit()
+    
+    # 创建错误消息记录
+    create_command_message(command, {
+        "status": "failed",
+        "message": error_msg
+    })
 
 def execute_playbook_command(command):
     """执行SOAR剧本命令
@@ -158,6 +293,9 @@ def update_action_status(action_id, status):
     """
     action = Action.query.filter_by(action_id=action_id).first()
     if action:
+        if action.action_status == 'pending' and action.fix_hint:
+            # 动作的其他命令未通过校验，正在等待_operator修正，由修正后的命令决定动作状态
+            return
         action.action_status = status
         db.session.commit()
 
@@ -195,22 +333,70 @@ def run_executor():
     # 导入Flask应用
     from main import app
     
+    # 定期输出队列深度、等待时间等指标
+    reporter = PeriodicReporter(config.METRICS_LOG_INTERVAL)
+    # 事件之间加权公平调度
+    scheduler = FairScheduler('executor')
+    
+    # 剧本命令并行执行池
+    if config.EXECUTOR_MODE == 'async':
+        from app.services.executor_async import AsyncExecutorPool
+        pool = AsyncExecutorPool(app)
+        logger.info(f"剧本异步执行池已启动，数据库工作线程数: {pool.workers}")
+    else:
+        pool = ExecutorPool(app)
+        logger.info(f"剧本执行池已启动，线程数: {pool.workers}")
+    # 恢复跟踪重启前执行中的剧本
+    pool.resume()
+    
     # 使用应用上下文
     with app.app_context():
         while True:
+            reporter.maybe_report()
             try:
+                # 执行池已满时等待有工作线程完成
+                if not pool.has_capacity():
+                    pool.wait(1)
+                    continue
+                
                 # 获取待处理命令
                 pending_commands = get_pending_commands()
                 
                 if pending_commands:
                     logger.info(f"发现 {len(pending_commands)} 个待处理命令")
                     
-                    # 处理每个命令
-                    for command in pending_commands:
+                    # 已达到同时执行上限的剧本暂不调度
+                    candidates = [c for c in pending_commands
+                                  if get_command_playbook_id(c) is None or pool.playbook_available(get_command_playbook_id(c))]
+                    
+                    # 每次在事件之间加权公平地选择一个命令处理，处理完重新获取队列，
+                    # 使新到达的高优先级命令能及时被处理，单个事件也不会占满处理能力
+                    command = scheduler.select(candidates, get_inflight_commands_by_event(),
+                                               config.EXECUTOR_MAX_INFLIGHT_PER_EVENT)
+                    if command is None:
+                        logger.info("待处理命令所属事件或剧本都已达到同时执行上限，等待中...")
+                        pool.wait(1)
+                        continue
+                    
+                    record_queue_wait('executor', [command])
+                    if not check_command(command):
+                        continue
+                    playbook_id = get_command_playbook_id(command)
+                    if playbook_id is None:
+                        # 人工命令等不需要等待外部系统的命令，直接在调度线程中处理
                         process_command(command)
+                        continue
+                    
+                    # 支持批量调用的剧本，把参数兼容的其他待处理命令合并为一次剧本调用
+                    batch = collect_batch(command, candidates, pool.available(), get_inflight_commands_by_event())
+                    if len(batch) > 1:
+                        pool.submit_batch(batch, playbook_id)
+                    else:
+                        pool.submit(command, playbook_id)
                 else:
                     logger.info("没有待处理命令，等待中...")
                     time.sleep(5)
             except Exception as e:
+                db.session.rollback()
                 logger.error(f"处理命令时出错: {str(e)}")
-                time.sleep(5) 
\ No newline at end of file
+                time.sleep(5)
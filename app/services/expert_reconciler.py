@@ -0,0 +1,376 @@
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from app.models import db, Event, Task, Command, Execution
+from app.models.counters import repair_outstanding_counters, COMMAND_TERMINAL_STATUSES, TASK_TERMINAL_STATUSES
+from app.config import config
+from app.utils.metrics import metrics, PeriodicReporter
+from app.services.event_state import transition_event_status, get_event
+from app.services.expert_service import (
+    get_executions_for_summarization,
+    group_executions_for_summarization,
+    split_summary_units,
+    process_execution_summary_group,
+    claim_execution_for_summarization,
+    release_summarizing_executions,
+    get_commands_with_completed_executions,
+    get_tasks_with_completed_commands,
+    get_event_rounds_with_completed_tasks,
+    check_command_completion,
+    update_command_status,
+    check_task_completion,
+    check_and_update_event_tasks_completion,
+    generate_event_summary,
+)
+
+logger = logging.getLogger(__name__)
+
+# 需要由_expert继续推进的事件状态
+ACTIVE_EVENT_STATUSES = ('processing', 'tasks_completed', 'round_finished')
+
+
+class ExpertReconciler:
+    """_expert状态协调器
+
+    用一个线程替代原来的7个轮询线程：
+    1. 通过updated_at水位线增量发现变更的执行、命令、任务和事件（变更事件）
+    2. 自下而上地推进 执行 -> 命令 -> 任务 -> 事件轮次 的状态
+    3. 在尽量少的事务中完成事件状态链：
+       processing -> tasks_completed -> to_be_summarized -> summarized -> round_finished -> pending
+    4. 定期做一次全量扫描，兜底处理遗漏的变更，并重新计算未完成计数器修复偏差
+    5. EXPERT_SUMMARY_WORKERS大于1时，执行摘要交给工作线程池并发生成：协调线程以completed -> summarizing
+       认领执行结果后提交给工作线程，工作线程使用独立的应用上下文和数据库会话，生成摘要后通知协调线程推进状态；
+       未能生成摘要的执行结果退回completed，EXPERT_SUMMARY_RETRY_DELAY秒后重试
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.poll_interval = config.EXPERT_RECONCILE_INTERVAL
+        self.sweep_interval = config.EXPERT_FULL_SWEEP_INTERVAL
+        self.repair_interval = config.EXPERT_COUNTER_REPAIR_INTERVAL
+        self.change_overlap = timedelta(seconds=config.EXPERT_CHANGE_OVERLAP)
+        self.reporter = PeriodicReporter(config.METRICS_LOG_INTERVAL)
+
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._dirty_commands = set()
+        self._dirty_tasks = set()
+        self._dirty_events = set()
+        self._watermark = None
+        self._last_sweep = 0
+        self._last_repair = 0
+        # 事件总结失败后的重试时间，避免失败时反复请求大模型
+        self._summary_retry_at = {}
+
+        self.summary_workers = max(config.EXPERT_SUMMARY_WORKERS, 1)
+        self._summary_pool = None
+        if self.summary_workers > 1:
+            self._summary_pool = ThreadPoolExecutor(max_workers=self.summary_workers, thread_name_prefix='expert-summary')
+        # 执行摘要失败后的重试时间
+        self._execution_retry_at = {}
+
+    def notify(self, event_id=None, task_id=None, command_id=None):
+        """通知协调器有实体发生变更，并唤醒协调线程"""
+        with self._lock:
+            if command_id:
+                self._dirty_commands.add(command_id)
+            if task_id:
+                self._dirty_tasks.add(task_id)
+            if event_id:
+                self._dirty_events.add(event_id)
+        self._wakeup.set()
+
+    def run(self):
+        """协调器主循环"""
+        with self.app.app_context():
+            logger.info("启动_expert状态协调器")
+            if self._summary_pool:
+                if self.summary_workers > config.LLM_MAX_CONCURRENCY:
+                    logger.warning(f"EXPERT_SUMMARY_WORKERS({self.summary_workers})大于LLM_MAX_CONCURRENCY({config.LLM_MAX_CONCURRENCY})，"
+                                   f"超出的工作线程将等待大模型并发名额")
+                # 进程中断时正在生成摘要的执行结果退回completed重新生成
+                released = release_summarizing_executions()
+                if released:
+                    logger.info(f"{released} 个执行结果在上次运行中未完成摘要，重新生成")
+                logger.info(f"执行摘要工作线程池已启动，线程数: {self.summary_workers}")
+            while True:
+                try:
+                    did_work = self.run_once()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"状态协调时出错: {str(e)}")
+                    did_work = False
+
+                self.reporter.maybe_report()
+
+                if not did_work:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+
+    def run_once(self):
+        """执行一轮协调
+
+        Returns:
+            本轮是否完成了需要调用大模型的工作
+        """
+        started = time.monotonic()
+
+        self._scan_changes()
+        if time.monotonic() - self._last_repair >= self.repair_interval:
+            self._last_repair = time.monotonic()
+            repair_outstanding_counters()
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self._full_sweep()
+        self._propagate()
+
+        metrics.observe('expert_reconcile_pass_seconds', time.monotonic() - started)
+
+        # 大模型相关的工作每完成一个单元都立即向上推进状态，保证状态流转不被长耗时调用阻塞
+        did_work = False
+        # 同一事件同一轮次的执行结果一起生成摘要，可以合并为一次大模型请求
+        if self._summary_pool:
+            did_work = self._submit_execution_summaries()
+        else:
+            for executions in group_executions_for_summarization(get_executions_for_summarization()):
+                process_execution_summary_group(executions)
+                for execution in executions:
+                    if execution.execution_status == 'summarized':
+                        did_work = True
+                    self.notify(event_id=execution.event_id, command_id=execution.command_id)
+                self._propagate()
+
+        for event in Event.query.filter_by(status='to_be_summarized').order_by(Event.updated_at.asc()).all():
+            retry_at = self._summary_retry_at.get(event.event_id)
+            if retry_at and retry_at > time.monotonic():
+                continue
+            if self._summarize_event(event):
+                did_work = True
+            self._propagate()
+
+        return did_work
+
+    def _submit_execution_summaries(self):
+        """认领待总结的执行结果，提交给摘要工作线程池
+
+        Returns:
+            是否提交了执行摘要
+        """
+        now = time.monotonic()
+        with self._lock:
+            retry_at = dict(self._execution_retry_at)
+        executions = [execution for execution in get_executions_for_summarization()
+                      if retry_at.get(execution.execution_id, 0) <= now]
+
+        submitted = False
+        for group in group_executions_for_summarization(executions):
+            for unit in split_summary_units(group):
+                claimed = [(execution.execution_id, execution.event_id, execution.command_id)
+                           for execution in unit if claim_execution_for_summarization(execution.execution_id)]
+                if claimed:
+                    self._summary_pool.submit(self._summarize_executions, claimed)
+                    submitted = True
+        return submitted
+
+    def _summarize_executions(self, claimed):
+        """摘要工作线程：为认领的执行结果生成摘要，完成后通知协调线程
+
+        Args:
+            claimed: 认领的执行结果 [(execution_id, event_id, command_id)]
+        """
+        execution_ids = [execution_id for execution_id, _, _ in claimed]
+        started = time.monotonic()
+        # 每个任务使用独立的应用上下文和数据库会话
+        with self.app.app_context():
+            try:
+                executions = Execution.query.filter(Execution.execution_id.in_(execution_ids)) \
+                    .order_by(Execution.created_at.asc()).all()
+                process_execution_summary_group(executions)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"生成执行摘要时出错: {str(e)}")
+
+            # 未能生成摘要的执行结果退回completed，稍后重试
+            try:
+                failed = [execution.execution_id for execution in Execution.query.filter(
+                    Execution.execution_id.in_(execution_ids), Execution.execution_status == 'summarizing').all()]
+                release_summarizing_executions(failed)
+            except Exception as e:
+                db.session.rollback()
+                failed = []
+                logger.error(f"退回未完成摘要的执行结果时出错: {str(e)}")
+
+        metrics.observe('expert_execution_summary_seconds', time.monotonic() - started)
+        with self._lock:
+            for execution_id in execution_ids:
+                if execution_id in failed:
+                    self._execution_retry_at[execution_id] = time.monotonic() + config.EXPERT_SUMMARY_RETRY_DELAY
+                else:
+                    self._execution_retry_at.pop(execution_id, None)
+        for _, event_id, command_id in claimed:
+            self.notify(event_id=event_id, command_id=command_id)
+
+    def _scan_changes(self):
+        """根据updated_at水位线，增量发现其他进程写入的变更"""
+        now = datetime.utcnow()
+        if self._watermark is None:
+            # 首次运行由全量扫描负责
+            self._watermark = now
+            return
+        since = self._watermark - self.change_overlap
+
+        command_ids = db.session.query(Execution.command_id).filter(
+            Execution.updated_at >= since
+        ).distinct().all()
+        task_ids = db.session.query(Command.task_id).filter(
+            Command.updated_at >= since,
+            Command.command_status.in_(COMMAND_TERMINAL_STATUSES)
+        ).distinct().all()
+        event_ids = db.session.query(Task.event_id).filter(
+            Task.updated_at >= since,
+            Task.task_status.in_(TASK_TERMINAL_STATUSES)
+        ).distinct().all()
+        event_ids += db.session.query(Event.event_id).filter(
+            Event.updated_at >= since,
+            Event.status.in_(ACTIVE_EVENT_STATUSES)
+        ).all()
+
+        with self._lock:
+            self._dirty_commands.update(row[0] for row in command_ids if row[0])
+            self._dirty_tasks.update(row[0] for row in task_ids if row[0])
+            self._dirty_events.update(row[0] for row in event_ids if row[0])
+
+        self._watermark = now
+
+    def _full_sweep(self):
+        """全量扫描，兜底发现遗漏的状态变更"""
+        self._last_sweep = time.monotonic()
+
+        commands = get_commands_with_completed_executions()
+        rounds = get_event_rounds_with_completed_tasks()
+        tasks = get_tasks_with_completed_commands()
+        events = Event.query.filter(Event.status.in_(['tasks_completed', 'round_finished'])).all()
+
+        with self._lock:
+            self._dirty_commands.update(command.command_id for command in commands)
+            self._dirty_tasks.update(task.task_id for task in tasks)
+            self._dirty_events.update(event_id for event_id, _ in rounds)
+            self._dirty_events.update(event.event_id for event in events)
+
+    def _propagate(self):
+        """自下而上推进 命令 -> 任务 -> 事件 的状态"""
+        with self._lock:
+            command_ids, self._dirty_commands = self._dirty_commands, set()
+            task_ids, self._dirty_tasks = self._dirty_tasks, set()
+            event_ids, self._dirty_events = self._dirty_events, set()
+
+        for command_id in command_ids:
+            command = Command.query.filter_by(command_id=command_id).first()
+            if not command:
+                continue
+            if command.command_status == 'processing' and check_command_completion(command_id):
+                # update_command_status会继续向上检查任务和事件轮次
+                update_command_status(command_id)
+            if command.task_id:
+                task_ids.add(command.task_id)
+            if command.event_id:
+                event_ids.add(command.event_id)
+
+        for task_id in task_ids:
+            task = Task.query.filter_by(task_id=task_id).first()
+            if not task:
+                continue
+            if task.task_status == 'processing':
+                check_task_completion(task_id)
+            if task.event_id:
+                event_ids.add(task.event_id)
+
+        for event_id in event_ids:
+            self._advance_event(event_id)
+
+    def _advance_event(self, event_id):
+        """推进不需要调用大模型的事件状态"""
+        event = get_event(event_id)
+        if not event:
+            return
+
+        if event.status == 'processing' and check_and_update_event_tasks_completion(event_id, event.current_round or 1):
+            event = get_event(event_id)
+
+        if event.status == 'tasks_completed':
+            self._apply_transitions(event, 'to_be_summarized')
+        elif event.status == 'round_finished':
+            # 正常情况下round_finished不会停留，这里处理进程中断后遗留的事件
+            self._finish_round(event)
+
+    def _summarize_event(self, event):
+        """生成事件总结，并在同一事务中完成轮次的收尾
+
+        Returns:
+            是否成功生成总结
+        """
+        event_id = event.event_id
+        entered_at = event.updated_at
+
+        generate_event_summary(event_id)
+
+        event = get_event(event_id)
+        if not event or event.status != 'summarized':
+            self._summary_retry_at[event_id] = time.monotonic() + config.EXPERT_SUMMARY_RETRY_DELAY
+            return False
+
+        self._summary_retry_at.pop(event_id, None)
+        self._observe('to_be_summarized', 'summarized', entered_at)
+        self._finish_round(event)
+        return True
+
+    def _finish_round(self, event):
+        """summarized -> round_finished -> pending(下一轮) / completed，在一个事务中完成"""
+        current_round = event.current_round or 1
+        if current_round >= config.EVENT_MAX_ROUND:
+            logger.info(f"事件已达到最大轮次，标记为已完成: {event.event_id}")
+            if event.status == 'summarized':
+                self._apply_transitions(event, 'round_finished', 'completed')
+            else:
+                self._apply_transitions(event, 'completed')
+            return
+
+        # 新轮次的未完成计数器从0开始
+        next_round = current_round + 1
+        if event.status == 'summarized':
+            applied = self._apply_transitions(event, 'round_finished', 'pending', current_round=next_round,
+                                              pending_tasks=0, pending_executions=0)
+        else:
+            applied = self._apply_transitions(event, 'pending', current_round=next_round,
+                                              pending_tasks=0, pending_executions=0)
+        if applied:
+            logger.info(f"事件推进到下一轮: {event.event_id}, 新轮次: {next_round}")
+
+    def _apply_transitions(self, event, *statuses, **values):
+        """以一次比较并设置完成多个事件状态转换，并记录每个转换的延迟
+
+        中间状态不会写入数据库，只用于记录转换延迟指标
+
+        Returns:
+            转换是否成功；事件状态已被其他进程修改时返回False
+        """
+        event_id = event.event_id
+        from_status = event.status
+        entered_at = event.updated_at
+        if not transition_event_status(event_id, from_status, statuses[-1], expected_version=event.version, **values):
+            return False
+
+        transitions = list(zip((from_status,) + statuses[:-1], statuses))
+        for i, (from_, to_) in enumerate(transitions):
+            # 同一事务中的后续转换没有额外等待
+            self._observe(from_, to_, entered_at if i == 0 else None)
+        logger.info(f"事件 {event_id} 状态流转: {' -> '.join((from_status,) + statuses)}")
+        return True
+
+    def _observe(self, from_status, to_status, entered_at):
+        """记录状态转换延迟：从进入原状态到完成转换的时间"""
+        latency = 0.0
+        if entered_at:
+            latency = (datetime.utcnow() - entered_at).total_seconds()
+        metrics.observe('expert_transition_seconds', latency, transition=f"{from_status}->{to_status}")
@@ -4,18 +4,37 @@ import json
 import threading
 from datetime import datetime
 from flask import current_app
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, case, update
 from app.models import db, Event, Task, Action, Command, Execution, Summary, Message
+from app.models.counters import EXECUTION_TERMINAL_STATUSES, COMMAND_TERMINAL_STATUSES, TASK_TERMINAL_STATUSES
 from app.services.llm_service import call_llm, parse_yaml_response
 from app.controllers.socket_controller import broadcast_message
 from app.services.prompt_service import PromptService
 from app.config import config
 from app.utils.message_utils import create_standard_message
+from app.utils.metrics import metrics
+from app.services.event_state import transition_event_status, get_event
+from app.services.result_store import load_result_text, result_hash
+from app.services.playbook_registry import command_signature
+from app.services.summarizers import render_summary
+from app.services.result_pruner import prune_result, minify, estimate_tokens
 import logging
 import yaml
 
 logger = logging.getLogger(__name__)
 
+def _count_not_in(column, statuses):
+    """聚合表达式：统计状态不在指定列表中的行数"""
+    return func.sum(case((column.in_(statuses), 0), else_=1))
+
+def _read_counter(counter, *criteria):
+    """直接从数据库读取计数器的当前值，避免使用会话中缓存的旧值"""
+    return db.session.query(counter).filter(*criteria).scalar()
+
+def _exists(model, *criteria):
+    """判断是否存在满足条件的记录"""
+    return db.session.query(db.session.query(model.id).filter(*criteria).exists()).scalar()
+
 def get_executions_for_summarization():
     """获取需要生成摘要的执行结果
     
@@ -29,10 +48,17 @@ def get_executions_for_summarization():
         Execution.execution_status.in_(['completed'])
     ).order_by(Execution.created_at.asc()).all()
     
-    logger.info(f"找到 {len(completed_executions)} 个completed状态的执行结果需要生成摘要")
+    if completed_executions:
+        logger.info(f"找到 {len(completed_executions)} 个completed状态的执行结果需要生成摘要")
     
     return completed_executions
 
+# 执行摘要的系统提示词
+EXECUTION_SUMMARY_SYSTEM_PROMPT = """
+        你是一个经验丰富的安全专家，擅长从执行结果中提取关键信息，并用精炼的文字生成适合人类阅读的文本。
+        请不要做总结评论，只保留客观结果。
+        """
+
 def process_execution_summary(execution):
     """处理单个执行结果，生成摘要
     
@@ -42,136 +68,400 @@ def process_execution_summary(execution):
     logger.info(f"处理执行结果摘要: {execution.execution_id}")
     
     try:
-        # 获取执行结果
-        execution_result = execution.execution_result
-        if not execution_result:
-            logger.warning(f"执行结果为空: {execution.execution_id}")
-            return
-        
-        # 如果执行结果是字符串（JSON字符串），则解析为对象
-        if isinstance(execution_result, str):
-            try:
-                execution_result = json.loads(execution_result)
-            except json.JSONDecodeError:
-                # 如果不是有效的JSON，则保持原样
-                pass
-        
-        # 获取关联的命令、动作和任务信息
-        command = Command.query.filter_by(command_id=execution.command_id).first()
-        action = Action.query.filter_by(action_id=execution.action_id).first() if execution.action_id else None
-        task = Task.query.filter_by(task_id=execution.task_id).first() if execution.task_id else None
-        
-        # 构建上下文信息
-        context = {
-            "execution_id": execution.execution_id,
-            "command_id": execution.command_id,
-            "command_name": command.command_name if command else "未知命令",
-            "command_type": command.command_type if command else "未知类型",
-            "action_id": execution.action_id,
-            "action_name": action.action_name if action else "未知动作",
-            "task_id": execution.task_id,
-            "task_name": task.task_name if task else "未知任务",
-            "event_id": execution.event_id,
-            "round_id": execution.round_id,
-            "execution_status": execution.execution_status,
-            "execution_result": execution_result,
-            "req_id": str(uuid.uuid4()),
-            "res_id": str(uuid.uuid4())
-        }
-        
-        # 将上下文转换为JSON格式
-        json_context = json.dumps(context, indent=2, ensure_ascii=False)
+        pending = prepare_execution_summary(execution)
+        if pending:
+            summarize_with_llm(pending)
+    except Exception as e:
+        error_msg = f"处理执行结果摘要时出错: {str(e)}"
+        logger.error(error_msg)
 
-        # 构建系统提示词
-        system_prompt = """
-        你是一个经验丰富的安全专家，擅长从执行结果中提取关键信息，并用精炼的文字生成适合人类阅读的文本。
-        请不要做总结评论，只保留客观结果。
-        """
-        
-        # 构建用户提示词
-        user_prompt = f"""
+def prepare_execution_summary(execution):
+    """生成执行摘要前的准备，可以复用已有摘要或使用模板时直接保存摘要
+    
+    Args:
+        execution: 执行对象
+    
+    Returns:
+        需要由大模型生成摘要时返回待总结项 {"execution", "json_context", "result_hash", "tokens_saved"}，否则返回None
+    """
+    # 获取完整执行结果，较大的结果从execution_blobs表加载
+    result_text = load_result_text(execution)
+    if not result_text:
+        logger.warning(f"执行结果为空: {execution.execution_id}")
+        return None
+    execution_result = result_text
+    
+    # 如果执行结果是字符串（JSON字符串），则解析为对象
+    if isinstance(execution_result, str):
+        try:
+            execution_result = json.loads(execution_result)
+        except json.JSONDecodeError:
+            # 如果不是有效的JSON，则保持原样
+            pass
+    
+    # 获取关联的命令、动作和任务信息
+    command = Command.query.filter_by(command_id=execution.command_id).first()
+    action = Action.query.filter_by(action_id=execution.action_id).first() if execution.action_id else None
+    task = Task.query.filter_by(task_id=execution.task_id).first() if execution.task_id else None
+    
+    # 相同剧本调用返回了相同的结果时，直接复用已有的摘要，不再请求大模型
+    result_hash = get_execution_result_hash(execution, command, result_text)
+    source = find_reusable_summary(execution, result_hash)
+    if source:
+        logger.info(f"复用执行记录 {source.execution_id} 的摘要: {execution.execution_id}")
+        metrics.inc('expert_summary_reused')
+        save_execution_summary(execution, source.ai_summary, 'reused', result_hash,
+                               summary_ref=source.summary_ref or source.execution_id)
+        return None
+    
+    # 结构固定的剧本结果直接用模板生成摘要
+    playbook_id = get_command_playbook_id(command) if command else None
+    summary = render_summary(playbook_id, execution_result, command.command_params if command else None,
+                             size=len(result_text))
+    if summary:
+        logger.info(f"使用模板生成摘要: {execution.execution_id}")
+        metrics.inc('expert_summary_template', playbook=playbook_id)
+        save_execution_summary(execution, summary, 'template', result_hash)
+        return None
+    
+    # 构建上下文信息
+    context = {
+        "execution_id": execution.execution_id,
+        "command_id": execution.command_id,
+        "command_name": command.command_name if command else "未知命令",
+        "command_type": command.command_type if command else "未知类型",
+        "action_id": execution.action_id,
+        "action_name": action.action_name if action else "未知动作",
+        "task_id": execution.task_id,
+        "task_name": task.task_name if task else "未知任务",
+        "event_id": execution.event_id,
+        "round_id": execution.round_id,
+        "execution_status": execution.execution_status,
+        "execution_result": execution_result,
+        "req_id": str(uuid.uuid4()),
+        "res_id": str(uuid.uuid4())
+    }
+    
+    # 精简执行结果，去掉空白后转换为JSON格式，记录与原来indent=2的完整结果相比节省的token数
+    original_tokens = estimate_tokens(json.dumps(context, indent=2, ensure_ascii=False))
+    context["execution_result"] = prune_result(playbook_id, execution_result)
+    json_context = minify(context)
+    tokens_saved = max(original_tokens - estimate_tokens(json_context), 0)
+    metrics.inc('expert_summary_tokens_saved', tokens_saved)
+    
+    return {
+        "execution": execution,
+        "json_context": json_context,
+        "result_hash": result_hash,
+        "tokens_saved": tokens_saved
+    }
+
+def summarize_with_llm(pending):
+    """由大模型为单个执行结果生成摘要
+    
+    Args:
+        pending: prepare_execution_summary返回的待总结项
+    """
+    execution = pending['execution']
+    
+    # 构建用户提示词
+    user_prompt = f"""
             ```json
-            {json_context}
+            {pending['json_context']}
             ```
             以上是基于_caption的任务安排，和_manager的动作细化，以及_operator的命令设置，通过SOAR安全之剧本执行的返回结果。
             当然也有可能是，人类工程师在页面手工完成的处置结果。
             请从信息提炼的角度，帮我提取关键信息，作客观结果的保留，不需要做总结评论。
             简单地说，就是告诉我剧本做了什么，得到了什么结果，不窜改，不臆造。
             """
-        
-        # 调用大模型生成摘要
-        prompt_service = PromptService('_expert')
-        # 使用自定义系统提示词
-        # system_prompt = prompt_service.get_system_prompt()
+    
+    # 调用大模型生成摘要
+    prompt_service = PromptService('_expert')
+    # 使用自定义系统提示词
+    # system_prompt = prompt_service.get_system_prompt()
 
-        logger.info(f"生成摘要: {execution.execution_id}")
-        create_standard_message(
-            event_id=execution.event_id,
-            message_from='system',
-            round_id=execution.round_id,
-            message_type='llm_request',
-            content_data="正在请求大模型，生成执行结果摘要，请耐心等待......"
-        )
-        
-        # 使用长文本模型
-        response = call_llm(system_prompt, user_prompt, temperature=0.3, long_text=True)
-        
-        logger.info(f"生成摘要成功: {execution.execution_id}\n{response}")
-        
-        # 更新执行结果的摘要字段
-        execution.ai_summary = response
-        
-        # 更新执行结果状态为已总结
-        execution.execution_status = 'summarized'
-        
-        db.session.commit()
-        
-        # 创建消息记录
-        create_execution_summary_message(execution, response)
-        
-    except Exception as e:
-        error_msg = f"处理执行结果摘要时出错: {str(e)}"
-        logger.error(error_msg)
+    logger.info(f"生成摘要: {execution.execution_id}")
+    create_standard_message(
+        event_id=execution.event_id,
+        message_from='system',
+        round_id=execution.round_id,
+        message_type='llm_request',
+        content_data="正在请求大模型，生成执行结果摘要，请耐心等待......"
+    )
+    
+    # 使用长文本模型
+    response = call_llm(EXECUTION_SUMMARY_SYSTEM_PROMPT, user_prompt, temperature=0.3, long_text=True)
+    
+    logger.info(f"生成摘要成功: {execution.execution_id}\n{response}")
+    
+    save_execution_summary(execution, response, 'llm', pending['result_hash'], tokens_saved=pending['tokens_saved'])
+
+def claim_execution_for_summarization(execution_id):
+    """认领待生成摘要的执行结果：completed -> summarizing
+    
+    以比较并设置的方式更新，多个摘要工作线程不会为同一执行结果重复生成摘要。
+    completed和summarizing都不是终态，不影响未完成计数器
+    
+    Args:
+        execution_id: 执行ID
+    
+    Returns:
+        bool: 是否认领成功
+    """
+    result = db.session.execute(
+        update(Execution).where(Execution.execution_id == execution_id, Execution.execution_status == 'completed')
+        .values(execution_status='summarizing'),
+        execution_options={'synchronize_session': 'fetch'}
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def release_summarizing_executions(execution_ids=None):
+    """把未能生成摘要的执行结果退回completed：summarizing -> completed
+    
+    Args:
+        execution_ids: 执行ID列表，为None时退回所有summarizing状态的执行结果（进程重启时恢复）
+    
+    Returns:
+        int: 退回的执行结果数
+    """
+    stmt = update(Execution).where(Execution.execution_status == 'summarizing')
+    if execution_ids is not None:
+        if not execution_ids:
+            return 0
+        stmt = stmt.where(Execution.execution_id.in_(execution_ids))
+    result = db.session.execute(stmt.values(execution_status='completed'),
+                                execution_options={'synchronize_session': 'fetch'})
+    db.session.commit()
+    return result.rowcount
+
+def split_summary_units(executions):
+    """把同一事件同一轮次的执行结果拆分为可以由摘要工作线程并发处理的单元
+    
+    启用批量摘要时每个单元最多EXPERT_SUMMARY_BATCH_MAX_SIZE个执行结果，否则每个执行结果一个单元
+    """
+    size = max(config.EXPERT_SUMMARY_BATCH_MAX_SIZE, 1) if config.EXPERT_SUMMARY_BATCH_ENABLED else 1
+    return [executions[i:i + size] for i in range(0, len(executions), size)]
+
+def group_executions_for_summarization(executions):
+    """按(event_id, round_id)分组，保持执行结果原来的顺序
+    
+    Returns:
+        执行结果列表的列表，每组属于同一事件的同一轮次
+    """
+    groups = {}
+    for execution in executions:
+        groups.setdefault((execution.event_id, execution.round_id), []).append(execution)
+    return list(groups.values())
+
+def process_execution_summary_group(executions):
+    """为同一事件同一轮次的多个执行结果生成摘要
+    
+    启用EXPERT_SUMMARY_BATCH_ENABLED时，需要由大模型生成摘要的执行结果按EXPERT_SUMMARY_BATCH_MAX_TOKENS
+    和EXPERT_SUMMARY_BATCH_MAX_SIZE合并为一次请求，大模型按execution_id分别返回摘要
+    
+    Args:
+        executions: 同一事件同一轮次的执行对象列表
+    """
+    if not config.EXPERT_SUMMARY_BATCH_ENABLED or len(executions) == 1:
+        for execution in executions:
+            process_execution_summary(execution)
+        return
+    
+    pending = []
+    for execution in executions:
+        logger.info(f"处理执行结果摘要: {execution.execution_id}")
+        try:
+            item = prepare_execution_summary(execution)
+        except Exception as e:
+            logger.error(f"处理执行结果摘要时出错: {str(e)}")
+            continue
+        if item:
+            pending.append(item)
+    
+    for batch in pack_summary_batches(pending):
+        try:
+            if len(batch) == 1:
+                summarize_with_llm(batch[0])
+            else:
+                summarize_batch_with_llm(batch)
+        except Exception as e:
+            logger.error(f"批量生成执行结果摘要时出错: {str(e)}")
+
+def pack_summary_batches(pending):
+    """按token预算和条数上限把待总结项分成多批，超过预算的单个执行结果单独成批"""
+    budget = config.EXPERT_SUMMARY_BATCH_MAX_TOKENS
+    max_size = max(config.EXPERT_SUMMARY_BATCH_MAX_SIZE, 1)
+    batches = []
+    current = []
+    tokens = 0
+    for item in pending:
+        item_tokens = estimate_tokens(item['json_context'])
+        if current and (tokens + item_tokens > budget or len(current) >= max_size):
+            batches.append(current)
+            current = []
+            tokens = 0
+        current.append(item)
+        tokens += item_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def summarize_batch_with_llm(batch):
+    """由大模型在一次请求中为多个执行结果分别生成摘要
+    
+    大模型遗漏的执行结果再单独请求生成摘要
+    
+    Args:
+        batch: prepare_execution_summary返回的待总结项列表，属于同一事件的同一轮次
+    """
+    first = batch[0]['execution']
+    contexts = ",\n".join(item['json_context'] for item in batch)
+    
+    # 构建用户提示词
+    user_prompt = f"""
+            ```json
+            [{contexts}]
+            ```
+            以上是同一事件同一轮次中{len(batch)}个命令的执行结果，来自基于_caption的任务安排，和_manager的动作细化，以及_operator的命令设置，通过SOAR安全之剧本执行的返回结果。
+            当然也有可能是，人类工程师在页面手工完成的处置结果。
+            请从信息提炼的角度，分别为每个执行结果提取关键信息，作客观结果的保留，不需要做总结评论。
+            简单地说，就是告诉我每个剧本做了什么，得到了什么结果，不窜改，不臆造。
+            请按以下YAML格式输出，每个execution_id对应一条摘要，不要遗漏：
+            ```yaml
+            summaries:
+              - execution_id: 执行ID
+                summary: |
+                  摘要内容
+            ```
+            """
+    
+    logger.info(f"批量生成摘要: 事件 {first.event_id} 轮次 {first.round_id}，共 {len(batch)} 个执行结果")
+    create_standard_message(
+        event_id=first.event_id,
+        message_from='system',
+        round_id=first.round_id,
+        message_type='llm_request',
+        content_data=f"正在请求大模型，批量生成{len(batch)}个执行结果摘要，请耐心等待......"
+    )
+    
+    response = call_llm(EXECUTION_SUMMARY_SYSTEM_PROMPT, user_prompt, temperature=0.3, long_text=True)
+    metrics.inc('expert_summary_batches')
+    
+    parsed = parse_yaml_response(response) if response else None
+    summaries = {}
+    if isinstance(parsed, dict):
+        for entry in parsed.get('summaries') or []:
+            if isinstance(entry, dict) and entry.get('execution_id') and entry.get('summary'):
+                summaries[str(entry['execution_id']).strip()] = str(entry['summary']).strip()
+    
+    missing = []
+    for item in batch:
+        execution = item['execution']
+        summary = summaries.get(execution.execution_id)
+        if not summary:
+            missing.append(item)
+            continue
+        save_execution_summary(execution, summary, 'llm_batch', item['result_hash'], tokens_saved=item['tokens_saved'])
+    metrics.inc('expert_summary_batched', len(batch) - len(missing))
+    
+    if missing:
+        logger.warning(f"批量生成摘要时大模型遗漏了 {len(missing)} 个执行结果，单独生成摘要")
+        for item in missing:
+            summarize_with_llm(item)
+
+def get_command_playbook_id(command):
+    """剧本命令的剧本ID，非剧本命令返回None"""
+    if command.command_type != 'playbook':
+        return None
+    entity = command.command_entity if isinstance(command.command_entity, dict) else {}
+    return entity.get('playbook_id')
+
+def get_execution_result_hash(execution, command, result_text):
+    """执行记录的结果哈希（命令签名和规范化执行结果），非剧本命令没有签名时返回None"""
+    signature = execution.command_signature
+    if not signature and command and command.command_type == 'playbook':
+        signature = command_signature(get_command_playbook_id(command), command.command_params)
+    return result_hash(signature, result_text)
+
+def find_reusable_summary(execution, result_hash):
+    """查找结果哈希相同、已生成摘要的执行记录
+    
+    Returns:
+        可复用摘要的执行记录，没有时返回None
+    """
+    if not config.EXPERT_SUMMARY_REUSE_ENABLED or not result_hash:
+        return None
+    return Execution.query.filter(
+        Execution.result_hash == result_hash,
+        Execution.execution_status == 'summarized',
+        Execution.ai_summary.isnot(None),
+        Execution.execution_id != execution.execution_id
+    ).order_by(Execution.updated_at.desc()).first()
+
+def save_execution_summary(execution, summary, source, result_hash=None, summary_ref=None, tokens_saved=None):
+    """保存执行摘要，执行状态更新为summarized，并创建摘要消息
+    
+    Args:
+        execution: 执行对象
+        summary: 摘要内容
+        source: 摘要来源，llm、llm_batch、template或reused
+        result_hash: 执行结果哈希，用于之后相同结果复用摘要
+        summary_ref: 复用摘要时，生成该摘要的执行记录ID
+        tokens_saved: 大模型生成摘要时精简执行结果节省的token数
+    """
+    # 更新执行结果的摘要字段
+    execution.ai_summary = summary
+    execution.summary_source = source
+    execution.summary_ref = summary_ref
+    execution.result_hash = result_hash
+    execution.summary_tokens_saved = tokens_saved
+    
+    # 更新执行结果状态为已总结
+    execution.execution_status = 'summarized'
+    
+    db.session.commit()
+    
+    # 创建消息记录
+    create_execution_summary_message(execution, summary)
 
 def get_commands_with_completed_executions():
     """获取所有执行已完成但命令状态未更新的命令
     
+    通过GROUP BY/HAVING一次查询得到结果，只返回所有执行都处于终态的processing命令
+    
     Returns:
         命令列表
     """
-    # 查询所有processing状态的命令
-    processing_commands = Command.query.filter_by(command_status='processing').all()
-    
-    # 过滤出所有执行已完成的命令
-    result = []
-    for command in processing_commands:
-        if check_command_completion(command.command_id):
-            result.append(command)
-    
-    return result
+    return Command.query.join(
+        Execution, Execution.command_id == Command.command_id
+    ).filter(
+        Command.command_status == 'processing'
+    ).group_by(
+        Command.id
+    ).having(
+        _count_not_in(Execution.execution_status, EXECUTION_TERMINAL_STATUSES) == 0
+    ).all()
 
 def check_command_completion(command_id):
     """检查命令下的所有执行是否已完成
     
+    基于命令上的未完成执行计数器判断，不再逐条加载执行记录
+    
     Args:
         command_id: 命令ID
     
     Returns:
         是否所有执行都已完成
     """
-    # 获取命令下的所有执行
-    executions = Execution.query.filter_by(command_id=command_id).all()
+    pending = _read_counter(Command.pending_executions, Command.command_id == command_id)
     
-    # 如果没有执行记录，返回False
-    if not executions:
+    # 命令不存在或仍有未完成的执行
+    if pending is None or pending > 0:
         return False
     
-    # 检查是否所有执行都已完成
-    for execution in executions:
-        if execution.execution_status not in ['summarized', 'failed']:
-            return False
-    
-    return True
+    # 如果没有执行记录，返回False
+    return _exists(Execution, Execution.command_id == command_id)
 
 def update_command_status(command_id):
     """更新命令状态
@@ -185,74 +475,63 @@ def update_command_status(command_id):
         logger.warning(f"命令不存在: {command_id}")
         return
     
-    # 获取命令下的所有执行
-    executions = Execution.query.filter_by(command_id=command_id).all()
+    # 如果有执行仍在处理中，则保持原状态
+    if _read_counter(Command.pending_executions, Command.command_id == command_id) > 0:
+        return
     
     # 如果没有执行记录，返回
-    if not executions:
+    if not _exists(Execution, Execution.command_id == command_id):
         logger.warning(f"命令没有执行记录: {command_id}")
         return
     
-    # 检查执行状态
-    has_failed = any(execution.execution_status == 'failed' for execution in executions)
-    all_summarized = all(execution.execution_status == 'summarized' or execution.execution_status == 'failed' for execution in executions)
-    has_pending_or_processing = any(execution.execution_status in ['pending', 'processing', 'completed'] for execution in executions)
-    
-    # 更新命令状态
-    if has_failed and all_summarized:
-        # 如果有失败的执行，且所有执行都已经总结或失败，则标记为失败
-        command.command_status = 'failed'
-    elif all_summarized:
-        # 如果所有执行都已经总结或失败，且没有失败的执行，则标记为完成
-        command.command_status = 'completed'
-    elif has_pending_or_processing:
-        # 如果有执行仍在处理中，则保持处理中状态
-        command.command_status = 'processing'
+    # 所有执行都已经总结或失败：有失败的执行则标记为失败，否则标记为完成
+    has_failed = _exists(Execution, Execution.command_id == command_id, Execution.execution_status == 'failed')
+    command.command_status = 'failed' if has_failed else 'completed'
     
     db.session.commit()
     logger.info(f"更新命令状态: {command_id} -> {command.command_status}")
     
-    # 只有当命令状态为completed或failed时，才检查是否需要更新任务状态
-    if command.command_status in ['completed', 'failed']:
-        check_task_completion(command.task_id)
+    # 命令进入终态后，检查是否需要更新任务状态
+    check_task_completion(command.task_id)
 
 def get_tasks_with_completed_commands():
     """获取所有命令已完成但任务状态未更新的任务
     
+    通过GROUP BY/HAVING一次查询得到结果，只返回所有命令都处于终态的processing任务
+    
     Returns:
         任务列表
     """
-    # 查询所有processing状态的任务
-    processing_tasks = Task.query.filter_by(task_status='processing').all()
-    
-    # 过滤出所有命令已完成的任务
-    result = []
-    for task in processing_tasks:
-        if check_task_completion(task.task_id):
-            result.append(task)
-    
-    return result
+    return Task.query.join(
+        Command, Command.task_id == Task.task_id
+    ).filter(
+        Task.task_status == 'processing'
+    ).group_by(
+        Task.id
+    ).having(
+        _count_not_in(Command.command_status, COMMAND_TERMINAL_STATUSES) == 0
+    ).all()
 
 def check_task_completion(task_id):
     """检查任务下的所有命令是否已完成
     
+    基于任务上的未完成命令计数器判断，不再逐条加载命令记录
+    
     Args:
         task_id: 任务ID
     
     Returns:
         是否所有命令都已完成
     """
-    # 获取任务下的所有命令
-    commands = Command.query.filter_by(task_id=task_id).all()
+    pending = _read_counter(Task.pending_commands, Task.task_id == task_id)
     
-    # 如果没有命令记录，返回False
-    if not commands:
+    # 任务不存在或仍有未完成的命令
+    if pending is None or pending > 0:
         return False
     
-    # 检查是否所有命令都已完成
-    for command in commands:
-        if command.command_status not in ['completed', 'failed']:
-            return False
+    # 如果没有命令记录，返回False
+    if not _exists(Command, Command.task_id == task_id):
+        return False
     
     # 更新任务状态
     update_task_status(task_id)
@@ -271,11 +550,8 @@ def update_task_status(task_id):
         logger.warning(f"任务不存在: {task_id}")
         return
     
-    # 获取任务下的所有命令
-    commands = Command.query.filter_by(task_id=task_id).all()
-    
     # 检查是否有失败的命令
-    has_failed = any(command.command_status == 'failed' for command in commands)
+    has_failed = _exists(Command, Command.task_id == task_id, Command.command_status == 'failed')
     
     # 更新任务状态
     if has_failed:
@@ -292,53 +568,37 @@ def update_task_status(task_id):
 def get_event_rounds_with_completed_tasks():
     """获取所有任务已完成但事件轮次状态未更新的事件轮次
     
+    对processing状态的事件，按当前轮次聚合任务状态，
+    只返回任务全部处于终态、且没有未完成执行的事件轮次
+    
     Returns:
         (event_id, round_id)元组列表
     """
-    # 查询所有处理中状态的事件
-    events = Event.query.filter_by(status='processing').all()
-    
-    if not events:
-        return []
-    
-    logger.info(f"找到 {len(events)} 个processing状态的事件")
-    
-    # 获取所有事件的当前轮次任务完成情况
-    result = []
-    for event in events:
-        # 获取事件的当前轮次
-        current_round = event.current_round or 1
-        
-        # 检查该轮次的所有任务是否已完成
-        tasks = Task.query.filter_by(event_id=event.event_id, round_id=current_round).all()
-        
-        # 如果没有任务，跳过
-        if not tasks:
-            continue
-        
-        # 检查是否所有任务都已完成
-        all_completed = True
-        for task in tasks:
-            if task.task_status not in ['completed', 'failed']:
-                all_completed = False
-                break
-        
-        # 如果所有任务都已完成，添加到结果列表
-        if all_completed:
-            # 检查所有执行结果是否都已完成
-            executions = Execution.query.filter_by(event_id=event.event_id, round_id=current_round).all()
-            if executions:
-                all_executions_completed = True
-                for execution in executions:
-                    if execution.execution_status not in ['summarized', 'failed']:
-                        all_executions_completed = False
-                        break
-                if all_executions_completed:
-                    result.append((event.event_id, current_round))
-                    logger.info(f"事件 {event.event_id} 轮次 {current_round} 所有任务和执行都已完成")
-            else:
-                result.append((event.event_id, current_round))
-                logger.info(f"事件 {event.event_id} 轮次 {current_round} 所有任务已完成，没有执行记录")
+    current_round = func.coalesce(Event.current_round, 1)
+    
+    # 当前轮次存在未处于终态的执行
+    has_pending_executions = db.session.query(Execution.id).filter(
+        Execution.event_id == Event.event_id,
+        Execution.round_id == current_round,
+        Execution.execution_status.notin_(EXECUTION_TERMINAL_STATUSES)
+    ).exists()
+    
+    rows = db.session.query(
+        Event.event_id, current_round
+    ).join(
+        Task, and_(Task.event_id == Event.event_id, Task.round_id == current_round)
+    ).filter(
+        Event.status == 'processing',
+        ~has_pending_executions
+    ).group_by(
+        Event.id
+    ).having(
+        _count_not_in(Task.task_status, TASK_TERMINAL_STATUSES) == 0
+    ).all()
+    
+    result = [(event_id, round_id) for event_id, round_id in rows]
+    for event_id, round_id in result:
+        logger.info(f"事件 {event_id} 轮次 {round_id} 所有任务和执行都已完成")
     
     return result
 
@@ -354,19 +614,8 @@ def check_and_update_event_tasks_completion(event_id, round_id):
     Returns:
         是否所有任务都已完成并成功更新状态
     """
-    # 刷新会话，确保获取最新数据
-    db.session.expire_all()
-    
-    # 获取事件轮次下的所有任务
-    tasks = Task.query.filter_by(event_id=event_id, round_id=round_id).all()
-    
-    # 如果没有任务记录，返回False
-    if not tasks:
-        logger.warning(f"事件 {event_id} 轮次 {round_id} 没有任务记录")
-        return False
-    
-    # 获取事件
-    event = Event.query.filter_by(event_id=event_id).first()
+    # 获取事件的最新数据（计数器由其他进程维护）
+    event = get_event(event_id)
     if not event:
         logger.warning(f"事件不存在: {event_id}")
         return False
@@ -376,134 +625,52 @@ def check_and_update_event_tasks_completion(event_id, round_id):
         logger.info(f"事件 {event_id} 当前状态不是processing，而是 {event.status}，跳过检查")
         return False
     
-    # 检查是否所有任务都已完成
-    for task in tasks:
-        if task.task_status not in ['completed', 'failed']:
-            logger.debug(f"事件 {event_id} 轮次 {round_id} 任务 {task.task_id} 状态为 {task.task_status}，轮次未完成")
-            return False
+    # 事件上的计数器只针对当前轮次，历史轮次的任务不再推进事件状态
+    if (round_id or 1) != (event.current_round or 1):
+        logger.debug(f"事件 {event_id} 轮次 {round_id} 不是当前轮次 {event.current_round}，跳过检查")
+        return False
     
-    # 检查所有执行结果是否都已完成或失败
-    executions = Execution.query.filter_by(event_id=event_id, round_id=round_id).all()
+    # 检查当前轮次是否还有未完成的任务或执行结果（只有summarized或failed状态的执行被认为是已完成）
+    if event.pending_tasks > 0 or event.pending_executions > 0:
+        logger.debug(f"事件 {event_id} 轮次 {round_id} 还有 {event.pending_tasks} 个任务、"
+                     f"{event.pending_executions} 个执行未完成，轮次未完成")
+        return False
     
-    # 如果有执行记录，检查它们的状态
-    if executions:
-        for execution in executions:
-            # 只有summarized或failed状态的执行被认为是已完成
-            if execution.execution_status not in ['summarized', 'failed']:
-                logger.info(f"事件 {event_id} 轮次 {round_id} 有执行结果处于 {execution.execution_status} 状态，轮次未完成")
-                return False
+    # 如果没有任务记录，返回False
+    if not _exists(Task, Task.event_id == event_id, Task.round_id == round_id):
+        logger.warning(f"事件 {event_id} 轮次 {round_id} 没有任务记录")
+        return False
     
     # 检查是否有失败的任务
-    has_failed = any(task.task_status == 'failed' for task in tasks)
-    
-    # 再次刷新会话并重新获取事件，确保状态最新
-    db.session.expire_all()
-    event = Event.query.filter_by(event_id=event_id).first()
+    has_failed = _exists(Task, Task.event_id == event_id, Task.round_id == round_id, Task.task_status == 'failed')
     
-    # 如果事件在此期间被更新，再次检查状态
-    if not event or event.status != 'processing':
-        logger.info(f"事件 {event_id} 状态已被其他进程更新，当前状态: {event.status if event else '不存在'}，跳过更新")
+    # 更新事件状态，状态已被其他进程修改时放弃
+    entered_at = event.updated_at
+    to_status = 'failed' if has_failed else 'tasks_completed'
+    if not transition_event_status(event_id, 'processing', to_status):
         return False
     
-    # 更新事件状态
     if has_failed:
-        event.status = 'failed'
         logger.info(f"事件 {event_id} 有失败的任务，将状态设置为 failed")
     else:
         # 当前轮次的任务已完成，将状态设置为tasks_completed
-        event.status = 'tasks_completed'
         logger.info(f"事件 {event_id} 轮次 {round_id} 所有任务已完成，将状态设置为 tasks_completed")
     
-    db.session.commit()
+    # 记录状态转换延迟
+    if entered_at:
+        metrics.observe('expert_transition_seconds', (datetime.utcnow() - entered_at).total_seconds(),
+                        transition=f"processing->{to_status}")
     
     return True
 
-def get_events_for_summarizing():
-    """获取需要开始生成总结的事件
-    
-    Returns:
-        事件列表
-    """
-    # 刷新会话，确保获取最新数据
-    db.session.expire_all()
-    
-    # 查询tasks_completed状态的事件
-    events = Event.query.filter_by(status='tasks_completed').all()
-    
-    if events:
-        logger.info(f"找到 {len(events)} 个待开始生成总结的事件，状态: tasks_completed")
-    
-    return events
-
-def get_events_to_be_summarized():
-    """获取已经标记为待生成总结的事件
-    
-    Returns:
-        事件列表
-    """
-    # 刷新会话，确保获取最新数据
-    db.session.expire_all()
-    
-    # 查询to_be_summarized状态的事件
-    events = Event.query.filter_by(status='to_be_summarized').all()
-    
-    if events:
-        logger.info(f"找到 {len(events)} 个待生成总结的事件，状态: to_be_summarized")
-        for event in events:
-            debug_event_status(event.event_id)
-    
-    # 进行诊断，检查round_finished状态的事件
-    round_finished_events = Event.query.filter_by(status='round_finished').all()
-    if round_finished_events:
-        logger.warning(f"【事件诊断】发现 {len(round_finished_events)} 个round_finished状态的事件")
-        for event in round_finished_events:
-            debug_event_status(event.event_id)
-    
-    return events
-
-def get_events_for_next_round():
-    """获取需要推进到下一轮的事件
-    
-    Returns:
-        事件列表
-    """
-    # 刷新会话，确保获取最新数据
-    db.session.expire_all()
-    
-    # 查询round_finished状态的事件
-    events = Event.query.filter_by(status='round_finished').all()
-    
-    if events:
-        logger.info(f"找到 {len(events)} 个待推进到下一轮的事件，状态: round_finished")
-        for event in events:
-            debug_event_status(event.event_id)
-    
-    # 进行诊断，检查其他状态的事件
-    all_events = Event.query.all()
-    logger.info(f"【事件诊断】系统中共有 {len(all_events)} 个事件")
-    
-    status_counts = {}
-    for event in all_events:
-        if event.status not in status_counts:
-            status_counts[event.status] = 0
-        status_counts[event.status] += 1
-    
-    for status, count in status_counts.items():
-        logger.info(f"【事件诊断】状态为 {status} 的事件有 {count} 个")
-    
-    return events
-
 def generate_event_summary(event_id):
     """生成事件总结
     
     Args:
         event_id: 事件ID
     """
-    # 刷新会话，确保获取最新数据
-    db.session.expire_all()
-    
-    # 获取事件
-    event = Event.query.filter_by(event_id=event_id).first()
+    # 获取事件的最新数据
+    event = get_event(event_id)
     if not event:
         logger.warning(f"事件不存在: {event_id}")
         return
@@ -663,14 +830,6 @@ def generate_event_summary(event_id):
             logger.warning(f"解析事件总结时出错: {str(e)} ，使用原始响应作为总结")
             summary_text = response  # 使用原始响应作为总结
         
-        # 刷新会话，确保获取最新数据
-        db.session.expire_all()
-        # 重新获取事件，以防状态在生成总结过程中被修改
-        event = Event.query.filter_by(event_id=event_id).first()
-        if not event or event.status != 'to_be_summarized':
-            logger.warning(f"事件状态已改变，取消总结保存: {event_id}, 当前状态: {event.status if event else '不存在'}")
-            return
-            
         # 创建总结记录
         summary = Summary(
             summary_id=str(uuid.uuid4()),
@@ -681,8 +840,12 @@ def generate_event_summary(event_id):
         )
         db.session.add(summary)
         
-        # 更新事件状态为summarized
-        event.status = 'summarized'
+        # 更新事件状态为summarized，与总结记录在同一事务中提交
+        # 状态在生成总结过程中被其他进程修改时，放弃保存总结
+        if not transition_event_status(event_id, 'to_be_summarized', 'summarized', commit=False):
+            db.session.rollback()
+            logger.warning(f"事件状态已改变，取消总结保存: {event_id}")
+            return
         
         db.session.commit()
         logger.info(f"事件总结已保存: {event_id}")
@@ -707,7 +870,8 @@ def create_execution_summary_message(execution, summary):
         "command_id": execution.command_id,
         "action_id": execution.action_id,
         "task_id": execution.task_id,
-        "ai_summary": execution.ai_summary
+        "ai_summary": execution.ai_summary,
+        "summary_source": execution.summary_source
     }
     
     # 创建标准消息
@@ -745,327 +909,20 @@ def create_event_summary_message(event, summary):
         content_data=content_data
     )
 
-# 线程函数：处理执行结果摘要
-def execution_summary_worker(app):
-    """处理执行结果摘要的工作线程"""
-    with app.app_context():
-        logger.info("启动执行结果摘要处理线程")
-        while True:
-            try:
-                # 获取待处理的执行结果
-                pending_executions = get_executions_for_summarization()
-                
-                if pending_executions:
-                    logger.info(f"发现 {len(pending_executions)} 个待处理的执行结果")
-                    
-                    # 处理每个执行结果
-                    for execution in pending_executions:
-                        process_execution_summary(execution)
-                else:
-                    logger.debug("没有待处理的执行结果，等待中...")
-                    time.sleep(5)
-            except Exception as e:
-                logger.error(f"处理执行结果摘要时出错: {str(e)}")
-                time.sleep(5)
-
-# 线程函数：处理命令状态更新
-def command_status_worker(app):
-    """处理命令状态更新的工作线程"""
-    with app.app_context():
-        logger.info("启动命令状态更新线程")
-        while True:
-            try:
-                # 获取待处理的命令
-                pending_commands = get_commands_with_completed_executions()
-                
-                if pending_commands:
-                    logger.info(f"发现 {len(pending_commands)} 个待更新状态的命令")
-                    
-                    # 处理每个命令
-                    for command in pending_commands:
-                        update_command_status(command.command_id)
-                else:
-                    logger.debug("没有待更新状态的命令，等待中...")
-                    time.sleep(10)
-            except Exception as e:
-                logger.error(f"处理命令状态更新时出错: {str(e)}")
-                time.sleep(10)
-
-# 线程函数：处理任务状态更新
-def task_status_worker(app):
-    """处理任务状态更新的工作线程"""
-    with app.app_context():
-        logger.info("启动任务状态更新线程")
-        while True:
-            try:
-                # 获取待处理的任务
-                pending_tasks = get_tasks_with_completed_commands()
-                
-                if pending_tasks:
-                    logger.info(f"发现 {len(pending_tasks)} 个待更新状态的任务")
-                    
-                    # 处理每个任务
-                    for task in pending_tasks:
-                        check_task_completion(task.task_id)
-                else:
-                    logger.debug("没有待更新状态的任务，等待中...")
-                    time.sleep(15)
-            except Exception as e:
-                logger.error(f"处理任务状态更新时出错: {str(e)}")
-                time.sleep(15)
-
-# 线程函数：处理事件轮次状态更新（处理中 -> 任务完成）
-def event_round_status_worker(app):
-    """处理事件轮次状态更新的工作线程
-    
-    该线程仅负责检测任务完成情况，将事件从processing状态更新为tasks_completed
-    """
-    with app.app_context():
-        logger.info("启动事件轮次状态更新线程")
-        
-        # 初始睡眠时间和最大睡眠时间（秒）
-        sleep_time = 5
-        max_sleep_time = 10
-        
-        while True:
-            try:
-                # 刷新会话，确保获取最新数据
-                db.session.expire_all()
-                
-                # 获取待处理的事件轮次
-                pending_rounds = get_event_rounds_with_completed_tasks()
-                
-                if pending_rounds:
-                    logger.info(f"发现 {len(pending_rounds)} 个待更新状态的事件轮次")
-                    
-                    # 处理每个事件轮次
-                    for event_id, round_id in pending_rounds:
-                        # 检查任务是否完成，如果完成则更新为tasks_completed
-                        if check_and_update_event_tasks_completion(event_id, round_id):
-                            logger.info(f"事件 {event_id} 轮次 {round_id} 状态已更新为 tasks_completed")
-                    
-                    # 有事件处理时，重置睡眠时间为初始值
-                    sleep_time = 5
-                else:
-                    logger.debug("没有待更新状态的事件轮次，等待中...")
-                    
-                    # 没有事件时，逐渐增加睡眠时间，但不超过最大值
-                    sleep_time = min(sleep_time * 1.5, max_sleep_time)
-                
-                # 使用动态调整的睡眠时间
-                time.sleep(sleep_time)
-            except Exception as e:
-                logger.error(f"处理事件轮次状态更新时出错: {str(e)}")
-                time.sleep(5)  # 错误发生时使用较长的睡眠时间
-
-# 线程函数：处理事件总结开始生成（任务完成 -> 待总结）
-def event_summarizing_worker(app):
-    """处理事件标记为待总结的工作线程
-    
-    该线程负责处理tasks_completed状态的事件，将状态更新为to_be_summarized，标记为待生成总结
-    """
-    with app.app_context():
-        logger.info("启动事件总结准备线程")
-        
-        # 初始睡眠时间和最大睡眠时间（秒）
-        sleep_time = 5
-        max_sleep_time = 10
-        
-        while True:
-            try:
-                # 刷新会话，确保获取最新数据
-                db.session.expire_all()
-                
-                # 获取待处理的事件
-                pending_events = get_events_for_summarizing()
-                
-                if pending_events:
-                    logger.info(f"发现 {len(pending_events)} 个待标记为待总结的事件")
-                    
-                    # 处理每个事件
-                    for event in pending_events:
-                        # 更新事件状态为to_be_summarized
-                        event.status = 'to_be_summarized'
-                        db.session.commit()
-                        logger.info(f"事件 {event.event_id} 状态已更新为 to_be_summarized")
-                    
-                    # 有事件处理时，重置睡眠时间为初始值
-                    sleep_time = 5
-                else:
-                    logger.debug("没有待标记为待总结的事件，等待中...")
-                    
-                    # 没有事件时，逐渐增加睡眠时间，但不超过最大值
-                    sleep_time = min(sleep_time * 1.5, max_sleep_time)
-                
-                # 使用动态调整的睡眠时间
-                time.sleep(sleep_time)
-            except Exception as e:
-                logger.error(f"处理事件标记为待总结时出错: {str(e)}")
-                time.sleep(5)  # 错误发生时使用较长的睡眠时间
-
-# 线程函数：处理事件总结生成（待总结 -> 已总结 -> 轮次完成）
-def event_summary_worker(app):
-    """处理事件总结生成的工作线程
-    
-    该线程负责处理to_be_summarized状态的事件，生成总结，更新为summarized，然后是round_finished
-    """
-    with app.app_context():
-        logger.info("启动事件总结生成线程")
-        
-        # 初始睡眠时间和最大睡眠时间（秒）
-        sleep_time = 5
-        max_sleep_time = 10
-        
-        while True:
-            try:
-                # 刷新会话，确保获取最新数据
-                db.session.expire_all()
-                
-                # 获取待处理的事件
-                pending_events = get_events_to_be_summarized()
-                
-                if pending_events:
-                    logger.info(f"发现 {len(pending_events)} 个待生成总结的事件")
-                    
-                    # 处理每个事件
-                    for event in pending_events:
-                        # 生成总结，这会将状态更新为summarized
-                        generate_event_summary(event.event_id)
-                        
-                        # 重新获取事件，因为状态已更新
-                        db.session.expire_all()  # 刷新会话，确保获取最新数据
-                        event = Event.query.filter_by(event_id=event.event_id).first()
-                        if not event:
-                            continue
-                        
-                        # 如果事件状态为summarized，更新为round_finished
-                        if event.status == 'summarized':
-                            # 不再增加轮次，轮次增加由advance_event_to_next_round函数负责
-                            event.status = 'round_finished'
-                            
-                            # 如果已经达到最大轮次，则标记为已完成
-                            if event.current_round >= config.EVENT_MAX_ROUND:
-                                event.status = 'completed'
-                                logger.info(f"事件已达到最大轮次，标记为已完成: {event.event_id}, 最终状态: {event.status}")
-                            
-                            db.session.commit()
-                            logger.info(f"事件 {event.event_id} 状态已更新为 {event.status}, 当前轮次: {event.current_round}")
-                    
-                    # 有事件处理时，重置睡眠时间为初始值
-                    sleep_time = 5
-                else:
-                    logger.debug("没有待生成总结的事件，等待中...")
-                    
-                    # 没有事件时，逐渐增加睡眠时间，但不超过最大值
-                    sleep_time = min(sleep_time * 1.5, max_sleep_time)
-                
-                # 使用动态调整的睡眠时间
-                time.sleep(sleep_time)
-            except Exception as e:
-                logger.error(f"处理事件总结生成时出错: {str(e)}")
-                time.sleep(60)  # 错误发生时使用较长的睡眠时间
-
-# 线程函数：处理事件轮次推进（轮次完成 -> 待处理(下一轮)）
-def event_next_round_worker(app):
-    """处理事件轮次推进的工作线程
+def run_expert():
+    """运行_expert服务
     
-    该线程负责处理round_finished状态的事件，推进到下一轮
+    执行结果摘要、命令/任务/事件轮次状态更新、事件总结和轮次推进，
+    统一由ExpertReconciler在一个协调线程中完成
     """
-    with app.app_context():
-        logger.info("启动事件轮次推进线程")
-        
-        # 初始睡眠时间和最大睡眠时间（秒）
-        sleep_time = 5  # 减小初始睡眠时间，确保更快地检测到round_finished事件
-        max_sleep_time = 10  # 减小最大睡眠时间
-        
-        while True:
-            try:
-                # 刷新会话，确保获取最新数据
-                db.session.expire_all()
-                
-                # 获取待处理的事件
-                pending_events = get_events_for_next_round()
-                
-                if pending_events:
-                    logger.info(f"【轮次推进】发现 {len(pending_events)} 个待推进到下一轮的事件")
-                    
-                    # 处理每个事件
-                    for event in pending_events:
-                        # 如果事件状态为round_finished，且未达到最大轮次，推进到下一轮
-                        if event.status == 'round_finished' and event.current_round <= config.EVENT_MAX_ROUND:
-                            logger.info(f"【轮次推进】准备推进事件 {event.event_id} 从轮次 {event.current_round} 到下一轮")
-                            result = advance_event_to_next_round(event.event_id)
-                            if result:
-                                logger.info(f"【轮次推进】事件 {event.event_id} 成功推进到下一轮")
-                            else:
-                                logger.warning(f"【轮次推进】事件 {event.event_id} 推进到下一轮失败")
-                    
-                    # 有事件处理时，重置睡眠时间为初始值
-                    sleep_time = 5
-                else:
-                    logger.debug("没有待推进到下一轮的事件，等待中...")
-                    
-                    # 没有事件时，逐渐增加睡眠时间，但不超过最大值
-                    sleep_time = min(sleep_time * 1.5, max_sleep_time)
-                
-                # 使用动态调整的睡眠时间
-                time.sleep(sleep_time)
-            except Exception as e:
-                logger.error(f"【轮次推进】处理事件轮次推进时出错: {str(e)}")
-                time.sleep(5)  # 错误发生时使用较长的睡眠时间
-
-def run_expert():
-    """运行_expert服务"""
     logger.info("启动_expert服务...")
     
     # 导入Flask应用
     from main import app
+    from app.services.expert_reconciler import ExpertReconciler
     
-    # 创建并启动工作线程
-    threads = []
-    
-    # 线程1：处理执行结果摘要
-    t1 = threading.Thread(target=execution_summary_worker, args=(app,))
-    t1.daemon = True
-    threads.append(t1)
-    
-    # 线程2：处理命令状态更新
-    t2 = threading.Thread(target=command_status_worker, args=(app,))
-    t2.daemon = True
-    threads.append(t2)
-    
-    # 线程3：处理任务状态更新
-    t3 = threading.Thread(target=task_status_worker, args=(app,))
-    t3.daemon = True
-    threads.append(t3)
-    
-    # 线程4：处理事件轮次状态更新（处理中 -> 任务完成）
-    t4 = threading.Thread(target=event_round_status_worker, args=(app,))
-    t4.daemon = True
-    threads.append(t4)
-    
-    # 线程5：处理事件总结开始生成（任务完成 -> 待总结）
-    t5 = threading.Thread(target=event_summarizing_worker, args=(app,))
-    t5.daemon = True
-    threads.append(t5)
-    
-    # 线程6：处理事件总结生成（待总结 -> 已总结 -> 轮次完成）
-    t6 = threading.Thread(target=event_summary_worker, args=(app,))
-    t6.daemon = True
-    threads.append(t6)
-    
-    # 线程7：处理事件轮次推进（轮次完成 -> 待处理(下一轮)）
-    t7 = threading.Thread(target=event_next_round_worker, args=(app,))
-    t7.daemon = True
-    threads.append(t7)
-    
-    # 启动所有线程
-    for t in threads:
-        t.start()
-    
-    # 等待所有线程结束（实际上不会结束，除非程序被终止）
-    for t in threads:
-        t.join()
+    reconciler = ExpertReconciler(app)
+    reconciler.run()
 
 def advance_event_to_next_round(event_id):
     """将事件推进到下一轮处理
@@ -1076,11 +933,8 @@ def advance_event_to_next_round(event_id):
     Returns:
         bool: 是否成功推进到下一轮
     """
-    # 刷新会话，确保获取最新数据
-    db.session.expire_all()
-    
     # 获取事件
-    event = Event.query.filter_by(event_id=event_id).first()
+    event = get_event(event_id)
     if not event:
         logger.warning(f"事件不存在: {event_id}")
         return False
@@ -1098,12 +952,12 @@ def advance_event_to_next_round(event_id):
         logger.warning(f"事件已达到最大轮次，无法推进到下一轮: {event_id}, 当前轮次: {current_round}")
         return False
     
-    # 更新轮次和状态
-    event.current_round = current_round + 1
-    event.status = 'pending'  # 设置为待处置状态
+    # 更新轮次和状态（设置为待处置状态），新轮次的未完成计数器从0开始
+    if not transition_event_status(event_id, 'round_finished', 'pending', expected_version=event.version,
+                                   current_round=current_round + 1, pending_tasks=0, pending_executions=0):
+        return False
     
-    db.session.commit()
-    logger.info(f"事件推进到下一轮: {event_id}, 新轮次: {event.current_round}")
+    logger.info(f"事件推进到下一轮: {event_id}, 新轮次: {current_round + 1}")
     
     return True
 
@@ -1123,9 +977,7 @@ def resolve_event(event_id, resolution_note=None):
         logger.warning(f"事件不存在: {event_id}")
         return False
     
-    # 更新事件状态为已解决
-    event.status = 'resolved'
-    
+    values = {}
     # 如果有解决说明，可以保存到事件的上下文中
     if resolution_note:
         # 尝试解析现有上下文
@@ -1136,15 +988,18 @@ def resolve_event(event_id, resolution_note=None):
         
         # 添加解决说明
         context['resolution_note'] = resolution_note
-        event.context = json.dumps(context)
+        values['context'] = json.dumps(context)
     
-    db.session.commit()
+    # 更新事件状态为已解决，基于读取时的状态和版本号，期间被其他进程修改则失败
+    if not transition_event_status(event_id, event.status, 'resolved', expected_version=event.version, **values):
+        logger.warning(f"事件状态已被其他进程修改，解决失败: {event_id}")
+        return False
     logger.info(f"事件已人工解决: {event_id}")
     
     # 生成最终的事件总结
     # 首先更新事件状态为to_be_summarized
-    event.status = 'to_be_summarized'
-    db.session.commit()
+    if not transition_event_status(event_id, 'resolved', 'to_be_summarized'):
+        return True
     
     # 生成总结
     generate_event_summary(event_id)
@@ -1157,10 +1012,7 @@ def debug_event_status(event_id):
     Args:
         event_id: 事件ID
     """
-    # 刷新会话，确保获取最新数据
-    db.session.expire_all()
-    
-    event = Event.query.filter_by(event_id=event_id).first()
+    event = get_event(event_id)
     if not event:
         logger.warning(f"事件不存在: {event_id}")
         return
@@ -1,9 +1,13 @@
 import os
 import json
+import time
+import threading
 import requests
 import yaml
 from dotenv import load_dotenv
 from app.models.models import db, LLMRecord
+from app.config import config
+from app.utils.metrics import metrics
 
 # 加载环境变量
 load_dotenv()
@@ -15,6 +19,9 @@ LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-4o-mini')
 LLM_MODEL_LONG_TEXT = os.getenv('LLM_MODEL_LONG_TEXT', 'qwen-long')
 LLM_TEMPERATURE = float(os.getenv('LLM_TEMPERATURE', 0.6))
 
+# 进程内的大模型并发限制，多个工作线程共享
+_llm_semaphore = threading.BoundedSemaphore(max(config.LLM_MAX_CONCURRENCY, 1))
+
 def call_llm(system_prompt, user_prompt, history=None, temperature=None, long_text=False):
     """调用大模型API
     
@@ -57,11 +64,22 @@ def call_llm(system_prompt, user_prompt, history=None, temperature=None, long_te
         "Authorization": f"Bearer {LLM_API_KEY}"
     }
     
-    response = requests.post(
-        f"{LLM_BASE_URL}/chat/completions",
-        headers=headers,
-        json=data
-    )
+    # 超过并发上限时等待其他请求完成；请求设置超时，无响应的连接不会一直占用并发名额
+    wait_started = time.monotonic()
+    with _llm_semaphore:
+        metrics.observe('llm_wait_seconds', time.monotonic() - wait_started)
+        request_started = time.monotonic()
+        try:
+            response = requests.post(
+                f"{LLM_BASE_URL}/chat/completions",
+                headers=headers,
+                json=data,
+                timeout=config.LLM_REQUEST_TIMEOUT
+            )
+        except requests.exceptions.Timeout:
+            metrics.inc('llm_request_timeouts', model=model)
+            raise
+        metrics.observe('llm_request_seconds', time.monotonic() - request_started, model=model)
     
     # 检查响应
     if response.status_code != 200:
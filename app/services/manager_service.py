@@ -9,6 +9,9 @@ from app.services.llm_service import call_llm, parse_yaml_response
 from app.controllers.socket_controller import broadcast_message
 from app.services.prompt_service import PromptService
 from app.utils.message_utils import create_standard_message
+from app.config import config
+from app.utils.metrics import PeriodicReporter
+from app.services.scheduling import sort_by_priority, record_queue_depth, record_queue_wait, FairScheduler
 import yaml
 import logging
 logger = logging.getLogger(__name__)
@@ -18,10 +21,13 @@ def get_pending_tasks():
     """获取待处理的任务，按照event_id和round_id分组
     
     Returns:
-        字典，键为(event_id, round_id)元组，值为该组的任务列表
+        字典，键为(event_id, round_id)元组，值为该组的任务列表；
+        按优先级调度，分组顺序由组内有效优先级最高的任务决定
     """
-    # 查询所有pending状态的任务
-    pending_tasks = Task.query.filter_by(task_status='pending').order_by(Task.created_at.asc()).all()
+    # 查询所有pending状态的任务，按有效优先级排序
+    pending_tasks = Task.query.filter_by(task_status='pending').all()
+    record_queue_depth('manager', pending_tasks)
+    pending_tasks = sort_by_priority(pending_tasks)
     
     # 按照event_id和round_id分组
     grouped_tasks = {}
@@ -155,7 +161,8 @@ def process_manager_response(response, tasks):
                 action_name=action_data.get('action_name', ''),
                 action_type=action_data.get('action_type', ''),
                 action_assignee=action_data.get('action_assignee', '_operator'),
-                action_status='pending'
+                action_status='pending',
+                priority=task.priority
             )
             db.session.add(action)
             
@@ -172,9 +179,15 @@ def run_manager():
     # 导入Flask应用
     from main import app
     
+    # 定期输出队列深度、等待时间等指标
+    reporter = PeriodicReporter(config.METRICS_LOG_INTERVAL)
+    # 事件之间加权公平调度
+    scheduler = FairScheduler('manager')
+    
     # 使用应用上下文
     with app.app_context():
         while True:
+            reporter.maybe_report()
             try:
                 # 获取待处理任务组
                 grouped_tasks = get_pending_tasks()
@@ -182,9 +195,13 @@ def run_manager():
                 if grouped_tasks:
                     logger.info(f"发现 {len(grouped_tasks)} 组待处理任务")
                     
-                    # 处理每组任务
-                    for (event_id, round_id), tasks in grouped_tasks.items():
-                        process_task_group(event_id, round_id, tasks)
+                    # 每次在事件之间加权公平地选择一组处理，处理完重新获取队列，
+                    # 使新到达的高优先级任务能及时被处理，单个事件也不会占满处理能力
+                    head = scheduler.select([group[0] for group in grouped_tasks.values()])
+                    event_id, round_id = head.event_id, head.round_id
+                    tasks = grouped_tasks[(event_id, round_id)]
+                    record_queue_wait('manager', tasks)
+                    process_task_group(event_id, round_id, tasks)
                 else:
                     logger.info("没有待处理任务，等待中...")
                     time.sleep(5)
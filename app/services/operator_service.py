@@ -8,7 +8,11 @@ from app.models import db, Event, Task, Action, Command, Message
 from app.services.llm_service import call_llm, parse_yaml_response
 from app.controllers.socket_controller import broadcast_message
 from app.services.prompt_service import PromptService
+from app.services.command_validation import validate_command, reject_commands, supersede_rejected_commands
 from app.utils.message_utils import create_standard_message
+from app.config import config
+from app.utils.metrics import PeriodicReporter
+from app.services.scheduling import sort_by_priority, record_queue_depth, record_queue_wait, FairScheduler
 import yaml
 import logging
 logger = logging.getLogger(__name__)
@@ -17,10 +21,13 @@ def get_pending_actions():
     """获取待处理的动作，按照event_id和round_id分组
     
     Returns:
-        字典，键为(event_id, round_id)元组，值为该组的动作列表
+        字典，键为(event_id, round_id)元组，值为该组的动作列表；
+        按优先级调度，分组顺序由组内有效优先级最高的动作决定
     """
-    # 查询所有pending状态的动作
-    pending_actions = Action.query.filter_by(action_status='pending').order_by(Action.created_at.asc()).all()
+    # 查询所有pending状态的动作，按有效优先级排序
+    pending_actions = Action.query.filter_by(action_status='pending').all()
+    record_queue_depth('operator', pending_actions)
+    pending_actions = sort_by_priority(pending_actions)
     
     # 按照event_id和round_id分组
     grouped_actions = {}
@@ -61,6 +68,9 @@ def process_action_group(event_id, round_id, actions):
             'task_id': action.task_id,
             'task_name': task_name
         })
+        if action.fix_hint:
+            # 上次生成的命令未通过校验，只需按提示修正该动作的命令
+            actions_data[-1]['fix_hint'] = action.fix_hint
 
     request_data = {
         'type': 'generate_commands_by_actions',
@@ -135,7 +145,8 @@ def process_operator_response(response, actions):
         # 获取结果列表
         commands = response.get('commands', [])
         
-        # 创建命令
+        # 创建命令，按动作分组
+        commands_by_action = {}
         for command_data in commands:
             # 获取关联的动作
             action_id = command_data.get('action_id')
@@ -157,15 +168,31 @@ def process_operator_response(response, actions):
                 event_id=response.get('event_id'),
                 command_entity=command_data.get('command_entity', {}),
                 command_params=command_data.get('command_params', {}),
-                command_status='pending'
+                command_status='pending',
+                priority=action.priority
             )
-            db.session.add(command)
+            commands_by_action.setdefault(action_id, (action, []))[1].append(command)
+        
+        created = 0
+        for action_id, (action, action_commands) in commands_by_action.items():
+            # 修正后的命令取代原来未通过校验的命令
+            supersede_rejected_commands(action_id)
+            
+            # 下发前按剧本目录校验剧本ID和参数，补全默认值
+            problems = [problem for command in action_commands for problem in validate_command(command)]
+            db.session.add_all(action_commands)
+            if problems:
+                # 同一动作的命令一起修正，避免部分命令先执行、修正时又被重复生成
+                reject_commands(action_id, action_commands, problems)
+                continue
             
             # 更新动作状态为处理中
             action.action_status = 'processing'
+            action.fix_hint = None
+            created += len(action_commands)
             
         db.session.commit()
-        logger.info(f"已创建 {len(commands)} 个命令")
+        logger.info(f"已创建 {created} 个命令")
 
 def run_operator():
     """运行_operator服务"""
@@ -174,9 +201,15 @@ def run_operator():
     # 导入Flask应用
     from main import app
     
+    # 定期输出队列深度、等待时间等指标
+    reporter = PeriodicReporter(config.METRICS_LOG_INTERVAL)
+    # 事件之间加权公平调度
+    scheduler = FairScheduler('operator')
+    
     # 使用应用上下文
     with app.app_context():
         while True:
+            reporter.maybe_report()
             try:
                 # 获取待处理动作组
                 grouped_actions = get_pending_actions()
@@ -184,9 +217,13 @@ def run_operator():
                 if grouped_actions:
                     logger.info(f"发现 {len(grouped_actions)} 组待处理动作")
                     
-                    # 处理每组动作
-                    for (event_id, round_id), actions in grouped_actions.items():
-                        process_action_group(event_id, round_id, actions)
+                    # 每次在事件之间加权公平地选择一组处理，处理完重新获取队列，
+                    # 使新到达的高优先级动作能及时被处理，单个事件也不会占满处理能力
+                    head = scheduler.select([group[0] for group in grouped_actions.values()])
+                    event_id, round_id = head.event_id, head.round_id
+                    actions = grouped_actions[(event_id, round_id)]
+                    record_queue_wait('operator', actions)
+                    process_action_group(event_id, round_id, actions)
                 else:
                     logger.info("没有待处理动作，等待中...")
                     time.sleep(5)
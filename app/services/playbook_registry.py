@@ -0,0 +1,272 @@
+"""SOAR剧本目录
+
+从app/prompts/background_soar_playbooks.md中的yaml读取剧本定义，该文件同时作为提示词提供给大模型。
+剧本定义中除了id、name、params外，可以声明：
+    cache_ttl: 只读查询类剧本的结果缓存时间(秒)，未声明或为0表示不缓存
+    batch_param: 可以一次传入多个目标的参数名，声明后_executor把其他参数相同的多个命令合并为一次剧本调用；
+                 只能为SOAR侧确实支持多目标参数、并按目标返回结果的剧本声明
+    batch_separator: 合并时多个目标之间的分隔符，默认为逗号
+    batch_max: 一次调用最多合并的目标数，默认EXECUTOR_BATCH_MAX_TARGETS
+    batch_result_key: 执行结果中按目标给出结果的字段（以目标为键的字典，或包含目标值的列表），
+                      声明batch_param时必须声明；结果中找不到某个目标时，该目标的命令记为失败
+    summary_fields: 生成执行摘要时执行结果中保留的字段列表，包含其中任一字段的记录只保留这些字段，
+                    未声明时保留所有字段（仍会去掉EXPERT_PRUNE_DROP_FIELDS中的字段）
+    target_param: 剧本作用的目标参数名（如阻断、解封的IP）
+    conflicts_with: 作用相反的剧本ID列表（如阻断与解封），与target_param一起声明；
+                    之后对同一目标执行过其中任一剧本时，不再复用之前的执行结果
+下发剧本命令前用check_playbook_request按目录校验剧本ID和参数，不必等SOAR返回错误
+"""
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+import yaml
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = Path(__file__).parent.parent / 'prompts' / 'background_soar_playbooks.md'
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def load_catalog(path=CATALOG_FILE):
+    """解析剧本目录，返回 {剧本ID: 剧本定义}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    # 去掉markdown代码块标记
+    lines = [line for line in text.splitlines() if not line.strip().startswith('```')]
+    data = yaml.safe_load('\n'.join(lines)) or {}
+    catalog = {}
+    for playbook in data.get('playbooks') or []:
+        if playbook.get('id') is not None:
+            catalog[str(playbook['id'])] = playbook
+    return catalog
+
+
+def get_catalog():
+    """获取剧本目录，首次调用时加载"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                try:
+                    _catalog = load_catalog()
+                except Exception as e:
+                    logger.error(f"加载剧本目录失败: {str(e)}")
+                    _catalog = {}
+    return _catalog
+
+
+def get_playbook(playbook_id):
+    """获取剧本定义，不存在时返回None"""
+    if playbook_id is None:
+        return None
+    return get_catalog().get(str(playbook_id))
+
+
+def find_playbook_by_name(name):
+    """按剧本名称查找剧本定义，不存在时返回None"""
+    if not name:
+        return None
+    name = str(name).strip()
+    for playbook in get_catalog().values():
+        if str(playbook.get('name', '')).strip() == name:
+            return playbook
+    return None
+
+
+def check_playbook_request(playbook_id, params, playbook_name=None):
+    """按剧本目录校验剧本调用，并补全可选参数的默认值
+
+    1. 剧本ID不在目录中时，按剧本名称查找（大模型生成的长整数ID容易出错）
+    2. 必填参数缺失或为空时校验失败
+    3. 目录中未定义的参数不会被SOAR使用，校验通过时去掉，校验失败时在提示中列出
+    剧本目录为空（加载失败）时不做校验，原样返回
+
+    Returns:
+        (剧本ID, 补全默认值后的参数, 问题列表)，问题列表为空表示校验通过
+    """
+    params = dict(params or {}) if isinstance(params, dict) else {}
+    if not get_catalog():
+        return playbook_id, params, []
+
+    playbook = get_playbook(playbook_id)
+    if playbook is None:
+        playbook = find_playbook_by_name(playbook_name)
+        if playbook is None:
+            return playbook_id, params, [f"剧本ID {playbook_id} 不在SOAR剧本能力清单中"]
+        logger.warning(f"剧本ID {playbook_id} 不在剧本目录中，按剧本名称 {playbook_name} 使用剧本 {playbook['id']}")
+        playbook_id = str(playbook['id'])
+
+    specs = {spec['name']: spec for spec in playbook.get('params') or [] if spec.get('name')}
+    problems = []
+    for name, spec in specs.items():
+        value = params.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            if spec.get('required'):
+                problems.append(f"剧本 {playbook.get('name')} 缺少必填参数 {name}（{spec.get('desc', '')}）")
+            elif spec.get('default') is not None:
+                params[name] = spec['default']
+
+    unknown = [name for name in params if name not in specs]
+    if problems and unknown:
+        problems.append(f"参数 {', '.join(map(str, unknown))} 不是剧本 {playbook.get('name')} 的参数，"
+                        f"可用参数: {', '.join(specs) or '无'}")
+    elif unknown:
+        logger.warning(f"去掉剧本 {playbook_id} 未定义的参数: {unknown}")
+        params = {name: value for name, value in params.items() if name in specs}
+    return playbook_id, params, problems
+
+
+def get_batch_spec(playbook_id):
+    """剧本的批量调用定义，不支持批量调用时返回None
+
+    Returns:
+        {"param": 参数名, "separator": 分隔符, "max": 最多目标数, "result_key": 结果字段}
+    """
+    playbook = get_playbook(playbook_id)
+    if not playbook or not playbook.get('batch_param'):
+        return None
+    if not playbook.get('batch_result_key'):
+        # 无法把结果拆分到各个目标时不能确认每个目标都执行成功，不合并调用
+        logger.warning(f"剧本 {playbook_id} 声明了batch_param但没有batch_result_key，不合并调用")
+        return None
+    try:
+        batch_max = int(playbook.get('batch_max') or 0)
+    except (TypeError, ValueError):
+        logger.warning(f"剧本 {playbook_id} 的batch_max无效: {playbook.get('batch_max')}")
+        batch_max = 0
+    return {
+        "param": str(playbook['batch_param']),
+        "separator": str(playbook.get('batch_separator') or ','),
+        "max": batch_max,
+        "result_key": playbook.get('batch_result_key'),
+    }
+
+
+def batch_key(playbook_id, params):
+    """批量调用的分组键：除批量参数外的规范化参数，相同分组键的命令可以合并；不支持批量调用时返回None"""
+    spec = get_batch_spec(playbook_id)
+    if spec is None:
+        return None
+    target = (params or {}).get(spec['param'])
+    if target is None or str(target).strip() == '':
+        return None
+    others = {name: value for name, value in (params or {}).items() if name != spec['param']}
+    return normalize_params(playbook_id, others)
+
+
+def merge_batch_params(playbook_id, params_list):
+    """合并多个命令的参数，批量参数的目标去重后用分隔符连接
+
+    Returns:
+        (合并后的参数, 各命令的目标列表)
+    """
+    spec = get_batch_spec(playbook_id)
+    targets = [str((params or {}).get(spec['param'])).strip() for params in params_list]
+    merged = dict(params_list[0] or {})
+    merged[spec['param']] = spec['separator'].join(dict.fromkeys(targets))
+    return merged, targets
+
+
+def split_batch_result(playbook_id, result, target):
+    """从批量调用的执行结果中取出单个目标的结果
+
+    Returns:
+        该目标的结果；执行结果中没有按目标给出的结果时返回None，不能把完整结果当作该目标执行成功
+    """
+    spec = get_batch_spec(playbook_id)
+    if not spec or not isinstance(result, dict):
+        return None
+    items = result.get(spec['result_key'])
+    if isinstance(items, dict) and target in items:
+        return items[target]
+    if isinstance(items, list):
+        matched = [item for item in items
+                   if isinstance(item, dict) and any(str(value).strip() == target for value in item.values())]
+        if matched:
+            return matched[0] if len(matched) == 1 else matched
+    return None
+
+
+def get_summary_fields(playbook_id):
+    """生成执行摘要时保留的结果字段，未声明时返回None"""
+    playbook = get_playbook(playbook_id)
+    fields = (playbook or {}).get('summary_fields')
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    return {str(field).strip() for field in fields if str(field).strip()}
+
+
+def get_conflict_spec(playbook_id):
+    """剧本的作用目标和作用相反的剧本，未声明时返回None
+
+    Returns:
+        {"param": 目标参数名, "playbooks": {作用相反的剧本ID}}
+    """
+    playbook = get_playbook(playbook_id)
+    if not playbook or not playbook.get('target_param') or not playbook.get('conflicts_with'):
+        return None
+    conflicts = playbook['conflicts_with']
+    if not isinstance(conflicts, list):
+        conflicts = str(conflicts).split(',')
+    return {
+        "param": str(playbook['target_param']),
+        "playbooks": {str(item).strip() for item in conflicts if str(item).strip()},
+    }
+
+
+def get_target_param(playbook_id):
+    """剧本作用的目标参数名，未声明时返回None"""
+    playbook = get_playbook(playbook_id)
+    param = (playbook or {}).get('target_param')
+    return str(param) if param else None
+
+
+def get_cache_ttl(playbook_id):
+    """剧本结果的缓存时间(秒)，0表示不缓存"""
+    playbook = get_playbook(playbook_id)
+    if not playbook:
+        return 0
+    try:
+        return max(float(playbook.get('cache_ttl') or 0), 0)
+    except (TypeError, ValueError):
+        logger.warning(f"剧本 {playbook_id} 的cache_ttl无效: {playbook.get('cache_ttl')}")
+        return 0
+
+
+def normalize_params(playbook_id, params):
+    """规范化剧本参数，用于判断两次调用是否相同
+
+    1. 未传入的可选参数使用剧本目录中的默认值
+    2. 去掉空值，字符串去掉首尾空白
+    3. 按参数名排序后序列化为JSON
+    """
+    normalized = {}
+    playbook = get_playbook(playbook_id)
+    for spec in (playbook or {}).get('params') or []:
+        if spec.get('default') is not None:
+            normalized[spec['name']] = spec['default']
+    for name, value in (params or {}).items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            continue
+        normalized[name] = value
+
+    result = {}
+    for name, value in normalized.items():
+        result[str(name)] = str(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+    return json.dumps(result, sort_keys=True, ensure_ascii=False)
+
+
+def command_signature(playbook_id, params):
+    """命令签名：剧本ID和规范化参数的sha256，相同签名的命令执行的是相同的剧本调用"""
+    text = f"{playbook_id}:{normalize_params(playbook_id, params)}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
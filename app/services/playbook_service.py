@@ -1,22 +1,123 @@
 import logging
 import json
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import Dict, Any, Optional
 from app.config import config
 from app.models import db, Command, Execution
+from app.models.counters import record_status_change
+from sqlalchemy import update
 import uuid
+from datetime import datetime, timedelta
 
 # 导入SOARClient
-from app.utils.soar_client import SOARClient
+from app.utils.soar_client import get_soar_client
+from app.utils.metrics import metrics
+from app.services.playbook_registry import (get_cache_ttl, normalize_params, command_signature,
+                                            merge_batch_params, split_batch_result,
+                                            get_conflict_spec, get_target_param)
+from app.services.result_store import result_columns, load_result
 
 logger = logging.getLogger(__name__)
 
+def parse_playbook_settings(text):
+    """解析按剧本配置的数值，格式: 剧本ID:数值,剧本ID:数值"""
+    settings = {}
+    for item in (text or '').split(','):
+        if not item.strip():
+            continue
+        try:
+            playbook_id, value = item.split(':')
+            settings[playbook_id.strip()] = int(value)
+        except ValueError:
+            logger.warning(f"无效的剧本配置: {item}")
+    return settings
+
+_playbook_timeouts = parse_playbook_settings(config.SOAR_PLAYBOOK_TIMEOUTS)
+
+def get_playbook_timeout(playbook_id) -> float:
+    """获取剧本等待执行完成的超时时间(秒)，未单独配置的剧本使用SOAR_ACTIVITY_TIMEOUT"""
+    return _playbook_timeouts.get(str(playbook_id), config.SOAR_ACTIVITY_TIMEOUT)
+
+class PlaybookResultCache:
+    """只读查询类剧本的结果缓存
+
+    按(剧本ID, 规范化参数)缓存执行成功的结果，缓存时间由剧本目录中的cache_ttl决定，
+    超过PLAYBOOK_CACHE_MAX_ENTRIES时淘汰最久未使用的结果
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max(max_entries, 1)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(playbook_id, params):
+        return str(playbook_id), normalize_params(playbook_id, params)
+
+    def get(self, playbook_id, params):
+        """返回 (执行结果, 来源执行记录ID)，未命中或已过期时返回None"""
+        key = self._key(playbook_id, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            result, execution_id, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result, execution_id
+
+    def put(self, playbook_id, params, result, execution_id, ttl):
+        key = self._key(playbook_id, params)
+        with self._lock:
+            self._entries[key] = (result, execution_id, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            metrics.set_gauge('playbook_cache_entries', len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# 进程内的剧本结果缓存
+result_cache = PlaybookResultCache(config.PLAYBOOK_CACHE_MAX_ENTRIES)
+
+class KeyedLock:
+    """按键加锁，不同的键互不阻塞"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._locks.pop(key, None)
+
+# 相同签名的命令依次启动，后启动的命令可以复用先启动的剧本活动
+_start_locks = KeyedLock()
+
 class PlaybookService:
     def __init__(self):
-        self.soar_client = SOARClient()
+        self.soar_client = get_soar_client()
     
     def execute_playbook(self, command: Command) -> Dict[str, Any]:
         """
-        执行SOAR剧本
+        执行SOAR剧本，同步等待执行完成
         
         Args:
             command: 命令对象
@@ -24,85 +125,497 @@ class PlaybookService:
         Returns:
             执行结果
         """
+        dispatched = self.start_playbook(command)
+        if dispatched.get('status') != 'dispatched':
+            return dispatched
+        
+        playbook_id = dispatched['playbook_id']
+        activity_id = dispatched['activity_id']
         try:
-            # 获取剧本ID和参数
-            playbook_id = command.command_entity.get('playbook_id')
-            params = command.command_params or {}
-            
-            if not playbook_id:
-                error_msg = "缺少剧本ID"
-                logger.error(error_msg)
-                return {
-                    "status": "failed",
-                    "message": error_msg
-                }
-            
-            # 执行剧本
-            logger.info(f"执行剧本: {playbook_id}, 参数: {params}")
-            activity_id = self.soar_client.execute_playbook(playbook_id, params)
-            
-            if not activity_id:
-                error_msg = "剧本执行失败，未获取到活动ID"
-                logger.error(error_msg)
-                return {
-                    "status": "failed",
-                    "message": error_msg
-                }
-            
             # 等待剧本执行完成
             result = self.soar_client.wait_for_completion(activity_id)
+        except Exception as e:
+            return self.finish_playbook(command, playbook_id, activity_id, None, error=e)
+        return self.finish_playbook(command, playbook_id, activity_id, result)
+    
+    def start_playbook(self, command: Command) -> Dict[str, Any]:
+        """
+        启动SOAR剧本，不等待执行完成
+        
+        启动成功后立即创建processing状态的执行记录，保存activity_id和截止时间，
+        执行器重启后可以据此继续跟踪，不会重复启动剧本
+        
+        Args:
+            command: 命令对象
+        
+        Returns:
+            启动成功时返回 {"status": "dispatched", "playbook_id": ..., "activity_id": ..., "execution_id": ...}，
+            否则返回失败的执行结果
+        """
+        try:
+            # 获取剧本ID和参数
+            playbook_id, params = self.get_playbook_request(command)
             
+            with _start_locks.hold(command_signature(playbook_id, params)):
+                # 查询类剧本优先使用缓存的结果
+                cached = self.get_cached_result(command, playbook_id, params)
+                if cached:
+                    return cached
+                
+                # 相同的剧本调用正在执行或刚执行完成时复用其活动和结果
+                attached = self.attach_to_existing(command, playbook_id, params)
+                if attached:
+                    return attached
+                
+                # 执行剧本
+                activity_id = None
+                if playbook_id:
+                    logger.info(f"执行剧本: {playbook_id}, 参数: {params}")
+                    activity_id = self.soar_client.execute_playbook(playbook_id, params)
+                
+                return self.record_started(command, playbook_id, activity_id)
+            
+        except Exception as e:
+            db.session.rollback()
+            return self._record_failure(command, e)
+    
+    @staticmethod
+    def get_playbook_request(command: Command):
+        """获取命令要执行的剧本ID和参数"""
+        return command.command_entity.get('playbook_id'), command.command_params or {}
+    
+    def get_cached_result(self, command: Command, playbook_id, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的剧本结果，命中时创建标记为cached的执行记录
+        
+        Returns:
+            命中时返回执行结果，否则返回None
+        """
+        if not config.PLAYBOOK_CACHE_ENABLED or not playbook_id or get_cache_ttl(playbook_id) <= 0:
+            return None
+        
+        hit = result_cache.get(playbook_id, params)
+        if hit is None:
+            metrics.inc('playbook_cache_misses', playbook=playbook_id)
+            return None
+        
+        result, source_execution_id = hit
+        metrics.inc('playbook_cache_hits', playbook=playbook_id)
+        message = f"剧本 {playbook_id} 执行成功（缓存结果）"
+        execution = Execution(
+            execution_id=str(uuid.uuid4()),
+            command_id=command.command_id,
+            action_id=command.action_id,
+            task_id=command.task_id,
+            event_id=command.event_id,
+            round_id=command.round_id,
+            execution_summary=message,
+            execution_status="completed",
+            finished_at=datetime.utcnow(),
+            command_signature=command_signature(playbook_id, params),
+            cached=True,
+            cached_from=source_execution_id,
+            **result_columns(result)
+        )
+        db.session.add(execution)
+        db.session.commit()
+        logger.info(f"剧本 {playbook_id} 命中结果缓存，来源执行记录: {source_execution_id}")
+        
+        return {
+            "status": "success",
+            "message": message,
+            "data": result
+        }
+    
+    def attach_to_existing(self, command: Command, playbook_id, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        复用相同剧本调用（剧本ID和规范化参数相同）的活动或结果，避免重复执行处置操作
+        
+        1. 有执行中的相同调用：创建共享同一activity_id的processing执行记录，返回dispatched，
+           由调用方像自己启动的剧本一样跟踪该活动
+        2. EXECUTOR_DEDUP_WINDOW秒内（按执行结束时间）有执行成功的相同调用：直接复用其结果；
+           之后对同一目标执行过作用相反的剧本（如阻断后又解封）时不复用，重新执行
+        执行记录的dedup_of指向被复用的执行记录
+        
+        Returns:
+            复用成功时返回与start_playbook相同的结果，否则返回None
+        """
+        if not config.EXECUTOR_DEDUP_ENABLED or not playbook_id:
+            return None
+        
+        signature = command_signature(playbook_id, params)
+        base = Execution.query.filter(
+            Execution.command_signature == signature,
+            Execution.dedup_of.is_(None),
+            Execution.command_id != command.command_id
+        )
+        
+        inflight = base.filter(
+            Execution.execution_status == 'processing',
+            Execution.activity_id.isnot(None)
+        ).order_by(Execution.created_at.desc()).first()
+        if inflight:
+            execution = self._new_execution(
+                command,
+                execution_summary=f"剧本 {playbook_id} 执行中（复用执行中的相同调用）",
+                execution_status="processing",
+                activity_id=inflight.activity_id,
+                deadline_at=inflight.deadline_at,
+                command_signature=signature,
+                dedup_of=inflight.execution_id,
+                batch_target=inflight.batch_target,
+                batch_size=inflight.batch_size
+            )
+            db.session.add(execution)
+            db.session.commit()
+            metrics.inc('executor_dedup_attached', playbook=playbook_id, state='inflight')
+            logger.info(f"命令 {command.command_id} 复用执行中的剧本活动: {inflight.activity_id}")
+            return {
+                "status": "dispatched",
+                "playbook_id": playbook_id,
+                "activity_id": inflight.activity_id,
+                "execution_id": execution.execution_id
+            }
+        
+        if config.EXECUTOR_DEDUP_WINDOW <= 0:
+            return None
+        # _expert很快会把执行记录从completed推进到summarized，已生成摘要的执行记录同样可以复用；
+        # 生成摘要会更新updated_at，按执行结束时间判断是否在复用窗口内
+        recent = base.filter(
+            Execution.execution_status.in_(['completed', 'summarizing', 'summarized']),
+            Execution.finished_at >= datetime.utcnow() - timedelta(seconds=config.EXECUTOR_DEDUP_WINDOW)
+        ).order_by(Execution.finished_at.desc()).first()
+        if not recent or not recent.execution_result:
+            return None
+        if self._has_later_conflict(playbook_id, params, recent):
+            metrics.inc('executor_dedup_conflicts', playbook=playbook_id)
+            logger.info(f"命令 {command.command_id} 的目标在 {recent.execution_id} 之后执行过作用相反的剧本，不复用其结果")
+            return None
+        
+        message = f"剧本 {playbook_id} 执行成功（复用相同调用的结果）"
+        execution = self._new_execution(
+            command,
+            execution_result=recent.execution_result,
+            result_ref=recent.result_ref,
+            result_size=recent.result_size,
+            execution_summary=message,
+            execution_status="completed",
+            finished_at=datetime.utcnow(),
+            activity_id=recent.activity_id,
+            command_signature=signature,
+            dedup_of=recent.execution_id
+        )
+        db.session.add(execution)
+        db.session.commit()
+        metrics.inc('executor_dedup_attached', playbook=playbook_id, state='completed')
+        logger.info(f"命令 {command.command_id} 复用剧本执行结果: {recent.execution_id}")
+        return {
+            "status": "success",
+            "message": message,
+            "data": load_result(recent)
+        }
+    
+    @staticmethod
+    def _has_later_conflict(playbook_id, params: Dict[str, Any], execution: Execution) -> bool:
+        """执行记录开始之后，是否对同一目标执行过作用相反的剧本（如阻断后又解封），是则不能复用其结果"""
+        spec = get_conflict_spec(playbook_id)
+        if not spec:
+            return False
+        target = str((params or {}).get(spec['param']) or '').strip()
+        if not target:
+            return False
+        rows = db.session.query(Command.command_entity, Command.command_params).join(
+            Execution, Execution.command_id == Command.command_id
+        ).filter(
+            Command.command_type == 'playbook',
+            Execution.created_at >= execution.created_at,
+            Execution.execution_id != execution.execution_id
+        ).all()
+        for entity, other_params in rows:
+            other_id = str((entity or {}).get('playbook_id'))
+            if other_id not in spec['playbooks']:
+                continue
+            # 作用相反的剧本未声明目标参数时按同名参数比较
+            other_param = get_target_param(other_id) or spec['param']
+            if str((other_params or {}).get(other_param) or '').strip() == target:
+                return True
+        return False
+    
+    @staticmethod
+    def _new_execution(command: Command, **values) -> Execution:
+        """创建命令的执行记录"""
+        return Execution(
+            execution_id=str(uuid.uuid4()),
+            command_id=command.command_id,
+            action_id=command.action_id,
+            task_id=command.task_id,
+            event_id=command.event_id,
+            round_id=command.round_id,
+            **values
+        )
+    
+    def record_started(self, command: Command, playbook_id, activity_id: Optional[str], **values) -> Dict[str, Any]:
+        """
+        记录已启动的剧本，创建processing状态的执行记录
+        
+        Args:
+            command: 命令对象
+            playbook_id: 剧本ID
+            activity_id: SOAR返回的活动ID，启动失败时为None
+            values: 执行记录的其他字段，例如批量调用的batch_target、batch_size
+        
+        Returns:
+            与start_playbook相同
+        """
+        if not playbook_id:
+            error_msg = "缺少剧本ID"
+            logger.error(error_msg)
+            return {
+                "status": "failed",
+                "message": error_msg
+            }
+        
+        if not activity_id:
+            error_msg = "剧本执行失败，未获取到活动ID"
+            logger.error(error_msg)
+            return {
+                "status": "failed",
+                "message": error_msg
+            }
+        
+        # 记录执行中的剧本
+        execution = Execution(
+            execution_id=str(uuid.uuid4()),
+            command_id=command.command_id,
+            action_id=command.action_id,
+            task_id=command.task_id,
+            event_id=command.event_id,
+            round_id=command.round_id,
+            execution_summary=f"剧本 {playbook_id} 执行中",
+            execution_status="processing",
+            activity_id=str(activity_id),
+            deadline_at=datetime.utcnow() + timedelta(seconds=get_playbook_timeout(playbook_id)),
+            command_signature=command_signature(playbook_id, self.get_playbook_request(command)[1]),
+            **values
+        )
+        db.session.add(execution)
+        db.session.commit()
+        
+        return {
+            "status": "dispatched",
+            "playbook_id": playbook_id,
+            "activity_id": str(activity_id),
+            "execution_id": execution.execution_id
+        }
+    
+    def start_batch(self, commands, playbook_id) -> Dict[str, Dict[str, Any]]:
+        """
+        把同一剧本、除批量参数外参数相同的多个命令合并为一次剧本调用启动
+        
+        命中结果缓存或复用相同调用的命令不参与合并；其余命令的执行记录共享同一个activity_id，
+        batch_target记录各命令的目标，执行完成后结果按目标拆分
+        
+        Args:
+            commands: 命令列表
+            playbook_id: 剧本ID
+        
+        Returns:
+            {command_id: 与start_playbook相同的结果}
+        """
+        results = {}
+        try:
+            results, remaining = self.prepare_batch(commands, playbook_id)
+            if remaining:
+                params, targets = self.batch_request(playbook_id, remaining)
+                logger.info(f"批量执行剧本: {playbook_id}, 合并 {len(remaining)} 个命令, 参数: {params}")
+                activity_id = self.soar_client.execute_playbook(playbook_id, params)
+                results.update(self.record_batch_started(remaining, playbook_id, activity_id, targets))
+            return results
+        except Exception as e:
+            db.session.rollback()
+            for command in commands:
+                if command.command_id not in results:
+                    results[command.command_id] = self._record_failure(command, e)
+            return results
+    
+    def prepare_batch(self, commands, playbook_id):
+        """
+        批量调用前逐个检查结果缓存和相同的剧本调用
+        
+        Returns:
+            (已有结果的命令 {command_id: 结果}, 需要调用SOAR的命令列表)
+        """
+        results = {}
+        remaining = []
+        for command in commands:
+            params = self.get_playbook_request(command)[1]
+            result = (self.get_cached_result(command, playbook_id, params) or
+                      self.attach_to_existing(command, playbook_id, params))
+            if result:
+                results[command.command_id] = result
+            else:
+                remaining.append(command)
+        return results, remaining
+    
+    def batch_request(self, playbook_id, commands):
+        """
+        合并多个命令的参数
+        
+        Returns:
+            (合并后的参数, 各命令的目标 {command_id: 目标})
+        """
+        params, targets = merge_batch_params(playbook_id, [self.get_playbook_request(c)[1] for c in commands])
+        metrics.observe('executor_batch_size', len(commands), playbook=playbook_id)
+        return params, {command.command_id: target for command, target in zip(commands, targets)}
+    
+    def record_batch_started(self, commands, playbook_id, activity_id: Optional[str],
+                             targets: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """记录已启动的批量调用，为每个命令创建共享activity_id的执行记录"""
+        return {
+            command.command_id: self.record_started(command, playbook_id, activity_id,
+                                                    batch_target=targets[command.command_id],
+                                                    batch_size=len(commands))
+            for command in commands
+        }
+    
+    def finish_playbook(self, command: Command, playbook_id, activity_id: str,
+                        result: Optional[Dict[str, Any]], error: Optional[Exception] = None) -> Dict[str, Any]:
+        """
+        记录剧本的执行结果，更新启动时创建的执行记录
+        
+        执行器轮询到结果和SOAR回调可能同时结束同一执行记录，执行记录以processing为条件比较并设置，
+        只有一方会成功；另一方返回已记录的结果，并带有already_recorded标记，调用方不再更新命令状态
+        
+        Args:
+            command: 命令对象
+            playbook_id: 剧本ID
+            activity_id: 活动ID
+            result: SOAR返回的执行结果，超时或失败时为None
+            error: 等待执行结果时发生的异常
+        
+        Returns:
+            执行结果
+        """
+        execution = Execution.query.filter_by(command_id=command.command_id, activity_id=str(activity_id)).first()
+        if execution and execution.execution_status != 'processing':
+            # 执行结果已被记录（SOAR回调，或其他执行器进程重启后也跟踪了该活动）
+            return self._recorded_result(execution)
+        
+        if error is not None:
+            return self._record_failure(command, error, execution)
+        
+        try:
             if not result:
                 error_msg = f"剧本执行超时或失败: {activity_id}"
                 logger.error(error_msg)
+                if execution and not self._finish_execution(execution, "failed", execution_summary=error_msg):
+                    return self._recorded_result(execution)
                 return {
                     "status": "failed",
                     "message": error_msg
                 }
             
+            # 批量调用的执行结果按目标拆分，找不到该目标的结果时命令记为失败
+            if execution and execution.batch_target and (execution.batch_size or 1) > 1:
+                target_result = split_batch_result(playbook_id, result, execution.batch_target)
+                if target_result is None:
+                    return self._record_failure(command, Exception(
+                        f"批量调用 {activity_id} 的执行结果中没有目标 {execution.batch_target} 的结果"), execution)
+                result = target_result
+            
             # 记录执行结果
-            execution = Execution(
-                execution_id=str(uuid.uuid4()),
-                command_id=command.command_id,
-                action_id=command.action_id,
-                task_id=command.task_id,
-                event_id=command.event_id,
-                round_id=command.round_id,
-                execution_result=json.dumps(result),
-                execution_summary=f"剧本 {playbook_id} 执行成功",
-                execution_status="completed"
-            )
-            db.session.add(execution)
-            db.session.commit()
+            message = f"剧本 {playbook_id} 执行成功"
+            if execution:
+                if not self._finish_execution(execution, "completed", execution_summary=message,
+                                              **result_columns(result)):
+                    return self._recorded_result(execution)
+            else:
+                execution = self._new_execution(
+                    command,
+                    activity_id=str(activity_id),
+                    execution_summary=message,
+                    execution_status="completed",
+                    finished_at=datetime.utcnow(),
+                    **result_columns(result)
+                )
+                db.session.add(execution)
+                db.session.commit()
+            
+            # 缓存查询类剧本的结果
+            ttl = get_cache_ttl(playbook_id)
+            if config.PLAYBOOK_CACHE_ENABLED and ttl > 0:
+                result_cache.put(playbook_id, self.get_playbook_request(command)[1], result, execution.execution_id, ttl)
             
             logger.info(f"剧本 {playbook_id} 执行成功，结果: {result}")
             
             return {
                 "status": "success",
-                "message": f"剧本 {playbook_id} 执行成功",
+                "message": message,
                 "data": result
             }
             
         except Exception as e:
-            error_msg = f"执行剧本时出错: {str(e)}"
-            logger.error(error_msg)
-            
-            # 记录执行失败
-            execution = Execution(
-                execution_id=str(uuid.uuid4()),
-                command_id=command.command_id,
-                action_id=command.action_id,
-                task_id=command.task_id,
-                event_id=command.event_id,
-                round_id=command.round_id,
-                execution_result=json.dumps({"error": str(e)}),
-                execution_summary=error_msg,
-                execution_status="failed"
-            )
-            db.session.add(execution)
+            db.session.rollback()
+            return self._record_failure(command, e, execution)
+    
+    @staticmethod
+    def _finish_execution(execution: Execution, status: str, **values) -> bool:
+        """
+        以processing为条件结束执行记录（比较并设置）并提交
+        
+        Returns:
+            bool: 是否由本次调用结束；执行记录已被其他调用结束时返回False
+        """
+        updated = db.session.execute(
+            update(Execution).where(
+                Execution.id == execution.id,
+                Execution.execution_status == 'processing'
+            ).values(execution_status=status, updated_at=datetime.utcnow(), finished_at=datetime.utcnow(), **values),
+            execution_options={'synchronize_session': False}
+        ).rowcount == 1
+        if updated:
+            # Core UPDATE不经过flush，手动更新命令和事件上的未完成执行计数
+            record_status_change(execution, 'processing', status)
             db.session.commit()
-            
-            return {
-                "status": "failed",
-                "message": error_msg
-            }
\ No newline at end of file
+        else:
+            # 执行记录已被其他调用结束，回滚本次写入的执行结果(execution_blobs)
+            db.session.rollback()
+        db.session.refresh(execution)
+        if not updated:
+            logger.info(f"剧本执行结果已记录，跳过: {execution.activity_id}")
+        return updated
+    
+    @staticmethod
+    def _recorded_result(execution: Execution) -> Dict[str, Any]:
+        """已记录的执行结果"""
+        return {
+            "status": "success" if execution.execution_status != 'failed' else "failed",
+            "message": execution.execution_summary,
+            "data": load_result(execution) or {},
+            "already_recorded": True
+        }
+    
+    def _record_failure(self, command: Command, e: Exception, execution: Optional[Execution] = None) -> Dict[str, Any]:
+        """记录剧本执行失败"""
+        error_msg = f"执行剧本时出错: {str(e)}"
+        logger.error(error_msg)
+        
+        # 记录执行失败
+        if execution and execution.execution_status == 'processing':
+            if not self._finish_execution(execution, "failed", execution_result=json.dumps({"error": str(e)}),
+                                          execution_summary=error_msg):
+                return self._recorded_result(execution)
+        else:
+            if not execution:
+                execution = self._new_execution(command)
+                db.session.add(execution)
+            execution.execution_result = json.dumps({"error": str(e)})
+            execution.execution_summary = error_msg
+            execution.execution_status = "failed"
+            execution.finished_at = datetime.utcnow()
+            db.session.commit()
+        
+        return {
+            "status": "failed",
+            "message": error_msg
+        }
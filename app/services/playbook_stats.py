@@ -0,0 +1,109 @@
+"""剧本执行耗时统计
+
+按剧本记录最近PLAYBOOK_STATS_WINDOW次执行的耗时，计算p50/p90并持久化到playbook_stats表，
+执行器重启后从数据库加载，不需要重新学习。
+
+SOARActivityPoller根据统计决定每个活动的首次轮询时间：
+1. 样本数达到PLAYBOOK_STATS_MIN_SAMPLES的剧本，在启动后p50秒首次查询状态，
+   执行快的查询类剧本不用等固定间隔，执行慢的处置类剧本不会在执行完成前被反复查询
+2. 样本不足的剧本仍从SOAR_POLL_MIN_INTERVAL开始
+首次查询未完成时，再从SOAR_POLL_MIN_INTERVAL开始按SOAR_POLL_BACKOFF指数退避。
+
+轮询只能观察到剧本在两次查询之间的某个时刻完成，直接用发现完成的时间作为耗时会偏大，
+并使p50逐步推迟首次查询时间。因此耗时按最后两次查询时间的中点估计；
+首次查询就已完成时，以首次查询前一个SOAR_POLL_MIN_INTERVAL作为下界。
+"""
+import math
+import threading
+import logging
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app.models import db, PlaybookStat
+from app.config import config
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, q):
+    """计算分位数（最近秩法），values为空时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(max(math.ceil(q * len(ordered)) - 1, 0), len(ordered) - 1)
+    return ordered[index]
+
+
+class PlaybookStatsStore:
+    """剧本执行耗时统计，内存中缓存，每次记录样本时写入数据库"""
+
+    def __init__(self, app):
+        self.app = app
+        self.window = max(config.PLAYBOOK_STATS_WINDOW, 1)
+        self.min_samples = max(config.PLAYBOOK_STATS_MIN_SAMPLES, 1)
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def load(self):
+        """从数据库加载所有剧本的统计"""
+        with self.app.app_context():
+            stats = PlaybookStat.query.all()
+            with self._lock:
+                for stat in stats:
+                    self._stats[stat.playbook_id] = {
+                        'sample_count': stat.sample_count or 0,
+                        'p50': stat.p50,
+                        'p90': stat.p90,
+                    }
+        logger.info(f"已加载 {len(stats)} 个剧本的执行耗时统计")
+
+    def first_poll_delay(self, playbook_id):
+        """活动启动后首次查询状态的等待时间(秒)"""
+        with self._lock:
+            stat = self._stats.get(str(playbook_id))
+        if not stat or stat['sample_count'] < self.min_samples or not stat['p50']:
+            return config.SOAR_POLL_MIN_INTERVAL
+        return max(stat['p50'], config.SOAR_POLL_MIN_INTERVAL)
+
+    def record(self, playbook_id, duration):
+        """记录一次剧本执行耗时，并更新数据库中的统计"""
+        if playbook_id is None or duration is None:
+            return
+        playbook_id = str(playbook_id)
+        duration = round(max(duration, 0), 3)
+        metrics.observe('playbook_duration_estimate_seconds', duration, playbook=playbook_id)
+
+        with self.app.app_context():
+            try:
+                stat = self._update(playbook_id, duration)
+            except IntegrityError:
+                # 其他执行器进程同时插入了该剧本的统计，重新读取后再更新
+                db.session.rollback()
+                stat = self._update(playbook_id, duration)
+            except Exception:
+                db.session.rollback()
+                raise
+
+            with self._lock:
+                self._stats[playbook_id] = {
+                    'sample_count': stat.sample_count,
+                    'p50': stat.p50,
+                    'p90': stat.p90,
+                }
+
+    def _update(self, playbook_id, duration):
+        stat = PlaybookStat.query.filter_by(playbook_id=playbook_id).with_for_update().first()
+        if not stat:
+            stat = PlaybookStat(playbook_id=playbook_id, sample_count=0, recent_durations=[])
+            db.session.add(stat)
+
+        # 重新赋值列表，保证JSON字段的修改能被检测到
+        durations = list(stat.recent_durations or []) + [duration]
+        durations = durations[-self.window:]
+        stat.recent_durations = durations
+        stat.sample_count = (stat.sample_count or 0) + 1
+        stat.p50 = percentile(durations, 0.5)
+        stat.p90 = percentile(durations, 0.9)
+        stat.updated_at = datetime.utcnow()
+        db.session.commit()
+        return stat
@@ -0,0 +1,105 @@
+"""生成执行摘要前精简执行结果
+
+执行结果原来以indent=2的JSON完整放入执行摘要的提示词，缩进空白、内部ID、记录时间戳、空数组等
+都会消耗大模型的token。生成执行摘要前依次：
+1. 按剧本目录中的summary_fields只保留需要的字段，去掉EXPERT_PRUNE_DROP_FIELDS中的字段（不区分大小写）
+2. 去掉None、空字符串、空数组和空对象
+3. 列表中完全相同的记录只保留一条，记录重复次数
+4. 超过EXPERT_PRUNE_MAX_ITEMS条的列表只保留前后各一半，中间替换为省略说明；
+   超过EXPERT_PRUNE_MAX_STRING个字符的字符串截断
+5. 去掉空白序列化为JSON
+estimate_tokens()按字符估算token数，用于记录每次摘要节省的token数(summary_tokens_saved)。
+"""
+import json
+import math
+import re
+from typing import Any, Optional, Set
+from app.config import config
+from app.services.playbook_registry import get_summary_fields
+
+_CJK = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+_EMPTY = (None, '', [], {})
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """估算文本的token数：中文字符约1个token，其他字符约4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def minify(value: Any) -> str:
+    """去掉空白序列化为JSON"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _drop_fields() -> Set[str]:
+    return {field.strip().lower() for field in config.EXPERT_PRUNE_DROP_FIELDS.split(',') if field.strip()}
+
+
+def prune_result(playbook_id, result: Any) -> Any:
+    """精简执行结果
+
+    Args:
+        playbook_id: 剧本ID，非剧本命令为None
+        result: 解析后的执行结果
+
+    Returns:
+        精简后的执行结果
+    """
+    if not config.EXPERT_PRUNE_ENABLED:
+        return result
+    return _prune(result, get_summary_fields(playbook_id), _drop_fields())
+
+
+def _prune(value: Any, fields: Optional[Set[str]], drop: Set[str]) -> Any:
+    if isinstance(value, dict):
+        keys = list(value)
+        if fields and any(key in fields for key in keys):
+            keys = [key for key in keys if key in fields]
+        pruned = {}
+        for key in keys:
+            if str(key).lower() in drop:
+                continue
+            item = _prune(value[key], fields, drop)
+            if item not in _EMPTY:
+                pruned[key] = item
+        return pruned
+
+    if isinstance(value, list):
+        items = [item for item in (_prune(item, fields, drop) for item in value) if item not in _EMPTY]
+        return _collapse(_dedup(items))
+
+    if isinstance(value, str) and len(value) > config.EXPERT_PRUNE_MAX_STRING > 0:
+        return f"{value[:config.EXPERT_PRUNE_MAX_STRING]}...（共{len(value)}个字符，已截断）"
+    return value
+
+
+def _dedup(items: list) -> list:
+    """完全相同的记录只保留第一条，记录重复次数"""
+    counts = {}
+    unique = []
+    for item in items:
+        key = minify(item) if isinstance(item, (dict, list)) else repr(item)
+        if key in counts:
+            counts[key][1] += 1
+            continue
+        counts[key] = [len(unique), 1]
+        unique.append(item)
+    for index, count in counts.values():
+        if count > 1:
+            item = unique[index]
+            unique[index] = dict(item, _repeat=count) if isinstance(item, dict) else f"{item}（重复{count}次）"
+    return unique
+
+
+def _collapse(items: list) -> list:
+    """过长的列表只保留前后各一半"""
+    limit = config.EXPERT_PRUNE_MAX_ITEMS
+    if limit <= 0 or len(items) <= limit:
+        return items
+    head = (limit + 1) // 2
+    tail = limit // 2
+    omitted = len(items) - head - tail
+    return items[:head] + [f"...（共{len(items)}条，省略中间{omitted}条）..."] + (items[-tail:] if tail else [])
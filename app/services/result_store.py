@@ -0,0 +1,116 @@
+"""执行结果的外部存储
+
+查询类剧本可能返回大量日志，完整的执行结果原来都以JSON文本存放在Execution.execution_result中，
+执行记录表越来越大，每次查询执行记录都会把这些结果一起加载到内存：
+1. 超过EXECUTION_RESULT_INLINE_LIMIT字节的执行结果压缩(zlib)后存放在execution_blobs表，
+   按JSON文本的sha256寻址，相同的执行结果（缓存、去重复用的结果）只存一份；
+   写入与执行记录处于调用方的同一事务中，以INSERT ... ON CONFLICT DO NOTHING跳过已存在的内容，
+   调用方回滚时不会留下没有执行记录引用的结果
+2. 执行记录的execution_result只保留前EXECUTION_RESULT_PREVIEW_CHARS个字符的预览，
+   result_ref记录完整结果的sha256，result_size记录完整结果的字节数
+3. 需要完整结果时（生成执行摘要、复用结果、查看完整结果接口）调用load_result()按需加载
+
+result_hash()按命令签名和规范化的执行结果计算摘要复用的键，相同剧本调用返回相同结果时复用已有的执行摘要。
+"""
+import json
+import zlib
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+from app.models import db, ExecutionBlob
+from app.config import config
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def result_columns(result: Any) -> Dict[str, Any]:
+    """生成执行记录中保存执行结果的字段，结果较大时在当前事务中写入execution_blobs表（不提交，随调用方提交或回滚）
+
+    Args:
+        result: 执行结果，非字符串时序列化为JSON
+
+    Returns:
+        {"execution_result": 结果或预览, "result_ref": sha256或None, "result_size": 字节数或None}
+    """
+    text = result if isinstance(result, str) else json.dumps(result)
+    data = text.encode('utf-8')
+    limit = config.EXECUTION_RESULT_INLINE_LIMIT
+    if limit <= 0 or len(data) <= limit:
+        return {"execution_result": text, "result_ref": None, "result_size": None}
+
+    sha256 = hashlib.sha256(data).hexdigest()
+    _save_blob(sha256, data)
+    return {"execution_result": _preview(text, len(data)), "result_ref": sha256, "result_size": len(data)}
+
+
+def _preview(text: str, size: int) -> str:
+    return f"{text[:max(config.EXECUTION_RESULT_PREVIEW_CHARS, 0)]}...（完整结果共{size}字节，已截断）"
+
+
+def _insert_blob(values: Dict[str, Any]):
+    """插入执行结果的语句，主键已存在时不做处理"""
+    table = ExecutionBlob.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).values(**values).on_conflict_do_nothing(index_elements=['sha256'])
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).values(**values).on_conflict_do_nothing(index_elements=['sha256'])
+    if dialect in ('mysql', 'mariadb'):
+        return table.insert().values(**values).prefix_with('IGNORE')
+    return table.insert().values(**values)
+
+
+def _save_blob(sha256: str, data: bytes):
+    if db.session.get(ExecutionBlob, sha256) is not None:
+        metrics.inc('execution_blob_reused')
+        return
+    content = zlib.compress(data)
+    inserted = db.session.execute(_insert_blob({
+        "sha256": sha256, "content": content, "size": len(data), "created_at": datetime.utcnow()
+    })).rowcount == 1
+    if not inserted:
+        # 其他工作线程或进程同时写入了相同的执行结果
+        metrics.inc('execution_blob_reused')
+        return
+    metrics.inc('execution_blob_stored')
+    metrics.observe('execution_blob_compression_ratio', len(content) / len(data))
+
+
+def load_result_text(execution) -> Optional[str]:
+    """执行记录的完整执行结果文本，外部存储的结果从execution_blobs表加载"""
+    if not execution.result_ref:
+        return execution.execution_result
+    blob = db.session.get(ExecutionBlob, execution.result_ref)
+    if blob is None:
+        logger.warning(f"执行结果不存在，只能使用预览: {execution.execution_id}, {execution.result_ref}")
+        return execution.execution_result
+    return zlib.decompress(blob.content).decode('utf-8')
+
+
+def load_result(execution) -> Any:
+    """执行记录的完整执行结果，JSON解析失败时返回原文本，没有结果时返回None"""
+    text = load_result_text(execution)
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return text
+
+
+def result_hash(signature: Optional[str], text: Optional[str]) -> Optional[str]:
+    """命令签名和规范化执行结果的sha256，没有命令签名或执行结果时返回None
+
+    JSON结果按键排序、去掉空白后计算，键的顺序和格式不同但内容相同的结果得到相同的值
+    """
+    if not signature or not text:
+        return None
+    try:
+        text = json.dumps(json.loads(text), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    except (TypeError, ValueError):
+        pass
+    return hashlib.sha256(f"{signature}:{text}".encode('utf-8')).hexdigest()
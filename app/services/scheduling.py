@@ -0,0 +1,162 @@
+"""优先级调度
+
+事件根据严重程度(Event.severity)确定优先级，任务、动作、命令在创建时继承上级记录的优先级。
+各Agent从队列中取待处理记录时按有效优先级排序：
+    有效优先级 = 优先级 - 等待时间 // SCHEDULER_AGING_INTERVAL（最小为0）
+数值越小越优先，等待时间越长有效优先级越高，避免低优先级记录被一直饿死。
+同一有效优先级下仍先进先出。等待时间默认从created_at开始计算，
+事件每一轮都会重新进入pending，因此从updated_at开始计算。
+
+_manager、_operator、_executor在事件之间使用FairScheduler加权公平调度，
+避免单个产生大量任务/动作/命令的事件占满处理能力，饿死其他事件。
+"""
+from datetime import datetime
+from app.config import config
+from app.utils.metrics import metrics
+
+# 优先级定义，数值越小越优先
+PRIORITY_CRITICAL = 0
+PRIORITY_HIGH = 1
+PRIORITY_MEDIUM = 2
+PRIORITY_LOW = 3
+DEFAULT_PRIORITY = PRIORITY_MEDIUM
+
+PRIORITY_NAMES = {
+    PRIORITY_CRITICAL: 'critical',
+    PRIORITY_HIGH: 'high',
+    PRIORITY_MEDIUM: 'medium',
+    PRIORITY_LOW: 'low',
+}
+
+# 事件严重程度 -> 优先级
+SEVERITY_PRIORITY = {
+    'critical': PRIORITY_CRITICAL,
+    '严重': PRIORITY_CRITICAL,
+    'high': PRIORITY_HIGH,
+    '高': PRIORITY_HIGH,
+    'medium': PRIORITY_MEDIUM,
+    '中': PRIORITY_MEDIUM,
+    'low': PRIORITY_LOW,
+    'info': PRIORITY_LOW,
+    '低': PRIORITY_LOW,
+}
+
+
+def priority_for_severity(severity):
+    """根据事件严重程度计算优先级，未知的严重程度使用默认优先级"""
+    if not severity:
+        return DEFAULT_PRIORITY
+    return SEVERITY_PRIORITY.get(str(severity).strip().lower(), DEFAULT_PRIORITY)
+
+
+def priority_name(priority):
+    return PRIORITY_NAMES.get(priority, str(priority))
+
+
+def effective_priority(item, now=None, time_attr='created_at'):
+    """计算记录的有效优先级（考虑等待时间老化）"""
+    priority = item.priority if item.priority is not None else DEFAULT_PRIORITY
+    since = getattr(item, time_attr)
+    if not since or config.SCHEDULER_AGING_INTERVAL <= 0:
+        return priority
+    now = now or datetime.utcnow()
+    waited = max((now - since).total_seconds(), 0)
+    return max(priority - int(waited // config.SCHEDULER_AGING_INTERVAL), 0)
+
+
+def sort_by_priority(items, now=None, time_attr='created_at'):
+    """按有效优先级排序，同一有效优先级下先进先出"""
+    now = now or datetime.utcnow()
+    return sorted(items, key=lambda item: (effective_priority(item, now, time_attr), getattr(item, time_attr) or now))
+
+
+def record_queue_depth(queue, items):
+    """记录队列中各优先级的待处理数量
+
+    Args:
+        queue: 队列名称，如captain、manager、operator、executor
+        items: 当前待处理的记录
+    """
+    depth = {name: 0 for name in PRIORITY_NAMES.values()}
+    for item in items:
+        name = priority_name(item.priority)
+        depth[name] = depth.get(name, 0) + 1
+    for name, count in depth.items():
+        metrics.set_gauge('queue_depth', count, queue=queue, priority=name)
+
+
+def observe_queue_wait(queue, priority, since, now=None):
+    """记录一条记录出队时的等待时间"""
+    if not since:
+        return
+    now = now or datetime.utcnow()
+    metrics.observe('queue_wait_seconds', (now - since).total_seconds(), queue=queue, priority=priority_name(priority))
+
+
+def record_queue_wait(queue, items, now=None):
+    """记录一组记录出队时的等待时间（从创建到开始处理）"""
+    now = now or datetime.utcnow()
+    for item in items:
+        observe_queue_wait(queue, item.priority, item.created_at, now)
+
+
+def priority_weight(priority):
+    """有效优先级对应的调度权重，权重越大分到的处理机会越多"""
+    weights = config.SCHEDULER_PRIORITY_WEIGHTS
+    index = min(max(priority, 0), len(weights) - 1)
+    return weights[index]
+
+
+class FairScheduler:
+    """事件之间的加权公平调度（stride调度）
+
+    每个事件维护一个虚拟时间，每分配一次处理机会，事件的虚拟时间增加 1/权重，
+    每次选择虚拟时间最小的事件。权重由事件待处理记录中最高的有效优先级决定，
+    高严重程度的事件分到更多的处理机会，但不会完全占满；新进入队列的事件从当前虚拟时间开始，
+    不会因为之前空闲而积累过多的处理机会。
+    同一事件内部仍按有效优先级、先进先出的顺序处理。
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self._virtual_time = 0.0
+        self._passes = {}
+
+    def select(self, items, inflight=None, max_inflight=0):
+        """从待处理记录中选出下一条要处理的记录
+
+        Args:
+            items: 待处理的记录，需要有event_id、priority、created_at属性，应已按sort_by_priority排序
+            inflight: 各事件正在处理中的记录数量 {event_id: count}
+            max_inflight: 单个事件同时处理的记录数上限，0表示不限制
+
+        Returns:
+            选中的记录；没有记录或所有事件都达到上限时返回None
+        """
+        now = datetime.utcnow()
+        heads = {}
+        for item in items:
+            heads.setdefault(item.event_id, item)
+
+        # 不在队列中的事件不再保留虚拟时间
+        self._passes = {event_id: p for event_id, p in self._passes.items() if event_id in heads}
+
+        if inflight and max_inflight > 0:
+            capped = [event_id for event_id in heads if inflight.get(event_id, 0) >= max_inflight]
+            for event_id in capped:
+                heads.pop(event_id)
+            if capped:
+                metrics.inc('scheduler_capped', len(capped), queue=self.queue)
+        if not heads:
+            return None
+
+        def start_time(event_id):
+            return max(self._passes.get(event_id, self._virtual_time), self._virtual_time)
+
+        event_id = min(heads, key=lambda e: (start_time(e), effective_priority(heads[e], now),
+                                             heads[e].created_at or now))
+        item = heads[event_id]
+        start = start_time(event_id)
+        self._virtual_time = start
+        self._passes[event_id] = start + 1.0 / priority_weight(effective_priority(item, now))
+        return item
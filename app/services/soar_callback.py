@@ -0,0 +1,98 @@
+"""SOAR活动完成回调
+
+SOAR在活动执行完成时调用 POST /api/soar/callback，回调由Web进程处理，不必等_executor轮询：
+1. 认证：请求头X-SOAR-Token与SOAR_CALLBACK_TOKEN相同，或X-SOAR-Signature为请求体以SOAR_CALLBACK_TOKEN
+   为密钥的HMAC-SHA256签名（十六进制）；未配置SOAR_CALLBACK_TOKEN时拒绝所有回调
+2. 按activity_id找到processing状态的执行记录（重复命令去重或多个命令合并调用时可能有多条），调用PlaybookService.finish_playbook
+   记录结果并更新命令状态；回调未携带执行结果时查询一次SOAR
+3. 执行记录以processing为条件比较并设置，回调与_executor轮询同时拿到结果时只记录一次
+4. 找不到执行记录（例如剧本启动后执行记录尚未提交）或查询结果失败时不做处理，由_executor兜底轮询
+"""
+import hmac
+import hashlib
+import logging
+from app.models import Command, Execution
+from app.config import config
+from app.utils.metrics import metrics
+from app.utils.soar_client import get_soar_client, SUCCESS_STATUSES, FAILED_STATUSES
+from app.services.playbook_service import PlaybookService
+
+logger = logging.getLogger(__name__)
+
+
+def verify_callback(body, token=None, signature=None):
+    """校验回调请求
+
+    Args:
+        body: 请求体原始字节
+        token: 请求头X-SOAR-Token
+        signature: 请求头X-SOAR-Signature
+
+    Returns:
+        bool: 是否通过认证
+    """
+    secret = config.SOAR_CALLBACK_TOKEN
+    if not secret:
+        return False
+    if token:
+        return hmac.compare_digest(token.encode('utf-8'), secret.encode('utf-8'))
+    if signature:
+        expected = hmac.new(secret.encode('utf-8'), body or b'', hashlib.sha256).hexdigest()
+        return hmac.compare_digest(signature.strip().lower().encode('utf-8'), expected.encode('utf-8'))
+    return False
+
+
+def handle_activity_callback(activity_id, status, result=None):
+    """记录回调通知的活动执行结果
+
+    Args:
+        activity_id: SOAR活动ID
+        status: 活动执行状态
+        result: 回调携带的执行结果，为空时查询SOAR
+
+    Returns:
+        {"matched": 匹配的执行记录数, "finished": 本次回调结束的命令数}
+    """
+    from app.services.executor_service import complete_command, fail_command, get_command_playbook_id
+
+    status = str(status or '').upper()
+    metrics.inc('soar_callbacks', status=status or 'UNKNOWN')
+    outcome = {"matched": 0, "finished": 0}
+    if status not in SUCCESS_STATUSES and status not in FAILED_STATUSES:
+        # 活动尚未结束
+        return outcome
+
+    executions = Execution.query.filter_by(activity_id=str(activity_id), execution_status='processing').all()
+    outcome["matched"] = len(executions)
+    if not executions:
+        logger.info(f"SOAR回调的活动没有执行中的记录: {activity_id}")
+        return outcome
+
+    if status in SUCCESS_STATUSES and not result:
+        result = get_soar_client().get_playbook_result(activity_id)
+        if not result:
+            logger.warning(f"SOAR回调后获取剧本结果失败，由_executor轮询兜底: {activity_id}")
+            return outcome
+
+    service = PlaybookService()
+    for execution in executions:
+        command = Command.query.filter_by(command_id=execution.command_id).first()
+        if not command:
+            continue
+        playbook_id = get_command_playbook_id(command)
+        try:
+            if status in SUCCESS_STATUSES:
+                finished = service.finish_playbook(command, playbook_id, activity_id, result)
+            else:
+                finished = service.finish_playbook(command, playbook_id, activity_id, None,
+                                                   error=Exception(f"SOAR回调通知剧本执行失败，状态: {status}"))
+            if finished.get('already_recorded'):
+                continue
+            complete_command(command, finished)
+            outcome["finished"] += 1
+        except Exception as e:
+            fail_command(command, e)
+            outcome["finished"] += 1
+
+    logger.info(f"SOAR回调: 活动 {activity_id} 状态 {status}，结束 {outcome['finished']} 个命令")
+    return outcome
@@ -0,0 +1,223 @@
+"""SOAR活动轮询器
+
+原来每个执行中的剧本都由一个线程在SOARClient.wait_for_completion中每5秒阻塞轮询一次。
+SOARActivityPoller在一个线程中统一跟踪所有执行中的活动(activity_id)：
+1. track()登记活动并返回Future，剧本执行完成或超时后设置结果（超时结果为None）；
+   SOAR返回失败状态（FAILED_STATUSES）时立即结束跟踪，Future设置为SOARActivityFailed异常
+2. 每个活动有独立的轮询间隔。传入PlaybookStatsStore时，首次查询时间为该剧本学习到的执行耗时p50，
+   之后从SOAR_POLL_MIN_INTERVAL开始按SOAR_POLL_BACKOFF指数退避，最长SOAR_POLL_MAX_INTERVAL，
+   执行快的剧本能更早拿到结果，执行慢的剧本不会频繁请求SOAR
+3. 每轮只查询到期的活动。SOAR目前只提供按单个activity_id查询状态的接口，没有批量查询接口，
+   因此到期的活动逐个查询
+4. 每次轮询后调用on_poll回调，由调用方持久化轮询状态
+5. 活动执行完成后按最后两次查询时间的中点估计执行耗时，记录到PlaybookStatsStore
+6. 多个命令共享同一个活动时（重复命令去重），重复登记返回同一个Future，活动只轮询一次
+7. 启用SOAR回调（SOAR_CALLBACK_ENABLED）时，执行结果由回调接口直接记录，轮询只作为回调丢失时的兜底：
+   轮询间隔不小于SOAR_CALLBACK_POLL_INTERVAL，每SOAR_CALLBACK_CHECK_INTERVAL秒通过finished回调
+   在数据库中批量检查已由回调记录结果的活动，不再查询SOAR，直接结束跟踪（结果为None）
+"""
+import time
+import threading
+import logging
+from concurrent.futures import Future
+from app.config import config
+from app.utils.soar_client import get_soar_client, get_execute_status, SUCCESS_STATUSES, FAILED_STATUSES, SOARActivityFailed
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TrackedActivity:
+    """一个正在跟踪的SOAR活动"""
+
+    def __init__(self, activity_id, playbook_id, timeout, polls=0, first_delay=None, learn=True):
+        self.activity_id = activity_id
+        self.playbook_id = playbook_id
+        self.future = Future()
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self.interval = config.SOAR_POLL_MIN_INTERVAL
+        if config.SOAR_CALLBACK_ENABLED:
+            # 执行结果由SOAR回调记录，轮询只作为兜底；兜底轮询的间隔太粗，不用于学习执行耗时
+            self.interval = max(self.interval, config.SOAR_CALLBACK_POLL_INTERVAL)
+            first_delay = max(first_delay or 0, self.interval)
+            learn = False
+        self.max_interval = max(config.SOAR_POLL_MAX_INTERVAL, self.interval)
+        if first_delay is None:
+            first_delay = self.interval
+        self.next_poll_at = min(self.started + first_delay, self.deadline)
+        self.polls = polls
+        # 上一次查询状态的时间，用于估计执行耗时。首次查询时间是学习到的p50时，
+        # 把首次查询前一个最短轮询间隔视为上一次查询，避免估计值被拉低到p50的一半
+        self.last_polled_at = self.started + max(first_delay - self.interval, 0)
+        # 恢复跟踪的活动不知道真实的启动时间，不记录执行耗时
+        self.learn = learn
+        # 按学习到的p50首次查询后，间隔从SOAR_POLL_MIN_INTERVAL重新开始，之后每次查询后按SOAR_POLL_BACKOFF增长
+        self.polled = first_delay <= self.interval
+
+    def estimate_duration(self, polled_at):
+        """剧本在上一次查询之后、本次查询之前完成，取中点作为执行耗时"""
+        return (self.last_polled_at + polled_at) / 2 - self.started
+
+    def schedule_next(self, polled_at, now):
+        """本次查询未完成，计算下一次查询时间"""
+        self.last_polled_at = polled_at
+        if self.polled:
+            self.interval = min(self.interval * config.SOAR_POLL_BACKOFF, self.max_interval)
+        self.polled = True
+        self.next_poll_at = min(now + self.interval, self.deadline)
+
+
+class SOARActivityPoller:
+    """在一个线程中轮询所有执行中的SOAR活动"""
+
+    def __init__(self, soar_client=None, on_poll=None, stats=None, finished=None):
+        self.soar_client = soar_client or get_soar_client()
+        self.on_poll = on_poll
+        self.stats = stats
+        # finished(activity_ids)返回其中已由SOAR回调记录结果的活动ID
+        self.finished = finished if config.SOAR_CALLBACK_ENABLED else None
+        self._next_finished_check = 0
+        self._activities = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动轮询线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='soar-poller', daemon=True)
+        self._thread.start()
+        logger.info("SOAR活动轮询器已启动")
+
+    def track(self, activity_id, playbook_id=None, timeout=None, polls=0, resumed=False):
+        """登记需要跟踪的活动
+
+        Args:
+            activity_id: SOAR活动ID
+            playbook_id: 剧本ID，用于指标统计
+            timeout: 等待执行完成的剩余时间(秒)，默认SOAR_ACTIVITY_TIMEOUT
+            polls: 已轮询次数，恢复跟踪时传入
+            resumed: 是否为执行器重启后恢复跟踪的活动，恢复的活动不参与执行耗时统计
+
+        Returns:
+            Future，结果为SOAR返回的执行结果，超时为None，执行失败时为SOARActivityFailed异常
+        """
+        if timeout is None:
+            timeout = config.SOAR_ACTIVITY_TIMEOUT
+        first_delay = None
+        if self.stats and not resumed:
+            first_delay = self.stats.first_poll_delay(playbook_id)
+        with self._lock:
+            existing = self._activities.get(activity_id)
+            if existing is not None:
+                return existing.future
+            activity = TrackedActivity(activity_id, playbook_id, max(timeout, 0), polls,
+                                       first_delay=first_delay, learn=not resumed)
+            self._activities[activity_id] = activity
+            metrics.set_gauge('soar_tracked_activities', len(self._activities))
+        self._wakeup.set()
+        return activity.future
+
+    def outstanding(self):
+        """正在跟踪的活动数量"""
+        with self._lock:
+            return len(self._activities)
+
+    def _run(self):
+        while True:
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"轮询SOAR活动时出错: {str(e)}")
+
+            # 等待到下一个活动需要轮询的时间，有新的活动登记时立即唤醒
+            with self._lock:
+                next_poll_at = min((a.next_poll_at for a in self._activities.values()), default=None)
+                if self.finished and self._activities:
+                    next_poll_at = min(next_poll_at, self._next_finished_check)
+            timeout = config.SOAR_POLL_MAX_INTERVAL if next_poll_at is None else max(next_poll_at - time.monotonic(), 0)
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def poll_once(self):
+        """查询所有到期的活动"""
+        now = time.monotonic()
+        if self.finished and now >= self._next_finished_check:
+            self._next_finished_check = now + config.SOAR_CALLBACK_CHECK_INTERVAL
+            self._complete_finished()
+        with self._lock:
+            due = [a for a in self._activities.values() if a.next_poll_at <= now]
+        for activity in due:
+            self._poll(activity)
+
+    def _complete_finished(self):
+        """结束已由SOAR回调记录结果的活动"""
+        with self._lock:
+            activities = dict(self._activities)
+        if not activities:
+            return
+        try:
+            finished = self.finished(list(activities))
+        except Exception as e:
+            logger.error(f"检查SOAR回调记录的活动失败: {str(e)}")
+            return
+        for activity_id in finished:
+            activity = activities.get(activity_id)
+            if activity is not None:
+                metrics.inc('soar_callback_completions')
+                self._complete(activity, None)
+
+    def _poll(self, activity):
+        activity.polls += 1
+        metrics.inc('soar_status_requests')
+        polled_at = time.monotonic()
+        try:
+            execute_status = get_execute_status(self.soar_client.get_playbook_status(activity.activity_id))
+            if execute_status in SUCCESS_STATUSES:
+                self._learn(activity, activity.estimate_duration(polled_at))
+                result = self.soar_client.get_playbook_result(activity.activity_id)
+                self._complete(activity, result)
+                return
+            if execute_status in FAILED_STATUSES:
+                logger.warning(f"剧本执行失败: {activity.activity_id}, 状态: {execute_status}")
+                metrics.inc('soar_activity_failures', playbook=activity.playbook_id, status=execute_status)
+                self._complete(activity, None, error=SOARActivityFailed(activity.activity_id, execute_status))
+                return
+        except Exception as e:
+            logger.error(f"查询SOAR活动状态失败: {activity.activity_id}, {str(e)}")
+
+        if self.on_poll:
+            try:
+                self.on_poll(activity)
+            except Exception as e:
+                logger.error(f"记录SOAR活动轮询状态失败: {activity.activity_id}, {str(e)}")
+
+        now = time.monotonic()
+        if now >= activity.deadline:
+            logger.warning(f"剧本执行超时: {activity.activity_id}")
+            metrics.inc('soar_activity_timeouts', playbook=activity.playbook_id)
+            self._complete(activity, None)
+            return
+
+        activity.schedule_next(polled_at, now)
+
+    def _learn(self, activity, duration):
+        if not self.stats or not activity.learn:
+            return
+        try:
+            self.stats.record(activity.playbook_id, duration)
+        except Exception as e:
+            logger.error(f"记录剧本执行耗时失败: {activity.playbook_id}, {str(e)}")
+
+    def _complete(self, activity, result, error=None):
+        with self._lock:
+            self._activities.pop(activity.activity_id, None)
+            metrics.set_gauge('soar_tracked_activities', len(self._activities))
+        metrics.observe('soar_activity_seconds', time.monotonic() - activity.started, playbook=activity.playbook_id)
+        metrics.observe('soar_polls_per_activity', activity.polls)
+        if error is not None:
+            activity.future.set_exception(error)
+        else:
+            activity.future.set_result(result)
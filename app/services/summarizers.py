@@ -0,0 +1,210 @@
+"""剧本执行结果的模板摘要
+
+资产查询、阻断/解封确认、消息发送回执等剧本的执行结果结构固定，原来也都要请求长文本大模型生成摘要。
+这里按剧本ID注册确定性的摘要函数，在本地直接生成适合阅读的摘要：
+1. 摘要函数summarizer(result, params)接收解析后的执行结果和命令参数，返回摘要文本；
+   不认识结果结构时返回None，由大模型生成摘要
+2. 执行结果超过EXPERT_TEMPLATE_SUMMARY_MAX_CHARS个字符时不使用模板，由大模型提取关键信息
+3. 新增剧本的模板摘要用@register(剧本ID)注册
+"""
+import logging
+from typing import Any, Callable, Dict, Optional
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+# 剧本ID -> 摘要函数
+SUMMARIZERS: Dict[str, Callable[[Any, Dict[str, Any]], Optional[str]]] = {}
+
+# 常见的表示执行成功与否的字段
+_SUCCESS_KEYS = ('success', 'ok', 'blocked', 'unblocked', 'frozen', 'sent')
+_STATUS_KEYS = ('status', 'state', 'result', 'code', 'errcode')
+_SUCCESS_VALUES = {'success', 'succeeded', 'ok', 'done', 'completed', 'true', '0', '200', '成功'}
+_FAILURE_VALUES = {'fail', 'failed', 'failure', 'error', 'false', '失败'}
+_MESSAGE_KEYS = ('message', 'msg', 'errmsg', 'error', 'detail', 'reason')
+
+
+def register(*playbook_ids):
+    """注册剧本的模板摘要函数"""
+    def decorator(func):
+        for playbook_id in playbook_ids:
+            SUMMARIZERS[str(playbook_id)] = func
+        return func
+    return decorator
+
+
+def render_summary(playbook_id, result: Any, params: Optional[Dict[str, Any]] = None,
+                   size: Optional[int] = None) -> Optional[str]:
+    """用模板生成执行结果摘要
+
+    Args:
+        playbook_id: 剧本ID
+        result: 解析后的执行结果
+        params: 命令参数
+        size: 执行结果文本的字符数，超过EXPERT_TEMPLATE_SUMMARY_MAX_CHARS时不使用模板
+
+    Returns:
+        摘要文本；剧本没有模板、结果过大或不认识结果结构时返回None
+    """
+    if not config.EXPERT_TEMPLATE_SUMMARY_ENABLED or playbook_id is None:
+        return None
+    summarizer = SUMMARIZERS.get(str(playbook_id))
+    if summarizer is None:
+        return None
+    if size is not None and size > config.EXPERT_TEMPLATE_SUMMARY_MAX_CHARS:
+        return None
+    try:
+        return summarizer(result, params or {})
+    except Exception as e:
+        logger.warning(f"剧本 {playbook_id} 的模板摘要生成失败，改由大模型生成: {str(e)}")
+        return None
+
+
+def _unwrap(result: Any) -> Any:
+    """去掉data/result等只有一层的包装"""
+    while isinstance(result, dict) and len(result) == 1:
+        key, value = next(iter(result.items()))
+        if key not in ('data', 'result', 'output') or not isinstance(value, (dict, list)):
+            break
+        result = value
+    return result
+
+
+def _pick(record: Dict[str, Any], *aliases) -> Any:
+    """按别名顺序取第一个非空字段"""
+    for alias in aliases:
+        value = record.get(alias)
+        if value not in (None, '', [], {}):
+            return value
+    return None
+
+
+def _outcome(record: Dict[str, Any]) -> Optional[bool]:
+    """判断处置类剧本的执行结果是否成功，无法判断时返回None"""
+    for key in _SUCCESS_KEYS:
+        if isinstance(record.get(key), bool):
+            return record[key]
+    for key in _STATUS_KEYS:
+        value = record.get(key)
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (str, int)) and not isinstance(value, bool):
+            text = str(value).strip().lower()
+            if text in _SUCCESS_VALUES:
+                return True
+            if text in _FAILURE_VALUES or (key in ('code', 'errcode') and text.lstrip('-').isdigit()):
+                return False
+    return None
+
+
+def _fields(record: Dict[str, Any], fields) -> list:
+    """按(标签, 别名...)列表取出已有的字段，格式化为 标签: 值"""
+    lines = []
+    for label, *aliases in fields:
+        value = _pick(record, *aliases)
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple)):
+            value = '、'.join(str(item) for item in value)
+        lines.append(f"{label}: {value}")
+    return lines
+
+
+_ASSET_FIELDS = [
+    ('IP地址', 'ip', 'dst', 'ip_address', 'asset_ip'),
+    ('资产名称', 'name', 'asset_name', 'hostname', 'host_name'),
+    ('资产类型', 'type', 'asset_type'),
+    ('所属部门', 'department', 'dept', 'asset_department'),
+    ('所属业务线', 'business', 'business_line', 'asset_business'),
+    ('负责人', 'owner', 'manager', 'asset_owner'),
+    ('负责人联系方式', 'contact', 'phone', 'email', 'owner_contact'),
+]
+
+
+@register(12321435630187042)  # query_asset_info_by_ip
+def summarize_asset_info(result, params):
+    record = _unwrap(result)
+    if isinstance(record, list):
+        if len(record) != 1 or not isinstance(record[0], dict):
+            return None
+        record = record[0]
+    if not isinstance(record, dict):
+        return None
+    lines = _fields(record, _ASSET_FIELDS)
+    # 只有IP地址时说明不认识结果结构
+    if len(lines) < 2:
+        return None
+    return f"查询IP {params.get('dst') or _pick(record, 'ip', 'dst')} 的资产信息：\n" + "\n".join(f"- {line}" for line in lines)
+
+
+_LOCATION_FIELDS = [
+    ('国家', 'country'),
+    ('省份', 'province', 'region'),
+    ('城市', 'city'),
+    ('运营商', 'isp', 'operator'),
+    ('位置描述', 'location', 'description', 'desc'),
+    ('位置来源', 'source'),
+]
+
+
+@register(12321406690537761)  # General_IP_Location_Query
+def summarize_ip_location(result, params):
+    record = _unwrap(result)
+    if not isinstance(record, dict):
+        return None
+    lines = _fields(record, _LOCATION_FIELDS)
+    if not lines:
+        return None
+    return f"IP {params.get('src') or _pick(record, 'ip', 'src')} 的位置信息：\n" + "\n".join(f"- {line}" for line in lines)
+
+
+def _summarize_disposal(action, target_label, target_param, duration_param=None):
+    """处置类剧本（阻断、解封、冻结）的摘要函数"""
+    def summarizer(result, params):
+        record = _unwrap(result)
+        # 结果可能是只包含单个目标的results列表
+        items = record.get('results') if isinstance(record, dict) else record
+        if isinstance(items, list):
+            if len(items) != 1 or not isinstance(items[0], dict):
+                return None
+            record = items[0]
+        if not isinstance(record, dict):
+            return None
+        succeeded = _outcome(record)
+        if succeeded is None:
+            return None
+
+        target = params.get(target_param) or _pick(record, target_param)
+        summary = f"{action}{target_label} {target}"
+        duration = params.get(duration_param) if duration_param else None
+        if succeeded and duration:
+            summary += f"（时长 {duration} 分钟）"
+        summary += "：成功" if succeeded else "：失败"
+        message = _pick(record, *_MESSAGE_KEYS)
+        if message and not isinstance(message, (dict, list)):
+            summary += f"，{message}"
+        return summary
+    return summarizer
+
+
+register(12321426001638099)(_summarize_disposal('防火墙阻断', 'IP', 'src', 'block_duration_minute'))
+register(12321431702878375)(_summarize_disposal('防火墙解封', 'IP', 'src'))
+register(12302548181076017)(_summarize_disposal('冻结Windows AD用户', '', 'user_name', 'freeze_duration_minute'))
+
+
+@register(12321418519526014)  # Send_Message_To_Dingtalk
+def summarize_dingtalk_message(result, params):
+    record = _unwrap(result)
+    if not isinstance(record, dict):
+        return None
+    succeeded = _outcome(record)
+    if succeeded is None:
+        return None
+    group = f"（群组 {params['group_id']}）" if params.get('group_id') else ""
+    if succeeded:
+        message = str(params.get('message') or '')
+        if len(message) > 100:
+            message = message[:100] + '...'
+        return f"钉钉消息已发送{group}：{message}"
+    error = _pick(record, *_MESSAGE_KEYS)
+    return f"钉钉消息发送失败{group}" + (f"：{error}" if error else "")
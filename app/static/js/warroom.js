@@ -1653,6 +1653,7 @@ function getStatusText(status) {
         'completed': '已完成',
         'failed': '失败',
         'round_finished': '轮次完成',
+        'summarizing': '总结中',
         'summarized': '已总结',
         'resolved': '已解决'
     };
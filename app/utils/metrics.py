@@ -0,0 +1,146 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 默认的延迟直方图分桶（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Histogram:
+    """简单的延迟直方图，线程安全"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """记录一次观测值"""
+        value = max(float(value), 0.0)
+        with self._lock:
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """根据分桶估算分位数（返回分桶上界）"""
+        with self._lock:
+            if not self.count:
+                return None
+            target = q * self.count
+            seen = 0
+            for i, c in enumerate(self.counts):
+                seen += c
+                if seen >= target:
+                    return self.buckets[i] if i < len(self.buckets) else self.max
+            return self.max
+
+    def snapshot(self):
+        p50 = self.quantile(0.5)
+        p95 = self.quantile(0.95)
+        with self._lock:
+            return {
+                'count': self.count,
+                'avg': round(self.total / self.count, 4) if self.count else 0,
+                'max': round(self.max, 4),
+                'p50': p50,
+                'p95': p95,
+                'buckets': {
+                    (f"le_{bound}" if i < len(self.buckets) else "inf"): c
+                    for i, (bound, c) in enumerate(zip(self.buckets + (None,), self.counts))
+                }
+            }
+
+
+class MetricsRegistry:
+    """进程内指标注册表
+
+    Agent以独立进程运行，指标只在进程内统计，通过日志定期输出。
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        if not labels:
+            return name
+        label_text = ','.join(f"{k}={v}" for k, v in sorted(labels.items()))
+        return f"{name}{{{label_text}}}"
+
+    def observe(self, name, value, **labels):
+        """记录直方图观测值"""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        """计数器累加"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        """设置瞬时值"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def snapshot(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        return {
+            'histograms': {k: h.snapshot() for k, h in histograms.items()},
+            'counters': counters,
+            'gauges': gauges
+        }
+
+    def log_report(self, prefix='【指标】'):
+        """将当前指标输出到日志"""
+        data = self.snapshot()
+        for key, value in sorted(data['histograms'].items()):
+            logger.info(f"{prefix}{key}: count={value['count']}, avg={value['avg']}s, "
+                        f"p50<={value['p50']}s, p95<={value['p95']}s, max={value['max']}s")
+        for key, value in sorted(data['counters'].items()):
+            logger.info(f"{prefix}{key}: {value}")
+        for key, value in sorted(data['gauges'].items()):
+            logger.info(f"{prefix}{key}: {value}")
+
+
+# 进程级指标注册表
+metrics = MetricsRegistry()
+
+
+class PeriodicReporter:
+    """按固定间隔输出指标报告，在循环中调用maybe_report即可"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._last = time.monotonic()
+
+    def maybe_report(self):
+        if self.interval <= 0:
+            return
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            metrics.log_report()
@@ -1,22 +1,214 @@
+"""SOAR API客户端
+
+进程内通过get_soar_client()共享一个SOARClient，所有请求复用同一个requests.Session：
+1. HTTPAdapter连接池按主机保持长连接(keep-alive)，避免每个请求重新建立TCP连接和TLS握手
+2. 连接池大小由SOAR_POOL_CONNECTIONS、SOAR_POOL_MAXSIZE配置，
+   SOAR_POOL_MAXSIZE应不小于同时请求SOAR的线程数（_executor工作线程 + 轮询线程）
+3. 每个请求分别设置连接超时SOAR_CONNECT_TIMEOUT和读取超时SOAR_API_TIMEOUT
+4. 统计请求数soar_http_requests和新建连接数soar_http_connections_opened，
+   连接复用率soar_http_connection_reuse_ratio = 1 - 新建连接数 / 请求数
+5. 超时和重试策略由SOARRequestPolicy定义，与异步客户端(soar_client_async.py)共用
+6. 活动的执行状态由get_execute_status()统一解析，SUCCESS_STATUSES、FAILED_STATUSES中的状态表示活动已结束，
+   轮询器、异步执行池和SOAR回调共用
+"""
 import requests
 import time
 import logging
+import threading
 from typing import Optional, Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
 from app.config import config
+from app.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
-class SOARClient:
+# SOAR活动的执行状态
+SUCCESS_STATUSES = {'SUCCESS'}
+FAILED_STATUSES = {'FAILED', 'FAILURE', 'ERROR', 'TERMINATED', 'CANCELED', 'CANCELLED', 'TIMEOUT'}
+
+
+class SOARActivityFailed(Exception):
+    """SOAR活动以失败状态结束"""
+
+    def __init__(self, activity_id, status):
+        super().__init__(f"SOAR剧本执行失败，活动 {activity_id} 状态: {status}")
+        self.activity_id = activity_id
+        self.status = status
+
+
+def get_execute_status(status: Optional[Dict[str, Any]]) -> str:
+    """从状态查询结果中取出活动的执行状态（大写），查询失败时返回空字符串"""
+    if not status:
+        return ''
+    return str(status.get('executeStatus') or '').upper()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    """新建连接时计数的连接池，用于统计连接复用率"""
+
+    def _new_conn(self):
+        connection_stats.opened()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        connection_stats.opened()
+        return super()._new_conn()
+
+
+class _ConnectionStats:
+    """SOAR请求数与新建连接数"""
+
     def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def opened(self):
+        with self._lock:
+            self.connections += 1
+        metrics.inc('soar_http_connections_opened')
+
+    def request(self):
+        with self._lock:
+            self.requests += 1
+            ratio = 1 - self.connections / self.requests
+        metrics.inc('soar_http_requests')
+        metrics.set_gauge('soar_http_connection_reuse_ratio', round(max(ratio, 0), 4))
+
+
+def _connection_established(error: Exception) -> bool:
+    """请求异常时连接是否已建立；连接超时、连接被拒绝、域名解析失败时请求一定没有发送到SOAR"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return not isinstance(reason, NewConnectionError)
+
+
+# 同步和异步客户端共用的连接统计
+connection_stats = _ConnectionStats()
+
+
+class SOARRequestPolicy:
+    """SOAR请求的超时和重试策略
+
+    1. 连接超时SOAR_CONNECT_TIMEOUT，读取超时SOAR_API_TIMEOUT
+    2. 连接未建立的请求一定没有发送到SOAR，任何请求都可以重试
+    3. 查询类的GET请求在超时、连接中断或SOAR返回429/502/503/504时重试；
+       启动剧本的POST请求可能已被SOAR执行，只在连接未建立时重试，避免重复启动剧本
+    4. 最多重试SOAR_REQUEST_RETRIES次，第n次重试前等待 SOAR_REQUEST_RETRY_BACKOFF * 2^n 秒
+    """
+
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self):
+        self.connect_timeout = config.SOAR_CONNECT_TIMEOUT
+        self.read_timeout = config.SOAR_API_TIMEOUT
+        self.retries = max(config.SOAR_REQUEST_RETRIES, 0)
+        self.backoff = config.SOAR_REQUEST_RETRY_BACKOFF
+
+    def should_retry(self, method: str, attempt: int, status: Optional[int] = None, connected: bool = True) -> bool:
+        """
+        判断请求是否需要重试
+        :param method: 请求方法
+        :param attempt: 已重试次数
+        :param status: SOAR返回的状态码，请求异常时为None
+        :param connected: 连接是否已建立（请求可能已发送到SOAR）
+        :return: 是否重试
+        """
+        if attempt >= self.retries:
+            return False
+        if not connected:
+            return True
+        if method.upper() != 'GET':
+            return False
+        return status is None or status in self.RETRY_STATUSES
+
+    def retry_delay(self, attempt: int) -> float:
+        """第attempt次重试前的等待时间(秒)"""
+        return self.backoff * (2 ** attempt)
+
+    def record_retry(self, method: str, reason):
+        metrics.inc('soar_http_retries', method=method.upper())
+        logger.warning(f"SOAR请求失败，准备重试: {method.upper()} {reason}")
+
+
+def execution_payload(playbook_id, params: Dict[str, Any]) -> Dict[str, Any]:
+    """构造启动剧本的请求体"""
+    return {
+        "eventId": 0,  # 固定值，特殊含义
+        "executorInstanceId": playbook_id,
+        "executorInstanceType": "PLAYBOOK",
+        "params": [{"key": k, "value": v} for k, v in params.items()]
+    }
+
+
+class _PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+
+def create_session() -> requests.Session:
+    """创建带连接池的会话"""
+    session = requests.Session()
+    adapter = _PooledAdapter(pool_connections=config.SOAR_POOL_CONNECTIONS,
+                             pool_maxsize=config.SOAR_POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class SOARClient:
+    def __init__(self, session: Optional[requests.Session] = None, policy: Optional[SOARRequestPolicy] = None):
         self.base_url = config.SOAR_API_URL
         self.headers = {
             'hg-token': config.SOAR_API_TOKEN,  # 修改为正确的token头
             'Content-Type': 'application/json'
         }
-        self.timeout = config.SOAR_API_TIMEOUT
+        self.policy = policy or SOARRequestPolicy()
+        # (连接超时, 读取超时)
+        self.timeout = (self.policy.connect_timeout, self.policy.read_timeout)
         self.retry_count = config.SOAR_RETRY_COUNT
         self.retry_delay = config.SOAR_RETRY_DELAY
         self.verify_ssl = config.SOAR_VERIFY_SSL
+        self.session = session or create_session()
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """通过共享会话发送请求，按SOARRequestPolicy重试"""
+        attempt = 0
+        while True:
+            connection_stats.request()
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    headers=self.headers,
+                    timeout=self.timeout,
+                    verify=self.verify_ssl,
+                    **kwargs
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not self.policy.should_retry(method, attempt, connected=_connection_established(e)):
+                    raise
+                self.policy.record_retry(method, e)
+            else:
+                if response.ok or not self.policy.should_retry(method, attempt, status=response.status_code):
+                    response.raise_for_status()
+                    return response
+                self.policy.record_retry(method, f"HTTP {response.status_code}")
+            time.sleep(self.policy.retry_delay(attempt))
+            attempt += 1
+
+    def close(self):
+        """关闭会话，释放连接池中的连接"""
+        self.session.close()
 
     def execute_playbook(self, playbook_id: int, params: Dict[str, Any]) -> Optional[str]:
         """
@@ -28,26 +220,14 @@ class SOARClient:
         url = f"{self.base_url}/api/event/execution"
         
         # 构造正确的请求体
-        payload = {
-            "eventId": 0,  # 固定值，特殊含义
-            "executorInstanceId": playbook_id,
-            "executorInstanceType": "PLAYBOOK",
-            "params": [{"key": k, "value": v} for k, v in params.items()]
-        }
+        payload = execution_payload(playbook_id, params)
 
         logger.info(f"执行剧本: {playbook_id}, 参数: {params}")
         logger.debug(f"请求URL: {url}")
         logger.debug(f"请求体: {payload}")
 
         try:
-            response = requests.post(
-                url,
-                json=payload,
-                headers=self.headers,
-                timeout=self.timeout,
-                verify=self.verify_ssl
-            )
-            response.raise_for_status()
+            response = self._request('POST', url, json=payload)
             result = response.json().get('result')
             logger.info(f"剧本执行成功，活动ID: {result}")
             return result
@@ -63,13 +243,7 @@ class SOARClient:
         """
         url = f"{self.base_url}/odp/core/v1/api/activity/{activity_id}"
         try:
-            response = requests.get(
-                url,
-                headers=self.headers,
-                timeout=self.timeout,
-                verify=self.verify_ssl
-            )
-            response.raise_for_status()
+            response = self._request('GET', url)
             return response.json().get('result')
         except Exception as e:
             logger.error(f"获取剧本状态失败: {str(e)}")
@@ -84,14 +258,7 @@ class SOARClient:
         url = f"{self.base_url}/odp/core/v1/api/event/activity"
         params = {'activityId': activity_id}
         try:
-            response = requests.get(
-                url,
-                headers=self.headers,
-                params=params,
-                timeout=self.timeout,
-                verify=self.verify_ssl
-            )
-            response.raise_for_status()
+            response = self._request('GET', url, params=params)
             return response.json().get('result')
         except Exception as e:
             logger.error(f"获取剧本结果失败: {str(e)}")
@@ -105,11 +272,28 @@ class SOARClient:
         :return: 最终结果
         """
         for _ in range(self.retry_count):
-            status = self.get_playbook_status(activity_id)
-            if status and status.get('executeStatus') == 'SUCCESS':
+            execute_status = get_execute_status(self.get_playbook_status(activity_id))
+            if execute_status in SUCCESS_STATUSES:
                 result = self.get_playbook_result(activity_id)
                 # logger.info(f"剧本执行完成，结果: {result}")
                 return result
+            if execute_status in FAILED_STATUSES:
+                logger.warning(f"剧本执行失败: {activity_id}, 状态: {execute_status}")
+                return None
             time.sleep(interval)
         logger.warning(f"剧本执行超时: {activity_id}")
-        return None 
\ No newline at end of file
+        return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_soar_client() -> SOARClient:
+    """获取进程内共享的SOARClient"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SOARClient()
+    return _client
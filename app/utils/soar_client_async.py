@@ -0,0 +1,146 @@
+"""基于asyncio的SOAR API客户端
+
+接口与SOARClient一致，用于在一个事件循环中同时启动、跟踪大量剧本（EXECUTOR_MODE=async），
+不需要为每个并发请求占用一个线程：
+1. 超时和重试使用与SOARClient相同的SOARRequestPolicy
+2. 每个主机最多保持SOAR_POOL_MAXSIZE个长连接，请求数和新建连接数与同步客户端记录在相同的指标中
+3. aiohttp.ClientSession绑定创建它的事件循环，客户端只能在同一个事件循环中使用
+"""
+import asyncio
+import time
+import logging
+from typing import Optional, Dict, Any
+import aiohttp
+from app.config import config
+from app.utils.metrics import metrics
+from app.utils.soar_client import (SOARRequestPolicy, connection_stats, execution_payload, get_execute_status,
+                                   SUCCESS_STATUSES, FAILED_STATUSES)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSOARClient:
+    def __init__(self, policy: Optional[SOARRequestPolicy] = None):
+        self.base_url = config.SOAR_API_URL
+        self.headers = {
+            'hg-token': config.SOAR_API_TOKEN,
+            'Content-Type': 'application/json'
+        }
+        self.policy = policy or SOARRequestPolicy()
+        self.timeout = aiohttp.ClientTimeout(sock_connect=self.policy.connect_timeout,
+                                             sock_read=self.policy.read_timeout)
+        self.verify_ssl = config.SOAR_VERIFY_SSL
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self._on_connection_created)
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=config.SOAR_POOL_MAXSIZE,
+                                             ssl=None if self.verify_ssl else False)
+            self._session = aiohttp.ClientSession(headers=self.headers, timeout=self.timeout,
+                                                  connector=connector, trace_configs=[trace_config])
+        return self._session
+
+    @staticmethod
+    async def _on_connection_created(session, context, params):
+        connection_stats.opened()
+
+    async def _request(self, method: str, url: str, **kwargs) -> Any:
+        """发送请求并返回响应中的result字段，按SOARRequestPolicy重试"""
+        session = self._get_session()
+        attempt = 0
+        while True:
+            connection_stats.request()
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    if response.status < 400:
+                        return (await response.json(content_type=None)).get('result')
+                    if not self.policy.should_retry(method, attempt, status=response.status):
+                        response.raise_for_status()
+                    self.policy.record_retry(method, f"HTTP {response.status}")
+            except aiohttp.ClientConnectorError as e:
+                # 连接未建立，请求一定没有发送到SOAR
+                if not self.policy.should_retry(method, attempt, connected=False):
+                    raise
+                self.policy.record_retry(method, e)
+            except aiohttp.ClientResponseError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not self.policy.should_retry(method, attempt):
+                    raise
+                self.policy.record_retry(method, e)
+            await asyncio.sleep(self.policy.retry_delay(attempt))
+            attempt += 1
+
+    async def close(self):
+        """关闭会话，释放连接池中的连接"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def execute_playbook(self, playbook_id: int, params: Dict[str, Any]) -> Optional[str]:
+        """
+        执行SOAR剧本
+        :param playbook_id: 剧本ID
+        :param params: 剧本参数
+        :return: 活动ID
+        """
+        url = f"{self.base_url}/api/event/execution"
+        logger.info(f"执行剧本: {playbook_id}, 参数: {params}")
+        try:
+            result = await self._request('POST', url, json=execution_payload(playbook_id, params))
+            logger.info(f"剧本执行成功，活动ID: {result}")
+            return result
+        except Exception as e:
+            logger.error(f"剧本执行失败: {str(e)}")
+            return None
+
+    async def get_playbook_status(self, activity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取剧本执行状态
+        :param activity_id: 活动ID
+        :return: 状态信息
+        """
+        url = f"{self.base_url}/odp/core/v1/api/activity/{activity_id}"
+        try:
+            return await self._request('GET', url)
+        except Exception as e:
+            logger.error(f"获取剧本状态失败: {str(e)}")
+            return None
+
+    async def get_playbook_result(self, activity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取剧本执行结果
+        :param activity_id: 活动ID
+        :return: 执行结果
+        """
+        url = f"{self.base_url}/odp/core/v1/api/event/activity"
+        try:
+            return await self._request('GET', url, params={'activityId': activity_id})
+        except Exception as e:
+            logger.error(f"获取剧本结果失败: {str(e)}")
+            return None
+
+    async def wait_for_completion(self, activity_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        等待剧本执行完成，轮询间隔从SOAR_POLL_MIN_INTERVAL开始按SOAR_POLL_BACKOFF指数退避
+        :param activity_id: 活动ID
+        :param timeout: 超时时间(秒)，默认SOAR_ACTIVITY_TIMEOUT
+        :return: 最终结果，超时为None
+        """
+        deadline = time.monotonic() + (config.SOAR_ACTIVITY_TIMEOUT if timeout is None else timeout)
+        interval = config.SOAR_POLL_MIN_INTERVAL
+        while True:
+            metrics.inc('soar_status_requests')
+            execute_status = get_execute_status(await self.get_playbook_status(activity_id))
+            if execute_status in SUCCESS_STATUSES:
+                return await self.get_playbook_result(activity_id)
+            if execute_status in FAILED_STATUSES:
+                logger.warning(f"剧本执行失败: {activity_id}, 状态: {execute_status}")
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"剧本执行超时: {activity_id}")
+                return None
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * config.SOAR_POLL_BACKOFF, config.SOAR_POLL_MAX_INTERVAL)
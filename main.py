@@ -63,6 +63,10 @@ app.register_blueprint(event_bp, url_prefix='/api/event')
 from app.controllers.auth_controller import auth_bp
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 
+# 导入SOAR回调路由
+from app.controllers.soar_controller import soar_bp
+app.register_blueprint(soar_bp, url_prefix='/api/soar')
+
 # 导入WebSocket事件处理
 from app.controllers.socket_controller import register_socket_events
 register_socket_events(socketio)
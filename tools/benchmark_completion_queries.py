@@ -0,0 +1,170 @@
+"""完成状态检测查询性能对比工具
+
+功能描述：
+    在一个合成的SQLite数据库上（默认10万条执行记录），对比_expert完成状态检测的两种实现：
+    1. 原有实现：逐个processing命令/任务/事件查询其子记录（N+1查询）
+    2. 当前实现：expert_service中基于GROUP BY/HAVING的集合查询
+    同时校验两种实现返回的结果一致。
+
+执行方法（在项目根目录下）：
+    python tools/benchmark_completion_queries.py
+    python tools/benchmark_completion_queries.py --executions 200000 --repeat 5
+
+参数说明：
+    --executions  合成的执行记录数量，默认100000
+    --repeat      每种实现重复执行的次数，取平均值，默认3
+    --db          合成数据库文件路径，默认在临时目录中创建
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from app.models.models import db, Event, Task, Command, Execution
+
+# 每个事件4个任务，每个任务5个命令，每个命令10个执行
+TASKS_PER_EVENT = 4
+COMMANDS_PER_TASK = 5
+EXECUTIONS_PER_COMMAND = 10
+
+
+def build_dataset(execution_count):
+    """生成合成数据：大部分命令处于processing状态，执行状态随机分布"""
+    rng = random.Random(42)
+    event_count = max(execution_count // (TASKS_PER_EVENT * COMMANDS_PER_TASK * EXECUTIONS_PER_COMMAND), 1)
+
+    events, tasks, commands, executions = [], [], [], []
+    for e in range(event_count):
+        event_id = f"event-{e}"
+        # 约20%的事件当前轮次已全部完成
+        event_done = rng.random() < 0.2
+        events.append({'event_id': event_id, 'status': 'processing', 'current_round': 1, 'message': 'benchmark'})
+        for t in range(TASKS_PER_EVENT):
+            task_id = f"{event_id}-task-{t}"
+            task_done = event_done or rng.random() < 0.5
+            tasks.append({'task_id': task_id, 'event_id': event_id, 'round_id': 1,
+                          'task_status': 'completed' if event_done else 'processing'})
+            for c in range(COMMANDS_PER_TASK):
+                command_id = f"{task_id}-command-{c}"
+                command_done = task_done or rng.random() < 0.3
+                commands.append({'command_id': command_id, 'task_id': task_id, 'event_id': event_id,
+                                 'round_id': 1, 'command_status': 'completed' if task_done else 'processing'})
+                for x in range(EXECUTIONS_PER_COMMAND):
+                    if command_done:
+                        status = rng.choice(['summarized', 'summarized', 'failed'])
+                    else:
+                        status = rng.choice(['summarized', 'completed', 'processing'])
+                    executions.append({'execution_id': f"{command_id}-execution-{x}", 'command_id': command_id,
+                                       'task_id': task_id, 'event_id': event_id, 'round_id': 1,
+                                       'execution_status': status})
+
+    db.session.execute(Event.__table__.insert(), events)
+    db.session.execute(Task.__table__.insert(), tasks)
+    db.session.execute(Command.__table__.insert(), commands)
+    db.session.execute(Execution.__table__.insert(), executions)
+    db.session.commit()
+    return len(events), len(tasks), len(commands), len(executions)
+
+
+def legacy_commands_with_completed_executions():
+    result = []
+    for command in Command.query.filter_by(command_status='processing').all():
+        executions = Execution.query.filter_by(command_id=command.command_id).all()
+        if executions and all(x.execution_status in ['summarized', 'failed'] for x in executions):
+            result.append(command)
+    return result
+
+
+def legacy_tasks_with_completed_commands():
+    result = []
+    for task in Task.query.filter_by(task_status='processing').all():
+        commands = Command.query.filter_by(task_id=task.task_id).all()
+        if commands and all(c.command_status in ['completed', 'failed'] for c in commands):
+            result.append(task)
+    return result
+
+
+def legacy_event_rounds_with_completed_tasks():
+    result = []
+    for event in Event.query.filter_by(status='processing').all():
+        current_round = event.current_round or 1
+        tasks = Task.query.filter_by(event_id=event.event_id, round_id=current_round).all()
+        if not tasks or any(t.task_status not in ['completed', 'failed'] for t in tasks):
+            continue
+        executions = Execution.query.filter_by(event_id=event.event_id, round_id=current_round).all()
+        if all(x.execution_status in ['summarized', 'failed'] for x in executions):
+            result.append((event.event_id, current_round))
+    return result
+
+
+def measure(func, repeat):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        db.session.expire_all()
+        started = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - started)
+    return sum(durations) / len(durations), result
+
+
+def normalize(result):
+    return sorted(getattr(item, 'command_id', None) or getattr(item, 'task_id', None) or item for item in result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='完成状态检测查询性能对比')
+    parser.add_argument('--executions', type=int, default=100000, help='合成的执行记录数量')
+    parser.add_argument('--repeat', type=int, default=3, help='每种实现重复执行的次数')
+    parser.add_argument('--db', type=str, default=None, help='合成数据库文件路径')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='deepsoc-bench-'), 'bench.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    db.init_app(app)
+
+    # 导入expert_service需要完整的依赖
+    from app.services.expert_service import (
+        get_commands_with_completed_executions,
+        get_tasks_with_completed_commands,
+        get_event_rounds_with_completed_tasks,
+    )
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        counts = build_dataset(args.executions)
+        print(f"合成数据: 事件 {counts[0]}，任务 {counts[1]}，命令 {counts[2]}，执行 {counts[3]}"
+              f"（耗时 {time.perf_counter() - started:.1f}s，数据库: {db_path}）")
+        print()
+        print(f"{'查询':<44}{'原有实现(s)':>14}{'集合查询(s)':>14}{'加速比':>10}{'结果数':>10}")
+
+        cases = [
+            ('get_commands_with_completed_executions', legacy_commands_with_completed_executions,
+             get_commands_with_completed_executions),
+            ('get_tasks_with_completed_commands', legacy_tasks_with_completed_commands,
+             get_tasks_with_completed_commands),
+            ('get_event_rounds_with_completed_tasks', legacy_event_rounds_with_completed_tasks,
+             get_event_rounds_with_completed_tasks),
+        ]
+        for name, legacy, current in cases:
+            legacy_time, legacy_result = measure(legacy, args.repeat)
+            current_time, current_result = measure(current, args.repeat)
+            if normalize(legacy_result) != normalize(current_result):
+                print(f"错误: {name} 两种实现的结果不一致")
+                sys.exit(1)
+            speedup = legacy_time / current_time if current_time else float('inf')
+            print(f"{name:<44}{legacy_time:>14.3f}{current_time:>14.3f}{speedup:>9.1f}x{len(current_result):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""_executor吞吐量压测工具
+
+功能描述：
+    在临时SQLite数据库中生成一批待执行的剧本命令，启动_executor（run_executor）执行，
+    SOAR接口由tools/soar_mock_server.py模拟（默认在本进程中启动，也可以指定已启动的模拟服务），
+    全部命令结束后输出：
+    1. 总耗时、吞吐量(命令/秒)、命令从创建到结束的延迟p50/p95/max
+    2. 命令成功/失败数，命中结果缓存、复用相同调用的执行记录数
+    3. SOAR各接口的请求数，平均每个命令的状态查询次数
+
+    剧本从app/prompts/background_soar_playbooks.md中选择，必填参数按参数名生成
+    （IP类参数从--targets个不同的IP中随机选择，用于模拟告警风暴中重复的目标）。
+
+执行方法（在项目根目录下）：
+    python tools/benchmark_executor.py
+    python tools/benchmark_executor.py --commands 500 --events 50 --mode async --time-scale 0.05
+    python tools/benchmark_executor.py --playbooks block_ip_by_firewall_internet,query_asset_info_by_ip --targets 20
+    python tools/benchmark_executor.py --soar-url http://127.0.0.1:9000
+
+参数说明：
+    --commands       生成的剧本命令数，默认200
+    --events         命令分布的事件数，默认20
+    --playbooks      使用的剧本名称或ID，逗号分隔，默认使用目录中的所有剧本
+    --targets        IP类参数的不同取值数量，默认1000
+    --mode           执行方式 thread / async，默认使用配置EXECUTOR_MODE
+    --workers        工作线程数，默认使用配置EXECUTOR_WORKERS
+    --max-activities 同时执行中的剧本命令数上限，默认使用配置EXECUTOR_MAX_ACTIVITIES
+    --soar-url       已启动的SOAR模拟服务地址，不指定时在本进程中启动
+    --profile        模拟服务的剧本配置文件（见soar_mock_server.py）
+    --time-scale     模拟服务的耗时缩放比例，默认0.1
+    --timeout        等待全部命令结束的最长时间(秒)，默认600
+    --seed           随机数种子，默认42
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_params(playbook, index, rng, targets):
+    """按参数名生成剧本的必填参数"""
+    params = {}
+    for spec in playbook.get('params') or []:
+        if not spec.get('required'):
+            continue
+        name = spec['name']
+        lowered = name.lower()
+        if lowered in ('src', 'dst') or 'ip' in lowered:
+            n = rng.randrange(targets)
+            params[name] = f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}"
+        elif 'email' in lowered:
+            params[name] = f"user{rng.randrange(targets)}@example.com"
+        else:
+            params[name] = f"{name}-{index}"
+    return params
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='_executor吞吐量压测')
+    parser.add_argument('--commands', type=int, default=200, help='生成的剧本命令数')
+    parser.add_argument('--events', type=int, default=20, help='命令分布的事件数')
+    parser.add_argument('--playbooks', type=str, default=None, help='使用的剧本名称或ID，逗号分隔')
+    parser.add_argument('--targets', type=int, default=1000, help='IP类参数的不同取值数量')
+    parser.add_argument('--mode', type=str, default=None, choices=['thread', 'async'], help='执行方式')
+    parser.add_argument('--workers', type=int, default=None, help='工作线程数')
+    parser.add_argument('--max-activities', type=int, default=None, help='同时执行中的剧本命令数上限')
+    parser.add_argument('--soar-url', type=str, default=None, help='已启动的SOAR模拟服务地址')
+    parser.add_argument('--profile', type=str, default=None, help='模拟服务的剧本配置文件')
+    parser.add_argument('--time-scale', type=float, default=0.1, help='模拟服务的耗时缩放比例')
+    parser.add_argument('--timeout', type=float, default=600, help='等待全部命令结束的最长时间(秒)')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+    args = parser.parse_args()
+
+    from tools.soar_mock_server import MockSOAR, load_profile, start_in_thread
+
+    mock = None
+    soar_url = args.soar_url
+    if not soar_url:
+        mock = MockSOAR(load_profile(args.profile), args.time_scale, seed=args.seed)
+        soar_url = start_in_thread(mock)
+
+    # 配置在导入app时从环境变量读取，需要先设置
+    db_path = os.path.join(tempfile.mkdtemp(prefix='deepsoc-executor-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+    os.environ['SOAR_API_URL'] = soar_url
+    if args.mode:
+        os.environ['EXECUTOR_MODE'] = args.mode
+    if args.workers:
+        os.environ['EXECUTOR_WORKERS'] = str(args.workers)
+    if args.max_activities:
+        os.environ['EXECUTOR_MAX_ACTIVITIES'] = str(args.max_activities)
+
+    from main import app
+    from app.config import config
+    from app.models import db, Command, Execution
+    from app.services.playbook_registry import load_catalog
+    from app.services.executor_service import run_executor
+
+    # 只输出错误日志，避免压测结果被淹没
+    logging.disable(logging.WARNING)
+
+    catalog = load_catalog()
+    if args.playbooks:
+        wanted = {p.strip() for p in args.playbooks.split(',') if p.strip()}
+        playbooks = [p for pid, p in catalog.items() if pid in wanted or str(p.get('name', '')).strip() in wanted]
+    else:
+        playbooks = list(catalog.values())
+    if not playbooks:
+        print("错误: 没有可用的剧本")
+        sys.exit(1)
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        db.create_all()
+        for i in range(args.commands):
+            playbook = rng.choice(playbooks)
+            db.session.add(Command(
+                command_id=f"bench-command-{i}",
+                event_id=f"bench-event-{i % max(args.events, 1)}",
+                round_id=1,
+                command_type='playbook',
+                command_name=playbook.get('name'),
+                command_entity={'playbook_id': str(playbook['id'])},
+                command_params=build_params(playbook, i, rng, args.targets),
+                command_status='pending'
+            ))
+        db.session.commit()
+
+        print(f"SOAR: {soar_url}，数据库: {db_path}")
+        print(f"命令 {args.commands}，事件 {args.events}，剧本 {len(playbooks)}，执行方式 {config.EXECUTOR_MODE}，"
+              f"工作线程 {config.EXECUTOR_WORKERS}，同时执行上限 {config.EXECUTOR_MAX_ACTIVITIES}")
+
+        started = time.perf_counter()
+        threading.Thread(target=run_executor, name='executor', daemon=True).start()
+        remaining = args.commands
+        while time.perf_counter() - started < args.timeout:
+            time.sleep(0.5)
+            db.session.expire_all()
+            remaining = Command.query.filter(Command.command_status.in_(['pending', 'processing'])).count()
+            if remaining == 0:
+                break
+        elapsed = time.perf_counter() - started
+
+        commands = Command.query.all()
+        finished = [c for c in commands if c.command_status in ('completed', 'failed')]
+        latencies = [(c.updated_at - c.created_at).total_seconds() for c in finished if c.updated_at and c.created_at]
+        executions = Execution.query.all()
+
+        print()
+        print(f"总耗时 {elapsed:.1f}s，吞吐量 {len(finished) / elapsed:.1f} 命令/秒" +
+              (f"，超时未结束 {remaining} 个" if remaining else ""))
+        print(f"命令延迟 p50 {percentile(latencies, 0.5):.2f}s，p95 {percentile(latencies, 0.95):.2f}s，"
+              f"max {max(latencies, default=0):.2f}s")
+        print(f"成功 {sum(c.command_status == 'completed' for c in commands)}，"
+              f"失败 {sum(c.command_status == 'failed' for c in commands)}，"
+              f"缓存结果 {sum(bool(e.cached) for e in executions)}，"
+              f"复用相同调用 {sum(e.dedup_of is not None for e in executions)}")
+
+        if mock:
+            stats = mock.stats()
+            requests_count = stats['requests']
+            print(f"SOAR请求: 启动 {requests_count['execute']}，状态查询 {requests_count['status']}，"
+                  f"结果 {requests_count['result']}，503 {requests_count['errors']}；"
+                  f"平均每个活动状态查询 {requests_count['status'] / max(stats['activities'], 1):.1f} 次")
+
+
+if __name__ == '__main__':
+    main()
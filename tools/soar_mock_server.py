@@ -0,0 +1,276 @@
+"""SOAR API模拟服务
+
+功能描述：
+    在本地模拟SOARClient使用的三个SOAR接口，用于在不访问生产SOAR的情况下压测_executor：
+    1. POST /api/event/execution                 启动剧本，返回活动ID
+    2. GET  /odp/core/v1/api/activity/{id}        查询活动状态（RUNNING / SUCCESS / FAILED）
+    3. GET  /odp/core/v1/api/event/activity       查询活动结果（参数activityId）
+    另外提供 GET /mock/stats 返回各接口的请求数和活动统计，POST /mock/reset 清空统计。
+
+    剧本ID和名称来自app/prompts/background_soar_playbooks.md，不在目录中的剧本启动失败。
+    每个剧本的执行耗时分布、失败率和结果大小可以通过配置文件设置（yaml或json），例如：
+
+        default:
+          latency: {dist: lognormal, p50: 3, p90: 10}   # 执行耗时(秒)
+          failure_rate: 0.02                           # 活动执行失败（状态为FAILED）的比例
+          error_rate: 0.0                              # 接口返回503的比例
+          payload_bytes: 2048                          # 执行结果的大小
+        playbooks:
+          query_asset_info_by_ip:                      # 剧本名称或剧本ID
+            latency: {dist: uniform, min: 0.5, max: 2}
+          block_ip_by_firewall_internet:
+            latency: {dist: fixed, value: 8}
+            failure_rate: 0.05
+
+    耗时分布支持 fixed(value)、uniform(min, max)、lognormal(p50, p90)。
+    未提供配置文件时，查询类剧本约1秒、处置类剧本约5秒、调查类剧本约30秒。
+    执行失败（状态为FAILED）的活动在下一次查询状态时结束，命令和动作记为失败。
+
+执行方法（在项目根目录下）：
+    python tools/soar_mock_server.py
+    python tools/soar_mock_server.py --port 9000 --profile soar_profile.yaml --time-scale 0.1
+    然后在.env中设置 SOAR_API_URL=http://127.0.0.1:9000 启动_executor，
+    或使用 tools/benchmark_executor.py 直接压测
+
+参数说明：
+    --host         监听地址，默认127.0.0.1
+    --port         监听端口，默认9000
+    --profile      剧本耗时、失败率、结果大小配置文件
+    --time-scale   耗时缩放比例，例如0.1表示所有剧本耗时缩短为十分之一，默认1
+    --api-latency  每个接口请求的额外延迟(毫秒)，模拟网络延迟，默认0
+    --seed         随机数种子
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import itertools
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml
+from flask import Flask, request, jsonify
+from app.services.playbook_registry import load_catalog
+
+# 未提供配置文件时按剧本名称关键字区分的默认耗时
+DEFAULT_PROFILE = {
+    'default': {
+        'latency': {'dist': 'lognormal', 'p50': 5, 'p90': 15},
+        'failure_rate': 0.0,
+        'error_rate': 0.0,
+        'payload_bytes': 2048,
+    },
+    'keywords': {
+        'query': {'latency': {'dist': 'lognormal', 'p50': 1, 'p90': 3}},
+        'investigation': {'latency': {'dist': 'lognormal', 'p50': 30, 'p90': 90}, 'payload_bytes': 16384},
+    },
+}
+
+
+class Sampler:
+    """剧本执行耗时分布"""
+
+    def __init__(self, spec, rng):
+        self.spec = spec or {'dist': 'fixed', 'value': 1}
+        self.rng = rng
+
+    def sample(self):
+        dist = self.spec.get('dist', 'fixed')
+        if dist == 'uniform':
+            return self.rng.uniform(float(self.spec['min']), float(self.spec['max']))
+        if dist == 'lognormal':
+            p50 = float(self.spec['p50'])
+            p90 = float(self.spec.get('p90', p50 * 2))
+            # p90 = p50 * exp(1.2816 * sigma)
+            sigma = max(math.log(p90 / p50) / 1.2816, 0)
+            return self.rng.lognormvariate(math.log(p50), sigma)
+        return float(self.spec.get('value', 1))
+
+
+class MockSOAR:
+    """模拟的SOAR状态：剧本配置和活动"""
+
+    def __init__(self, profile=None, time_scale=1.0, api_latency=0.0, seed=None):
+        self.catalog = load_catalog()
+        self.names = {str(p.get('name', '')).strip(): playbook_id for playbook_id, p in self.catalog.items()}
+        self.profile = profile or DEFAULT_PROFILE
+        self.time_scale = time_scale
+        self.api_latency = api_latency
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.activities = {}
+        self.requests = {'execute': 0, 'status': 0, 'result': 0, 'errors': 0}
+        self.settings = {playbook_id: self._settings(playbook_id) for playbook_id in self.catalog}
+
+    def _settings(self, playbook_id):
+        """合并默认配置、关键字配置和剧本配置"""
+        name = str(self.catalog[playbook_id].get('name', '')).strip()
+        settings = dict(self.profile.get('default') or {})
+        for keyword, values in (self.profile.get('keywords') or {}).items():
+            if keyword.lower() in name.lower():
+                settings.update(values)
+        for key, values in (self.profile.get('playbooks') or {}).items():
+            if str(key) == playbook_id or str(key) == name:
+                settings.update(values)
+        settings['sampler'] = Sampler(settings.get('latency'), self.rng)
+        return settings
+
+    def should_fail(self, rate):
+        with self.lock:
+            return self.rng.random() < float(rate or 0)
+
+    def start(self, playbook_id, params):
+        settings = self.settings[playbook_id]
+        with self.lock:
+            activity_id = f"mock-{next(self.ids)}"
+            duration = settings['sampler'].sample() * self.time_scale
+            failed = self.rng.random() < float(settings.get('failure_rate') or 0)
+            self.activities[activity_id] = {
+                'playbook_id': playbook_id,
+                'params': params,
+                'started': time.monotonic(),
+                'duration': duration,
+                'failed': failed,
+                'payload_bytes': int(settings.get('payload_bytes') or 0),
+            }
+        return activity_id
+
+    def status(self, activity):
+        if time.monotonic() - activity['started'] < activity['duration']:
+            return 'RUNNING'
+        return 'FAILED' if activity['failed'] else 'SUCCESS'
+
+    def stats(self):
+        with self.lock:
+            statuses = {}
+            for activity in self.activities.values():
+                status = self.status(activity)
+                statuses[status] = statuses.get(status, 0) + 1
+            return {'requests': dict(self.requests), 'activities': len(self.activities), 'statuses': statuses}
+
+    def reset(self):
+        with self.lock:
+            self.activities.clear()
+            self.requests = {key: 0 for key in self.requests}
+
+
+def create_app(mock):
+    """创建模拟SOAR的Flask应用"""
+    app = Flask(__name__)
+
+    def begin(endpoint):
+        if mock.api_latency:
+            time.sleep(mock.api_latency)
+        with mock.lock:
+            mock.requests[endpoint] += 1
+
+    def unavailable(playbook_id=None):
+        rate = mock.settings[playbook_id].get('error_rate') if playbook_id else mock.profile.get('default', {}).get('error_rate')
+        if mock.should_fail(rate):
+            with mock.lock:
+                mock.requests['errors'] += 1
+            return jsonify({'message': 'service unavailable'}), 503
+        return None
+
+    @app.route('/api/event/execution', methods=['POST'])
+    def execute():
+        begin('execute')
+        data = request.get_json(silent=True) or {}
+        playbook_id = str(data.get('executorInstanceId'))
+        if playbook_id not in mock.settings:
+            return jsonify({'result': None, 'message': f'剧本不存在: {playbook_id}'})
+        error = unavailable(playbook_id)
+        if error:
+            return error
+        params = {p.get('key'): p.get('value') for p in data.get('params') or []}
+        return jsonify({'result': mock.start(playbook_id, params)})
+
+    @app.route('/odp/core/v1/api/activity/<activity_id>', methods=['GET'])
+    def activity_status(activity_id):
+        begin('status')
+        activity = mock.activities.get(activity_id)
+        if not activity:
+            return jsonify({'result': None, 'message': '活动不存在'}), 404
+        error = unavailable(activity['playbook_id'])
+        if error:
+            return error
+        return jsonify({'result': {'activityId': activity_id, 'executeStatus': mock.status(activity)}})
+
+    @app.route('/odp/core/v1/api/event/activity', methods=['GET'])
+    def activity_result():
+        begin('result')
+        activity_id = request.args.get('activityId')
+        activity = mock.activities.get(activity_id)
+        if not activity:
+            return jsonify({'result': None, 'message': '活动不存在'}), 404
+        error = unavailable(activity['playbook_id'])
+        if error:
+            return error
+        playbook = mock.catalog[activity['playbook_id']]
+        return jsonify({'result': {
+            'activityId': activity_id,
+            'playbook': playbook.get('name'),
+            'params': activity['params'],
+            'duration': round(activity['duration'], 3),
+            'data': 'x' * activity['payload_bytes'],
+        }})
+
+    @app.route('/mock/stats', methods=['GET'])
+    def stats():
+        return jsonify(mock.stats())
+
+    @app.route('/mock/reset', methods=['POST'])
+    def reset():
+        mock.reset()
+        return jsonify({'result': 'ok'})
+
+    return app
+
+
+def load_profile(path):
+    """读取剧本配置文件（yaml或json）"""
+    if not path:
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        return yaml.safe_load(f)
+
+
+def start_in_thread(mock, host='127.0.0.1', port=0):
+    """在后台线程中启动模拟服务，返回服务地址"""
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, create_app(mock), threaded=True)
+    threading.Thread(target=server.serve_forever, name='soar-mock', daemon=True).start()
+    return f"http://{host}:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SOAR API模拟服务')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=9000, help='监听端口')
+    parser.add_argument('--profile', type=str, default=None, help='剧本耗时、失败率、结果大小配置文件')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='耗时缩放比例')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='每个接口请求的额外延迟(毫秒)')
+    parser.add_argument('--seed', type=int, default=None, help='随机数种子')
+    args = parser.parse_args()
+
+    mock = MockSOAR(load_profile(args.profile), args.time_scale, args.api_latency / 1000, args.seed)
+    print(f"已加载 {len(mock.catalog)} 个剧本，监听 http://{args.host}:{args.port}")
+    for playbook_id, settings in mock.settings.items():
+        print(f"  {playbook_id} {mock.catalog[playbook_id].get('name')}: 耗时 {settings.get('latency')}，"
+              f"失败率 {settings.get('failure_rate', 0)}，结果 {settings.get('payload_bytes', 0)} 字节")
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    create_app(mock).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()